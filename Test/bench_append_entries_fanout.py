@@ -0,0 +1,81 @@
+""" Benchmark: the Leader's CPU time to make and serialize the append_entries requests of a batch of new entries
+    for all its followers, for 3, 5 and 7 replicas and several batch sizes,
+    and when the requests of a lagging follower (a full request of config.raft_max_append_entries entries)
+    are sent again several times (retries after a failed RPC).
+
+    "copy" builds every request as before the cache of encoded entries: a raft_pb2.AE_Request per follower,
+    whose entries are copied from the log, then serialized (by gRPC) for every follower and every retry.
+    "cache" is RaftServiceServicer.make_append_entries_request(): the entries are encoded once,
+    and every request is assembled by concatenation.
+    The Leader runs in this process (without persistence).  Run with:
+        python3 bench_append_entries_fanout.py
+"""
+import time
+import queue
+import logging
+import sys
+sys.path.append('../')
+import config
+import raft
+import raft_pb2
+
+logging.disable(logging.CRITICAL)
+
+N_ROUNDS = 200
+COMMAND = '{"op": "bid", "buyer": "buyer-17", "auction": 42, "price": 1250}'
+
+
+""" The append_entries request of follower [id] as it was built before: a raft_pb2.AE_Request holding copies of the entries """
+def make_copied_request(leader, id):
+    request = raft_pb2.AE_Request(term=leader.current_term, leader_id=leader.my_id,
+                                  prev_log_index=leader.next_index[id] - 1, leader_commit=leader.commit_index)
+    request.prev_log_term = leader.get_term(request.prev_log_index)
+    last_index = min(leader.get_last_index(), request.prev_log_index + config.raft_max_append_entries)
+    for index in range(leader.next_index[id], last_index + 1):
+        request.entries.append(leader.get_entry(index))
+    return request
+
+
+def make_leader(n_replicas):
+    replicas = [config.ServerInfo(i, "127.0.0.1", str(20000 + 10*i), str(30000 + 10*i)) for i in range(n_replicas)]
+    leader = raft.RaftServiceServicer(replicas, 0, queue.Queue(), need_persistent=False)
+    leader.current_term = 1
+    with leader.lock:
+        leader.state = raft.Candidate
+    leader.convert_to_leader()
+    return leader
+
+
+def append(leader, n_entries):
+    for i in range(n_entries):
+        leader.logs.append(raft_pb2.LogEntry(term=leader.current_term, index=leader.get_last_index() + 1,
+                                             command=raft_pb2.Command(json=COMMAND)))
+
+
+""" CPU time (seconds) per round, where each round appends [batch] entries and sends them to every follower
+    [1 + retries] times, with requests made by [make_request]
+"""
+def measure(make_request, n_replicas, batch, retries):
+    leader = make_leader(n_replicas)
+    elapsed = 0
+    for round in range(N_ROUNDS):
+        append(leader, batch)
+        start = time.process_time()
+        with leader.lock:
+            for id in range(1, n_replicas):
+                for k in range(1 + retries):
+                    make_request(leader, id).SerializeToString()    # (what gRPC sends)
+                leader.next_index[id] = leader.get_last_index() + 1
+        elapsed += time.process_time() - start
+    return elapsed / N_ROUNDS
+
+
+if __name__ == "__main__":
+    make_cached_request = raft.RaftServiceServicer.make_append_entries_request
+    print(f"CPU time (us) per batch of new entries, sent to every follower")
+    print(f"{'replicas':>8} | {'batch':>5} | {'retries':>7} | {'copy':>9} | {'cache':>9} | {'speedup':>7}")
+    for n_replicas in [3, 5, 7]:
+        for (batch, retries) in [(1, 0), (16, 0), (128, 0), (128, 3), (config.raft_max_append_entries, 3)]:
+            copy = measure(make_copied_request, n_replicas, batch, retries)
+            cache = measure(make_cached_request, n_replicas, batch, retries)
+            print(f"{n_replicas:>8} | {batch:>5} | {retries:>7} | {copy * 1e6:>9.0f} | {cache * 1e6:>9.0f} | {copy / cache:>6.1f}x")
@@ -0,0 +1,69 @@
+""" Benchmark: the CPU time a Follower spends in its append_entries handler, as a function of the size of its log,
+    for heartbeats (no entries) and for requests with one new entry,
+    without persistence and with a write-ahead log (in a temporary directory, config.raft_durability).
+
+    The Follower runs in this process and the requests are given to handle_append_entries() directly,
+    so the numbers do not include gRPC, nor the wait for the group commit.  Run with:
+        python3 bench_follower_append.py
+"""
+import time
+import queue
+import shutil
+import tempfile
+import logging
+import sys
+sys.path.append('../')
+import config
+import raft
+import raft_pb2
+from raft_storage import RaftStorage
+
+logging.disable(logging.CRITICAL)
+
+N_REQUESTS = 200
+
+
+""" A Follower whose log has [log_size] entries of term 1 (with a write-ahead log in [dirname] if not None) """
+def make_follower(log_size, dirname):
+    follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+    if dirname is not None:
+        follower.need_persistent = True
+        follower.storage = RaftStorage(dirname)
+    entries = [raft_pb2.LogEntry(term=1, index=i, command=raft_pb2.Command(json='{"op": "x"}'))
+               for i in range(1, log_size + 1)]
+    for k in range(0, log_size, 10000):
+        request = raft_pb2.AE_Request(term=1, leader_id=0, prev_log_index=k, prev_log_term=1 if k > 0 else 0,
+                                      entries=entries[k:k + 10000])
+        assert follower.handle_append_entries(request).success
+    return follower
+
+
+""" Return the mean CPU time (seconds) of one request, with [n_entries] new entries per request """
+def measure(log_size, n_entries, persistent):
+    dirname = tempfile.mkdtemp() if persistent else None
+    follower = make_follower(log_size, dirname)
+    requests = []
+    last_index = log_size
+    for i in range(N_REQUESTS):
+        entries = [raft_pb2.LogEntry(term=1, index=last_index + 1 + k, command=raft_pb2.Command(json='{"op": "x"}'))
+                   for k in range(n_entries)]
+        requests.append(raft_pb2.AE_Request(term=1, leader_id=0, prev_log_index=last_index, prev_log_term=1,
+                                            entries=entries, leader_commit=last_index))
+        last_index += n_entries
+    start = time.process_time()
+    for request in requests:
+        follower.handle_append_entries(request)
+    elapsed = time.process_time() - start
+    assert follower.get_last_index() == last_index
+    if dirname is not None:
+        follower.storage.close()
+        shutil.rmtree(dirname)
+    return elapsed / N_REQUESTS
+
+
+if __name__ == "__main__":
+    print(f"CPU time per append_entries request (us), durability = {config.raft_durability}")
+    print(f"{'log size':>9} | {'heartbeat':>10} {'1 entry':>10} | {'heartbeat + WAL':>15} {'1 entry + WAL':>14}")
+    for log_size in [1000, 10000, 100000, 1000000]:
+        results = [measure(log_size, n_entries, persistent) for persistent in [False, True] for n_entries in [0, 1]]
+        print(f"{log_size:>9} | {results[0] * 1e6:>10.1f} {results[1] * 1e6:>10.1f} | {results[2] * 1e6:>15.1f} {results[3] * 1e6:>14.1f}")
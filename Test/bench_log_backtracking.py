@@ -0,0 +1,77 @@
+""" Benchmark: how long the leader takes to catch up a follower whose log diverges from its own,
+    as a function of the divergence length, with and without the conflict term/index hints of AE_Response.
+
+    The leader and the follower are two RAFT instances in this process (without persistence);
+    append_entries requests and responses are passed between them directly, so the numbers are
+    round trips and CPU time, not network time.  Run with:
+        python3 bench_log_backtracking.py
+"""
+import time
+import queue
+import logging
+import sys
+sys.path.append('../')
+import config
+import raft
+import raft_pb2
+from raft_log import RaftLog
+
+logging.disable(logging.CRITICAL)
+
+COMMON = 100            # length of the common prefix of the two logs
+TERM_LENGTH = 10        # the follower's divergent entries change term every TERM_LENGTH entries
+
+
+def make_log(n_common, divergent_terms):
+    logs = RaftLog()
+    for i in range(n_common):
+        logs.append(raft_pb2.LogEntry(term=1, index=logs.last_index() + 1, command=raft_pb2.Command(json='{"op": "x"}')))
+    for term in divergent_terms:
+        logs.append(raft_pb2.LogEntry(term=term, index=logs.last_index() + 1, command=raft_pb2.Command(json='{"op": "x"}')))
+    return logs
+
+
+def catch_up(divergence, use_hints):
+    """ Return (round trips, seconds) until the follower's log matches the leader's """
+    leader = raft.RaftServiceServicer(config.replicas, 0, queue.Queue(), need_persistent=False)
+    follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+
+    # The follower has [divergence] entries from old terms that the leader never had
+    follower.logs = make_log(COMMON, [2 + i // TERM_LENGTH for i in range(divergence)])
+    follower.current_term = 2 + divergence // TERM_LENGTH
+    leader_term = follower.current_term + 1
+    leader.logs = make_log(COMMON, [leader_term] * divergence)
+    leader.current_term = leader_term
+    with leader.lock:
+        leader.state = raft.Candidate
+    leader.convert_to_leader()
+
+    round_trips = 0
+    start = time.perf_counter()
+    with leader.lock:
+        last_index = leader.get_last_index()
+    while True:
+        with leader.lock:
+            if leader.match_index[1] >= last_index:
+                break
+            epoch = leader.pipeline_epoch[1]
+            request = leader.make_append_entries_request(1)
+            leader.next_index[1] += len(request.entries)
+        response = follower.handle_append_entries(raft_pb2.AE_Request.FromString(request.SerializeToString()))
+        if not use_hints:
+            response.conflict_term = 0
+            response.conflict_index = 0
+        with leader.lock:
+            leader.handle_append_entries_response(1, request, epoch, response)
+        round_trips += 1
+    return round_trips, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    print(f"{'divergence':>10} | {'hints: round trips':>18} {'time (s)':>9} | {'no hints: round trips':>21} {'time (s)':>9}")
+    for divergence in [10, 100, 1000, 5000]:
+        hint_trips, hint_time = catch_up(divergence, use_hints=True)
+        naive_trips, naive_time = catch_up(divergence, use_hints=False)
+        print(f"{divergence:>10} | {hint_trips:>18} {hint_time:>9.3f} | {naive_trips:>21} {naive_time:>9.3f}")
+    print(f"(over a real network each round trip costs at least one RTT; "
+          f"before the per-follower replicators, one round trip per {config.leader_broadcast_interval} ms heartbeat)")
@@ -0,0 +1,85 @@
+""" Benchmark: the time the Leader spends (holding the lock) in update_commit_index() after an
+    append_entries response, when the followers are far behind (a large gap between commit_index
+    and the last index), for 3, 5 and 7 replicas.
+
+    "scan" is the former update_commit_index(): it walks N down from the last index to commit_index,
+    counting the match_index of the voters at each N.
+    "quorum" is the current one: the majority-th largest match_index.
+    The Leader runs in this process (without persistence).  Run with:
+        python3 bench_quorum_commit.py
+"""
+import time
+import queue
+import logging
+import sys
+sys.path.append('../')
+import config
+import raft
+import raft_pb2
+
+logging.disable(logging.CRITICAL)
+
+N_CALLS = 100
+
+
+""" The former update_commit_index() (without its side effects): return the new commit_index """
+def scan_commit_index(leader):
+    durable_index = leader.get_durable_index()
+    N = leader.get_last_index()
+    while (N > leader.commit_index):
+        if leader.get_term(N) == leader.current_term:
+            count = 0
+            for i in leader.voters:
+                if i == leader.my_id:
+                    count += 1 if durable_index >= N else 0
+                elif leader.match_index[i] >= N:
+                    count += 1
+            if count > leader.n_voters // 2:
+                return N
+        N -= 1
+    return leader.commit_index
+
+
+""" A Leader of [n_replicas] with [gap] entries that are not committed yet,
+    where the followers have stored about 1/4 of them: one ack moves the commit_index a little
+"""
+def make_leader(n_replicas, gap):
+    replicas = [config.ServerInfo(i, "127.0.0.1", str(20000 + 10*i), str(30000 + 10*i)) for i in range(n_replicas)]
+    leader = raft.RaftServiceServicer(replicas, 0, queue.Queue(), need_persistent=False)
+    leader.current_term = 1
+    with leader.lock:
+        leader.state = raft.Candidate
+    leader.convert_to_leader()
+    for i in range(gap):
+        leader.logs.append(raft_pb2.LogEntry(term=1, index=leader.get_last_index() + 1, command=raft_pb2.Command(json="{}")))
+    for i in range(1, n_replicas):
+        leader.match_index[i] = 1 + i * gap // (4 * n_replicas)
+    return leader
+
+
+""" Return the mean time (seconds) of [update] on a Leader with [n_replicas] and [gap] uncommitted entries """
+def measure(update, n_replicas, gap):
+    leader = make_leader(n_replicas, gap)
+    elapsed = 0
+    for i in range(N_CALLS):
+        with leader.lock:
+            leader.commit_index = 1
+            start = time.perf_counter()
+            update(leader)
+            elapsed += time.perf_counter() - start
+    # both give the same commit_index
+    with leader.lock:
+        leader.commit_index = 1
+        expected = scan_commit_index(leader)
+        leader.update_commit_index()
+        assert leader.commit_index == expected
+    return elapsed / N_CALLS
+
+
+if __name__ == "__main__":
+    print(f"{'replicas':>8} | {'gap':>7} | {'scan (us)':>10} | {'quorum (us)':>11} | {'speedup':>7}")
+    for n_replicas in [3, 5, 7]:
+        for gap in [100, 1000, 10000, 100000]:
+            scan = measure(scan_commit_index, n_replicas, gap)
+            quorum = measure(raft.RaftServiceServicer.update_commit_index, n_replicas, gap)
+            print(f"{n_replicas:>8} | {gap:>7} | {scan * 1e6:>10.1f} | {quorum * 1e6:>11.1f} | {scan / quorum:>6.0f}x")
@@ -0,0 +1,89 @@
+""" Benchmark: the in-memory RAFT log as a list of raft_pb2.LogEntry objects (as before raft_log.py)
+    against raft_log.RaftLog, for N_ENTRIES entries with a typical auction command:
+      - the resident memory per entry (measured in a separate process for each, from /proc/self/statm),
+      - the time of a term lookup (RAFT looks up terms on every append_entries request and response),
+      - the time to build and serialize the append_entries request of one entry from the log
+        (the entry is not in the cache of encoded entries of RaftLog).
+    Run with:
+        python3 bench_raft_log.py
+"""
+import os
+import subprocess
+import json
+import time
+import random
+import sys
+sys.path.append('../')
+import raft
+import raft_pb2
+from raft_log import RaftLog
+
+N_ENTRIES = 1000000
+N_LOOKUPS = 1000000
+COMMAND = '{"op": "bid", "buyer": "buyer-17", "auction": 42, "price": 1250}'
+
+
+def resident_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+""" The former log: a list of raft_pb2.LogEntry, with the term of entry i at logs[i].term """
+class ListLog:
+    def __init__(self):
+        self.logs = [raft_pb2.LogEntry(term=0, index=0, command=raft_pb2.Command())]
+
+    def append(self, entry):
+        self.logs.append(entry)
+
+    def term(self, index):
+        return self.logs[index].term
+
+    def serialize_request(self, index):
+        request = raft_pb2.AE_Request()
+        request.entries.append(self.logs[index])
+        return request.SerializeToString()
+
+
+""" RaftLog, with the request made as in RaftServiceServicer.make_append_entries_request() """
+class CompactLog(RaftLog):
+    def serialize_request(self, index):
+        return raft.EncodedAERequest(raft_pb2.AE_Request(), [self.encoded_entry(index)]).SerializeToString()
+
+
+LOGS = { "list of LogEntry": ListLog, "RaftLog": CompactLog }
+
+
+""" Fill a log of type [name] and return its measurements (a dict) """
+def run(name):
+    before = resident_bytes()
+    log = LOGS[name]()
+    for i in range(1, N_ENTRIES + 1):
+        log.append(raft_pb2.LogEntry(term=1 + i // 1000, index=i, command=raft_pb2.Command(json=COMMAND)))
+    memory = (resident_bytes() - before) / N_ENTRIES
+
+    indexes = [random.randint(1, N_ENTRIES) for i in range(N_LOOKUPS)]
+    start = time.perf_counter()
+    for index in indexes:
+        log.term(index)
+    lookup = (time.perf_counter() - start) / N_LOOKUPS
+
+    start = time.perf_counter()
+    for index in indexes[:100000]:
+        log.serialize_request(index)
+    build = (time.perf_counter() - start) / 100000
+    return { "memory": memory, "lookup": lookup, "build": build }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        # (in the child process)
+        print("RESULT " + json.dumps(run(sys.argv[1])), flush=True)
+        sys.exit(0)
+
+    print(f"{N_ENTRIES} entries, command of {len(COMMAND)} characters")
+    print(f"{'log':>17} | {'resident bytes per entry':>24} | {'term lookup (ns)':>16} | {'1-entry request (us)':>20}")
+    for name in LOGS:
+        output = subprocess.run([sys.executable, __file__, name], capture_output=True, text=True, timeout=600).stdout
+        result = json.loads([x for x in output.splitlines() if x.startswith("RESULT ")][0][len("RESULT "):])
+        print(f"{name:>17} | {result['memory']:>24.0f} | {result['lookup'] * 1e9:>16.0f} | {result['build'] * 1e6:>20.2f}")
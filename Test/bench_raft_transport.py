@@ -0,0 +1,93 @@
+""" Benchmark: the threaded RAFT server (raft.py) against the asyncio one (raft_aio.py).
+
+    For each implementation, a cluster of config.n_replicas RAFT servers (without persistence)
+    runs in a separate process, with a short heartbeat interval, and we measure
+      - the CPU used by the idle cluster (heartbeats only),
+      - the commit latency of entries proposed one after another to the leader,
+      - the CPU used per committed entry.
+    Run with:
+        python3 bench_raft_transport.py
+"""
+import subprocess
+import threading
+import queue
+import time
+import json
+import logging
+import sys
+sys.path.append('../')
+import config
+import raft
+import raft_aio
+
+HEARTBEAT_INTERVAL = 10     # millisecond
+IDLE_SECONDS = 3
+N_ENTRIES = 500
+IMPLEMENTATIONS = { "threads": raft.RaftServiceServicer, "asyncio": raft_aio.AsyncRaftServiceServicer }
+
+
+""" Run the benchmark on a cluster of [impl] servers in this process and return the results (a dict) """
+def run(impl):
+    logging.disable(logging.CRITICAL)
+    # (a fixed heartbeat interval: with adaptive timeouts, leader_broadcast_interval would not be used)
+    config.raft_adaptive_timeouts = False
+    config.leader_broadcast_interval = HEARTBEAT_INTERVAL
+    nodes = [IMPLEMENTATIONS[impl](config.replicas, i, queue.Queue(), need_persistent=False)
+             for i in range(config.n_replicas)]
+    for node in nodes:
+        node.my_start()
+
+    # wait for a leader with a committed no-op
+    while True:
+        time.sleep(0.1)
+        leaders = [x for x in nodes if x.state == raft.Leader]
+        if len(leaders) == 1 and leaders[0].commit_index > 0:
+            leader = leaders[0]
+            break
+
+    # The leader's applied entries: consumed by a thread, which notifies the proposer
+    applied = [0]
+    applied_cond = threading.Condition()
+    def consume():
+        while True:
+            batch = leader.apply_queue.get()
+            with applied_cond:
+                applied[0] = batch[-1].index
+                applied_cond.notify_all()
+    threading.Thread(target=consume, daemon=True).start()
+
+    cpu, wall = time.process_time(), time.perf_counter()
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = (time.process_time() - cpu) / (time.perf_counter() - wall)
+
+    latencies = []
+    cpu = time.process_time()
+    for i in range(N_ENTRIES):
+        start = time.perf_counter()
+        (index, _, is_leader) = leader.new_entry(raft.raft_pb2.Command(json=f'{{"i": {i}}}'))
+        assert is_leader
+        with applied_cond:
+            applied_cond.wait_for(lambda: applied[0] >= index)
+        latencies.append(time.perf_counter() - start)
+    cpu_per_entry = (time.process_time() - cpu) / N_ENTRIES
+    latencies.sort()
+    return { "idle_cpu": idle_cpu,
+             "mean": sum(latencies) / len(latencies),
+             "p50": latencies[len(latencies) // 2],
+             "p99": latencies[int(len(latencies) * 0.99)],
+             "cpu_per_entry": cpu_per_entry }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        # (in the child process)
+        print("RESULT " + json.dumps(run(sys.argv[1])), flush=True)
+        sys.exit(0)
+
+    print(f"{config.n_replicas} servers in one process, heartbeat every {HEARTBEAT_INTERVAL} ms, {N_ENTRIES} sequential entries")
+    print(f"{'implementation':>14} | {'idle CPU (%)':>12} | {'commit latency (ms): mean':>25} {'p50':>6} {'p99':>6} | {'CPU per entry (ms)':>18}")
+    for impl in IMPLEMENTATIONS:
+        output = subprocess.run([sys.executable, __file__, impl], capture_output=True, text=True, timeout=120).stdout
+        result = json.loads([x for x in output.splitlines() if x.startswith("RESULT ")][0][len("RESULT "):])
+        print(f"{impl:>14} | {result['idle_cpu'] * 100:>12.1f} | {result['mean'] * 1000:>25.2f} {result['p50'] * 1000:>6.2f} "
+              f"{result['p99'] * 1000:>6.2f} | {result['cpu_per_entry'] * 1000:>18.2f}")
@@ -0,0 +1,90 @@
+""" Benchmark: the write throughput of the platform with 1 shard and with several shards (see sharding.py).
+
+    For each number of shards, config.n_replicas server.py processes are started (with config.n_shards overridden),
+    and N_CLIENTS client threads create auctions, each as its own seller, so the writes are spread over the shards.
+    With one shard, every write goes through the log of one RAFT leader; with several shards,
+    the shards have their own logs and their own leaders (spread over the replicas), and commit in parallel.
+    (The gain depends on the cores available: all the processes run on this machine.)
+    Run with:
+        python3 bench_shards.py
+"""
+import subprocess
+import threading
+import shutil
+import tempfile
+import os
+import time
+import json
+import sys
+import grpc
+sys.path.append('../')
+import config
+import sharding
+import auction_pb2
+import auction_pb2_grpc
+
+N_CLIENTS = 24
+N_WRITES = 40       # per client
+SHARDS = [1, 3]
+# (a server runs in a temporary directory, where it keeps its RAFT records)
+SERVER = "import sys; sys.path.insert(0, {!r}); import runpy, config; config.n_shards = {}; sys.argv = ['server.py', '{}']; runpy.run_path({!r}, run_name='__main__')"
+REPO = os.path.abspath('../')
+
+
+""" Send platform request [request] (a dictionary) to the shards it is for, and return the merged response """
+def call(stubs, request):
+    responses = []
+    for shard in sharding.route(request):
+        while True:
+            for stub in stubs:
+                try:
+                    response = stub.rpc_platform_serve(auction_pb2.PlatformServiceRequest(json=json.dumps(request), shard=shard))
+                except grpc.RpcError:
+                    continue
+                if response.is_leader:
+                    break
+            else:
+                time.sleep(0.1)     # (no leader yet)
+                continue
+            responses.append(json.loads(response.json))
+            break
+    return sharding.merge_responses(request, responses)
+
+
+""" The number of writes per second of a cluster with [n_shards] shards """
+def run(n_shards):
+    config.n_shards = n_shards
+    directory = tempfile.mkdtemp()
+    servers = [subprocess.Popen([sys.executable, "-c", SERVER.format(REPO, n_shards, i, os.path.join(REPO, "server.py"))], cwd=directory,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for i in range(config.n_replicas)]
+    try:
+        stubs = [auction_pb2_grpc.PlatformServiceStub(grpc.insecure_channel(r.ip_addr + ":" + r.client_port))
+                 for r in config.replicas]
+        for k in range(N_CLIENTS):
+            call(stubs, {"op": config.LOGIN, "username": f"seller{k}", "address": "127.0.0.1:0"})
+        time.sleep(2 * config.shard_balance_interval / 1000)     # (the leaders move to their preferred replicas)
+
+        def client(k):
+            for j in range(N_WRITES):
+                call(stubs, {"op": config.SELLER_CREATE_AUCTION, "seller_username": f"seller{k}", "auction_name": f"auction{j}",
+                             "item_name": "item", "base_price": 0, "price_increment_period": 300, "increment": 1,
+                             "item_description": "description"})
+        threads = [threading.Thread(target=client, args=(k,)) for k in range(N_CLIENTS)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return N_CLIENTS * N_WRITES / (time.perf_counter() - start)
+    finally:
+        for server in servers:
+            server.kill()
+            server.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    print(f"{config.n_replicas} replicas, {N_CLIENTS} clients, {N_CLIENTS * N_WRITES} auctions created")
+    print(f"{'shards':>6} | {'writes/s':>8}")
+    for n_shards in SHARDS:
+        print(f"{n_shards:>6} | {run(n_shards):>8.0f}")
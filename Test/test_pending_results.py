@@ -0,0 +1,91 @@
+import unittest
+import threading
+import sys
+sys.path.append('../')
+from pending_results import PendingResults
+
+
+class PendingResultsTest(unittest.TestCase):
+    """
+    Testing the table of the results waited for by the requests in the log
+    """
+
+    def test_deliver(self):
+        results = PendingResults()
+        future = results.register(5, 2)
+        results.deliver(4, 2, "other")
+        self.assertFalse(future.done())
+        threading.Timer(0.01, lambda: results.deliver(5, 2, "response")).start()
+        self.assertEqual(future.result(1), "response")
+        self.assertEqual(len(results), 0)
+
+    def test_replaced_entry(self):
+        results = PendingResults()
+        # another leader replaced the entry: the request fails
+        future = results.register(5, 2)
+        results.deliver(5, 3, "response of another request")
+        self.assertIsNone(future.result(0))
+        # this server adds a new request at the same index in a later term: the old one fails
+        old = results.register(6, 2)
+        new = results.register(6, 4)
+        self.assertIsNone(old.result(0))
+        results.deliver(6, 4, "response")
+        self.assertEqual(new.result(0), "response")
+
+    def test_snapshot_and_stop(self):
+        results = PendingResults()
+        futures = [results.register(i, 1) for i in range(1, 5)]
+        results.fail_through(2)
+        self.assertEqual([f.done() for f in futures], [True, True, False, False])
+        results.fail_all()
+        self.assertEqual([f.result(0) for f in futures], [None] * 4)
+        self.assertEqual(len(results), 0)
+
+    def test_cancel(self):
+        results = PendingResults()
+        future = results.register(7, 1)
+        results.cancel(7, future)
+        self.assertEqual(len(results), 0)
+        results.deliver(7, 1, "response")   # (nobody waits for it any more)
+        self.assertTrue(future.cancelled())
+
+    def test_cancel_while_delivered(self):
+        # the waiter of each request times out just when the request is applied
+        results = PendingResults()
+        n = 5000
+        futures = [results.register(i, 1) for i in range(n)]
+        barrier = threading.Barrier(2)
+        errors = []
+        def waiter():
+            for (i, future) in enumerate(futures):
+                barrier.wait()
+                try:
+                    future.result(0)
+                except TimeoutError:
+                    results.cancel(i, future)
+        def applier():
+            for i in range(n):
+                barrier.wait()
+                try:
+                    results.deliver(i, 1, i)
+                except Exception as e:
+                    errors.append(e)
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=waiter), threading.Thread(target=applier)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        # no exception in the applier: each request got its response, or was cancelled
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 0)
+        for (i, future) in enumerate(futures):
+            self.assertTrue(future.cancelled() or future.result(0) == i)
+
+
+if __name__ == "__main__":
+    unittest.main()
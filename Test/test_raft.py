@@ -0,0 +1,718 @@
+import unittest
+import json
+import queue
+import time
+import threading
+import logging
+import os
+import shutil
+import tempfile
+import sys
+from concurrent import futures
+sys.path.append('../')
+import grpc
+import config
+import raft
+import raft_pb2
+from raft_storage import RaftStorage
+
+logging.disable(logging.CRITICAL)
+
+
+def make_leader(my_id=0, replicas=config.replicas):
+    leader = raft.RaftServiceServicer(replicas, my_id, queue.Queue(), need_persistent=False)
+    leader.current_term = 1
+    with leader.lock:
+        leader.state = raft.Candidate
+    leader.convert_to_leader()
+    return leader
+
+
+""" Let follower [id] ack everything the leader has, as if the request was sent at [sent_time] """
+def ack(leader, id, sent_time):
+    with leader.lock:
+        request = leader.make_append_entries_request(id)
+        leader.next_index[id] += len(request.entries)
+        response = raft_pb2.AE_Response(term=leader.current_term, success=True)
+        leader.handle_append_entries_response(id, request, leader.pipeline_epoch[id], response,
+                                              leader.heartbeat_round, sent_time)
+
+
+class RaftReadIndexTest(unittest.TestCase):
+    """
+    Testing the reads of the Leader (config.raft_read_mode = "read_index"): a read waits for a round of heartbeats
+    started after it, acked by a majority
+    """
+
+    def setUp(self):
+        self.read_mode = config.raft_read_mode
+        self.rpc_timeout = config.raft_rpc_timeout
+        config.raft_read_mode = "read_index"
+        config.raft_rpc_timeout = 5000
+        replicas = [config.ServerInfo(i, "127.0.0.1", str(20000 + 10*i), str(30000 + 10*i)) for i in range(5)]
+        self.leader = make_leader(replicas=replicas)
+        ack(self.leader, 1, 0)
+        ack(self.leader, 2, 0)      # the no-op is committed
+        self.results = []
+        self.readers = []
+
+    def tearDown(self):
+        config.raft_read_mode = self.read_mode
+        config.raft_rpc_timeout = self.rpc_timeout
+
+    """ Start a read in a thread, and wait until it waits for its round """
+    def read(self):
+        n_reads = self.leader.read_index_reads + 1
+        thread = threading.Thread(target=lambda: self.results.append(self.leader.read_index()))
+        thread.start()
+        self.readers.append(thread)
+        while True:
+            with self.leader.lock:
+                if self.leader.read_index_reads == n_reads:
+                    return
+            time.sleep(0.001)
+
+    """ Let follower [id] respond to the heartbeat of round [hb_round] """
+    def respond(self, id, hb_round, term=1):
+        leader = self.leader
+        with leader.lock:
+            request = leader.make_append_entries_request(id)
+            leader.next_index[id] += len(request.entries)
+            response = raft_pb2.AE_Response(term=term, success=True)
+            leader.handle_append_entries_response(id, request, leader.pipeline_epoch[id], response, hb_round)
+
+    def join(self):
+        for thread in self.readers:
+            thread.join(1)
+            self.assertFalse(thread.is_alive())
+
+    def test_reads_share_round(self):
+        leader = self.leader
+        self.read()
+        self.assertEqual(leader.heartbeat_round, 2)
+        # the reads arriving while round 2 is in flight wait for the next round, which is not started yet
+        self.read()
+        self.read()
+        self.assertEqual(leader.heartbeat_round, 2)
+        self.respond(1, 2)
+        self.respond(2, 2)
+        # the first read is served, and a single round is started for the two others
+        self.readers[0].join(1)
+        self.assertEqual(self.results, [(1, True)])
+        self.assertEqual(leader.heartbeat_round, 3)
+        self.respond(3, 3)
+        self.respond(4, 3)
+        self.join()
+        self.assertEqual(self.results, [(1, True)] * 3)
+        self.assertEqual((leader.heartbeat_round, leader.read_index_reads), (3, 3))
+
+    def test_read_waits_for_majority(self):
+        leader = self.leader
+        self.read()
+        # the leader and one follower are not a majority of 5
+        self.respond(1, leader.heartbeat_round)
+        time.sleep(0.05)
+        self.assertEqual(self.results, [])
+        # an ack of an older round does not count
+        self.respond(2, leader.heartbeat_round - 1)
+        time.sleep(0.05)
+        self.assertEqual(self.results, [])
+        self.respond(3, leader.heartbeat_round)
+        self.join()
+        self.assertEqual(self.results, [(1, True)])
+
+    def test_reads_fail_on_newer_term(self):
+        leader = self.leader
+        self.read()
+        self.read()
+        # a follower has seen a newer term: the leader steps down
+        self.respond(1, leader.heartbeat_round, term=2)
+        self.join()
+        self.assertEqual(self.results, [(-1, False)] * 2)
+        self.assertEqual((leader.state, leader.current_term), (raft.Follower, 2))
+
+    def test_reads_fail_on_new_leader(self):
+        leader = self.leader
+        self.read()
+        leader.handle_append_entries(raft_pb2.AE_Request(term=2, leader_id=1, prev_log_index=0,
+                                                         prev_log_term=0, leader_commit=0))
+        self.join()
+        self.assertEqual(self.results, [(-1, False)])
+        self.assertEqual(leader.read_index(), (-1, False))
+
+
+class RaftLeaseTest(unittest.TestCase):
+    """
+    Testing the leader lease (config.raft_read_mode = "lease")
+    """
+
+    def setUp(self):
+        self.read_mode = config.raft_read_mode
+        config.raft_read_mode = "lease"
+
+    def tearDown(self):
+        config.raft_read_mode = self.read_mode
+
+    def test_lease_read(self):
+        leader = make_leader()
+        with leader.lock:
+            self.assertFalse(leader.check_lease())
+        ack(leader, 1, time.monotonic())
+        self.assertEqual(leader.get_term(leader.commit_index), 1)    # the no-op is committed
+        with leader.lock:
+            self.assertTrue(leader.check_lease())
+        # served locally, without a round of heartbeats
+        round_before = leader.heartbeat_round
+        self.assertEqual(leader.read_index(), (leader.commit_index, True))
+        self.assertEqual(leader.heartbeat_round, round_before)
+        self.assertEqual(leader.get_metrics()["lease_reads"], 1)
+        # (the metrics are given to the admin command as json)
+        metrics = json.loads(leader.rpc_get_metrics(raft_pb2.GM_Request(), None).json)
+        self.assertEqual((metrics["lease_valid"], metrics["lease_reads"], metrics["leader_id"]), (True, 1, 0))
+
+    def test_lease_expires(self):
+        leader = make_leader()
+        duration = (config.election_timeout_lower_bound - config.raft_lease_clock_drift) / 1000
+        ack(leader, 1, time.monotonic() - duration - 0.01)
+        with leader.lock:
+            self.assertFalse(leader.check_lease())
+            self.assertFalse(leader.leader_is_alive())
+        # the leader steps down: no lease any more
+        ack(leader, 2, time.monotonic())
+        with leader.lock:
+            self.assertTrue(leader.check_lease())
+            leader.convert_to_follower(2)
+            self.assertFalse(leader.check_lease())
+
+    def test_refuse_vote_while_leader_alive(self):
+        follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+        follower.handle_append_entries(raft_pb2.AE_Request(term=1, leader_id=0, prev_log_index=0,
+                                                           prev_log_term=0, leader_commit=0))
+        vote = raft_pb2.RV_Request(term=2, candidate_id=2, last_log_index=0, last_log_term=0)
+        response = follower.rpc_request_vote(vote, None)
+        self.assertFalse(response.vote_granted)
+        self.assertEqual(follower.current_term, 1)
+        # once the leader is silent for election_timeout_lower_bound, the vote can be granted
+        follower.last_heard_leader -= config.election_timeout_lower_bound / 1000
+        response = follower.rpc_request_vote(vote, None)
+        self.assertTrue(response.vote_granted)
+
+
+
+class RaftApplyTest(unittest.TestCase):
+    """
+    Testing the applier thread, which gives committed entries to the server in batches
+    """
+
+    def test_batches_in_order(self):
+        leader = make_leader()
+        threading.Thread(target=leader.apply_loop, daemon=True).start()
+        for i in range(10):
+            leader.new_entry(raft_pb2.Command(json=f'{{"i": {i}}}'))
+        ack(leader, 1, time.monotonic())
+        indexes = []
+        while len(indexes) < 11:
+            batch = leader.apply_queue.get(timeout=1)
+            self.assertIsInstance(batch, list)
+            indexes.extend(x.index for x in batch)
+        self.assertEqual(indexes, list(range(1, 12)))
+        self.assertEqual(leader.last_applied, 11)
+
+    def test_snapshot_before_entries(self):
+        follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+        follower.rpc_install_snapshot(raft_pb2.IS_Request(term=1, leader_id=0, last_included_index=5,
+                                                          last_included_term=1, data=b""), None)
+        entry = raft_pb2.LogEntry(term=1, index=6, command=raft_pb2.Command(json="{}"))
+        follower.handle_append_entries(raft_pb2.AE_Request(term=1, leader_id=0, prev_log_index=5, prev_log_term=1,
+                                                           leader_commit=6, entries=[entry]))
+        threading.Thread(target=follower.apply_loop, daemon=True).start()
+        self.assertIsInstance(follower.apply_queue.get(timeout=1), raft_pb2.Snapshot)
+        self.assertEqual([x.index for x in follower.apply_queue.get(timeout=1)], [6])
+
+
+class RaftLearnerTest(unittest.TestCase):
+    """
+    Testing learners: they receive the log, but do not count toward a majority
+    """
+
+    def setUp(self):
+        self.replicas = list(config.replicas) + [config.ServerInfo(3, "127.0.0.1", "20030", "30030", learner=True),
+                                                 config.ServerInfo(4, "127.0.0.1", "20040", "30040", learner=True)]
+
+    def test_learners_do_not_count(self):
+        leader = make_leader(replicas=self.replicas)
+        self.assertEqual(leader.voters, [0, 1, 2])
+        ack(leader, 3, time.monotonic())
+        ack(leader, 4, time.monotonic())
+        self.assertEqual(leader.commit_index, 0)
+        ack(leader, 1, time.monotonic())
+        self.assertEqual(leader.commit_index, 1)
+        self.assertEqual(leader.match_index[3], 1)      # learners still receive the log
+
+    def test_learner_does_not_vote(self):
+        learner = raft.RaftServiceServicer(self.replicas, 3, queue.Queue(), need_persistent=False)
+        self.assertTrue(learner.is_learner)
+        vote = raft_pb2.RV_Request(term=1, candidate_id=0, last_log_index=0, last_log_term=0)
+        self.assertFalse(learner.rpc_request_vote(vote, None).vote_granted)
+
+
+class RaftCommitTest(unittest.TestCase):
+    """
+    Testing the commit_index of the Leader: the majority-th largest match_index, if from the current term
+    """
+
+    def setUp(self):
+        self.replicas = [config.ServerInfo(i, "127.0.0.1", str(20000 + 10*i), str(30000 + 10*i)) for i in range(5)]
+
+    def test_majority_match_index(self):
+        leader = make_leader(replicas=self.replicas)
+        for i in range(9):
+            leader.new_entry(raft_pb2.Command(json="{}"))
+        with leader.lock:
+            leader.match_index[1:] = [7, 3, 10, 2]
+            leader.update_commit_index()
+            self.assertEqual(leader.commit_index, 7)       # stored by 0, 1 and 3
+            leader.match_index[2] = 8
+            leader.update_commit_index()
+            self.assertEqual(leader.commit_index, 8)
+
+    def test_only_current_term(self):
+        leader = make_leader(replicas=self.replicas)
+        # entries 1..3 are from term 1, the no-op at 4 from term 2
+        for i in range(2):
+            leader.new_entry(raft_pb2.Command(json="{}"))
+        with leader.lock:
+            leader.current_term = 2
+            leader.state = raft.Candidate
+        leader.convert_to_leader()
+        with leader.lock:
+            leader.match_index[1:] = [3, 3, 0, 0]
+            leader.update_commit_index()
+            self.assertEqual(leader.commit_index, 0)       # (Figure 8 of the RAFT paper)
+            leader.match_index[1:] = [4, 4, 0, 0]
+            leader.update_commit_index()
+            self.assertEqual(leader.commit_index, 4)
+
+
+""" Send the next append_entries request to follower [id], as the replicator does: return (request, epoch) """
+def send(leader, id):
+    with leader.lock:
+        leader.heartbeat_due[id] = False
+        leader.inflight[id] += 1
+        request = leader.make_append_entries_request(id)
+        leader.next_index[id] += len(request.entries)
+        return (request, leader.pipeline_epoch[id])
+
+
+""" Complete the append_entries [request] sent to follower [id] with [response] (or a failed RPC if None) """
+def done(leader, id, request, epoch, response=None):
+    future = futures.Future()
+    if response is None:
+        future.set_exception(grpc.RpcError())
+    else:
+        future.set_result(response)
+    leader.on_append_entries_done(id, request, epoch, 0, 0, future)
+
+
+class RaftPipelineTest(unittest.TestCase):
+    """
+    Testing the replication pipeline: the responses of the requests in flight may arrive in any order
+    """
+
+    def setUp(self):
+        self.max_append_entries = config.raft_max_append_entries
+        config.raft_max_append_entries = 3
+        self.leader = make_leader()
+        for i in range(14):
+            self.leader.new_entry(raft_pb2.Command(json="{}"))
+
+    def tearDown(self):
+        config.raft_max_append_entries = self.max_append_entries
+
+    def success(self):
+        return raft_pb2.AE_Response(term=self.leader.current_term, success=True)
+
+    def test_out_of_order_responses(self):
+        leader = self.leader
+        sent = [send(leader, 1) for i in range(config.raft_max_inflight_append)]
+        self.assertEqual([request.prev_log_index for (request, epoch) in sent], [0, 3, 6, 9])
+        with leader.lock:
+            self.assertEqual(leader.next_index[1], 13)
+            self.assertFalse(leader.need_to_replicate(1))   # the window is full
+        done(leader, 1, *sent[2], self.success())
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1], leader.inflight[1]), (9, 13, 3))
+            self.assertTrue(leader.need_to_replicate(1))
+        # older responses arriving late do not move match_index back
+        done(leader, 1, *sent[0], self.success())
+        done(leader, 1, *sent[1], self.success())
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1], leader.inflight[1]), (9, 13, 1))
+        done(leader, 1, *sent[3], self.success())
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1], leader.inflight[1]), (12, 13, 0))
+
+    def test_rejection_restarts_pipeline(self):
+        leader = self.leader
+        sent = [send(leader, 1) for i in range(3)]
+        epoch = leader.pipeline_epoch[1]
+        done(leader, 1, *sent[0], self.success())
+        # the second request is rejected (without hints): go back by one entry
+        done(leader, 1, *sent[1], raft_pb2.AE_Response(term=leader.current_term, success=False))
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1]), (3, 3))
+            self.assertEqual(leader.pipeline_epoch[1], epoch + 1)
+        # the rejection of the request pipelined after it (from the previous epoch) is ignored
+        done(leader, 1, *sent[2], raft_pb2.AE_Response(term=leader.current_term, success=False))
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1]), (3, 3))
+            self.assertEqual((leader.pipeline_epoch[1], leader.inflight[1]), (epoch + 1, 0))
+        (request, epoch) = send(leader, 1)
+        self.assertEqual((request.prev_log_index, len(request.entries)), (2, 3))
+
+    def test_failed_rpc_restarts_pipeline(self):
+        leader = self.leader
+        sent = [send(leader, 1) for i in range(2)]
+        epoch = leader.pipeline_epoch[1]
+        done(leader, 1, *sent[0])
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1], leader.inflight[1]), (0, 1, 1))
+            self.assertEqual(leader.pipeline_epoch[1], epoch + 1)
+        # a success from the previous epoch still tells what the follower stores
+        done(leader, 1, *sent[1], self.success())
+        with leader.lock:
+            self.assertEqual((leader.match_index[1], leader.next_index[1], leader.inflight[1]), (6, 7, 0))
+
+
+class RaftProposalTest(unittest.TestCase):
+    """
+    Testing the proposer: the entries proposed together are written to the WAL and replicated together
+    """
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.leader = raft.RaftServiceServicer(config.replicas, 0, queue.Queue(), need_persistent=False)
+        self.leader.need_persistent = True
+        self.leader.storage = RaftStorage(self.dirname)
+        self.appends = []
+        storage_append = self.leader.storage.append
+        def append(entries):
+            self.appends.append([entry.index for entry in entries])
+            storage_append(entries)
+        self.leader.storage.append = append
+        self.leader.current_term = 1
+        with self.leader.lock:
+            self.leader.state = raft.Candidate
+        self.leader.convert_to_leader()
+
+    def tearDown(self):
+        self.leader.storage.close()
+        shutil.rmtree(self.dirname)
+
+    def test_proposals_coalesced(self):
+        leader = self.leader
+        results = []
+        proposers = [threading.Thread(target=lambda k=k: results.append((k, leader.new_entry(raft_pb2.Command(json=str(k))))))
+                     for k in range(8)]
+        for thread in proposers:
+            thread.start()
+        for thread in proposers:
+            thread.join()
+        # every proposer gets its own index, with its command at that index
+        self.assertEqual(sorted(index for (k, (index, term, is_leader)) in results), list(range(2, 10)))
+        with leader.lock:
+            for (k, (index, term, is_leader)) in results:
+                self.assertTrue(is_leader)
+                self.assertEqual(leader.get_entry(index).command.json, str(k))
+        # the proposer writes them all at once
+        self.assertEqual(self.appends, [[1]])
+        threading.Thread(target=leader.propose_loop, daemon=True).start()
+        while True:
+            with leader.lock:
+                if len(leader.proposals) == 0:
+                    break
+            time.sleep(0.001)
+        self.assertEqual(self.appends, [[1], list(range(2, 10))])
+        # and a single request replicates them
+        (request, epoch) = send(leader, 1)
+        self.assertEqual([(request.prev_log_index, len(request.entries))], [(0, 9)])
+        with leader.lock:
+            self.assertFalse(leader.need_to_replicate(1))
+
+
+class RaftBacktrackTest(unittest.TestCase):
+    """
+    Testing how the Leader moves next_index back when a follower rejects a request, using the conflict hints
+    """
+
+    def setUp(self):
+        # the terms of the entries 1..7 are [1, 1, 1, 2, 2, 2, 4]
+        self.leader = make_leader()
+        for term in [2, 4]:
+            for i in range(2):
+                self.leader.new_entry(raft_pb2.Command(json="{}"))
+            with self.leader.lock:
+                self.leader.current_term = term
+                self.leader.state = raft.Candidate
+            self.leader.convert_to_leader()
+        self.request = raft_pb2.AE_Request(term=4, prev_log_index=7, prev_log_term=4)
+
+    def backtrack(self, conflict_index, conflict_term=0):
+        response = raft_pb2.AE_Response(term=4, success=False, conflict_index=conflict_index, conflict_term=conflict_term)
+        with self.leader.lock:
+            return self.leader.backtrack_next_index(self.request, response)
+
+    def test_without_hints(self):
+        self.assertEqual(self.backtrack(0), 7)
+
+    def test_follower_log_too_short(self):
+        self.assertEqual(self.backtrack(3), 3)
+        # never beyond the entry before the rejected request
+        self.assertEqual(self.backtrack(20), 7)
+
+    def test_leader_has_conflict_term(self):
+        # continue after the last entry of term 1 of the Leader
+        self.assertEqual(self.backtrack(2, 1), 4)
+
+    def test_leader_lacks_conflict_term(self):
+        # skip the follower's entries of term 3 (from 5), and the Leader's entries of term 4
+        self.assertEqual(self.backtrack(5, 3), 5)
+
+    def test_below_snapshot(self):
+        leader = self.leader
+        with leader.lock:
+            leader.commit_index = leader.last_applied = 6
+        leader.snapshot(5, b"state")
+        # the entries of term 1 are in the snapshot: the follower is sent the snapshot
+        next_index = self.backtrack(2, 1)
+        self.assertEqual(next_index, 2)
+        with leader.lock:
+            leader.next_index[1] = next_index
+            self.assertLessEqual(leader.next_index[1], leader.snapshot_index)
+            self.assertTrue(leader.need_to_replicate(1))
+
+
+""" An append_entries request of [leader_term] with [terms] as the terms of its entries, from prev_log_index + 1 """
+def make_append_entries(leader_term, prev_log_index, prev_log_term, terms, leader_commit=0):
+    entries = [raft_pb2.LogEntry(term=t, index=prev_log_index + 1 + k, command=raft_pb2.Command(json="{}"))
+               for (k, t) in enumerate(terms)]
+    return raft_pb2.AE_Request(term=leader_term, leader_id=0, prev_log_index=prev_log_index,
+                               prev_log_term=prev_log_term, entries=entries, leader_commit=leader_commit)
+
+
+class RaftFollowerTest(unittest.TestCase):
+    """
+    Testing the append_entries handler of a Follower (with a write-ahead log in a temporary directory)
+    """
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+        self.follower.need_persistent = True
+        self.follower.storage = RaftStorage(self.dirname)
+        self.assertTrue(self.follower.handle_append_entries(make_append_entries(1, 0, 0, [1, 1, 1, 1])).success)
+
+    def tearDown(self):
+        self.follower.storage.close()
+        shutil.rmtree(self.dirname)
+
+    def test_heartbeat_writes_nothing(self):
+        os.remove(self.follower.storage.meta_filename)
+        truncations = self.follower.storage.truncations
+        for i in range(3):
+            self.assertTrue(self.follower.handle_append_entries(make_append_entries(1, 4, 1, [], leader_commit=4)).success)
+        self.assertEqual(self.follower.commit_index, 4)
+        self.assertFalse(os.path.exists(self.follower.storage.meta_filename))
+        self.assertEqual(self.follower.storage.truncations, truncations)
+        # a new term is saved
+        self.assertTrue(self.follower.handle_append_entries(make_append_entries(2, 4, 1, [])).success)
+        self.assertTrue(os.path.exists(self.follower.storage.meta_filename))
+
+    def test_late_request_keeps_log(self):
+        # an older request, for entries the follower already has, does not delete the ones after it
+        response = self.follower.handle_append_entries(make_append_entries(1, 1, 1, [1], leader_commit=4))
+        self.assertTrue(response.success)
+        self.assertEqual(self.follower.get_last_index(), 4)
+        # and only commits up to its last entry
+        self.assertEqual(self.follower.commit_index, 2)
+
+    def test_conflict_truncates(self):
+        response = self.follower.handle_append_entries(make_append_entries(2, 2, 1, [2]))
+        self.assertTrue(response.success)
+        self.assertEqual([self.follower.get_term(i) for i in range(4)], [0, 1, 1, 2])
+        self.assertEqual(self.follower.get_last_index(), 3)
+        self.assertEqual(self.follower.storage.next_index(), 4)
+
+    def test_leader_hint(self):
+        # the follower gives the leader of its term to the clients
+        (leader_id, leader) = self.follower.get_leader()
+        self.assertEqual((leader_id, leader.client_port), (0, config.replicas[0].client_port))
+        with self.follower.lock:
+            self.follower.convert_to_follower(2)
+        self.assertEqual(self.follower.get_leader(), (-1, None))
+        request = make_append_entries(2, 4, 1, [])
+        request.leader_id = 2
+        self.assertTrue(self.follower.handle_append_entries(request).success)
+        self.assertEqual(self.follower.get_leader()[0], 2)
+
+
+
+def make_member(i, learner=False):
+    return raft_pb2.Member(id=i, ip_addr="127.0.0.1", client_port=str(20000 + 10*i), raft_port=str(30000 + 10*i), learner=learner)
+
+
+""" A configuration entry with members [members] (a list of raft_pb2.Member) """
+def make_configuration_entry(term, index, members):
+    return raft_pb2.LogEntry(term=term, index=index, command=raft_pb2.Command(membership=raft_pb2.Membership(members=members)))
+
+
+""" Run [function] in a thread, and let the followers [ids] (once they are members) ack everything the leader has
+    until it returns
+"""
+def run_with_acks(leader, ids, function):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function()))
+    thread.start()
+    while thread.is_alive():
+        for id in ids:
+            if id < leader.n_replicas and leader.replicas[id] is not None:
+                ack(leader, id, time.monotonic())
+        time.sleep(0.01)
+    return result[0]
+
+
+class RaftMembershipTest(unittest.TestCase):
+    """
+    Testing the membership changes (configuration entries in the log)
+    """
+
+    def test_follower_follows_configuration_entries(self):
+        follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+        members = [make_member(i) for i in range(3)]
+        request = make_append_entries(1, 0, 0, [1])
+        request.entries.append(make_configuration_entry(1, 2, members + [make_member(3, learner=True)]))
+        request.entries.append(make_configuration_entry(1, 3, members + [make_member(3)]))
+        self.assertTrue(follower.handle_append_entries(request).success)
+        # the latest configuration of the log is in effect, even if it is not committed
+        self.assertEqual((follower.n_replicas, follower.voters), (4, [0, 1, 2, 3]))
+        self.assertEqual(follower.replicas[3].raft_port, "30030")
+        # a new Leader replaces the last entry: back to the configuration before it
+        self.assertTrue(follower.handle_append_entries(make_append_entries(2, 2, 1, [2])).success)
+        self.assertEqual(follower.voters, [0, 1, 2])
+        self.assertTrue(follower.replicas[3].learner)
+
+    def test_add_voter(self):
+        leader = make_leader()
+        success = run_with_acks(leader, [1, 3], lambda: leader.change_membership(make_member(3)))
+        self.assertEqual(success, (True, True))
+        self.assertEqual(leader.voters, [0, 1, 2, 3])
+        # the learner first, then the voter
+        with leader.lock:
+            self.assertEqual([[m.learner for m in membership.members if m.id == 3] for (i, membership) in leader.memberships],
+                             [[], [True], [False]])
+        # a majority is now 3 of the 4 voters
+        (index, term, is_leader) = leader.new_entry(raft_pb2.Command(json="{}"))
+        with leader.lock:
+            leader.flush_proposals()
+        ack(leader, 1, time.monotonic())
+        self.assertLess(leader.commit_index, index)
+        ack(leader, 3, time.monotonic())
+        self.assertEqual(leader.commit_index, index)
+
+    def test_remove_leader(self):
+        leader = make_leader()
+        success = run_with_acks(leader, [1, 2], lambda: leader.change_membership(make_member(0), remove=True))
+        self.assertEqual(success, (True, True))
+        # the Leader steps down once the configuration without it is committed, and does not campaign any more
+        self.assertEqual((leader.state, leader.voters, leader.is_learner), (raft.Follower, [1, 2], True))
+
+    def test_snapshot_keeps_membership(self):
+        leader = make_leader()
+        run_with_acks(leader, [1, 2], lambda: leader.change_membership(make_member(3, learner=True)))
+        with leader.lock:
+            leader.last_applied = leader.commit_index
+        leader.snapshot(leader.commit_index, b"state")
+        with leader.lock:
+            request = leader.make_install_snapshot_request()
+        # a new server learns the members from the snapshot
+        new_server = raft.RaftServiceServicer([None, None, None, config.ServerInfo(3, "127.0.0.1", "20030", "30030", learner=True)],
+                                              3, queue.Queue(), need_persistent=False)
+        self.assertEqual(new_server.voters, [])
+        new_server.rpc_install_snapshot(request, None)
+        self.assertEqual((new_server.voters, new_server.is_learner), ([0, 1, 2], True))
+        self.assertEqual(new_server.replicas[0].raft_port, config.replicas[0].raft_port)
+
+
+class RaftTimeoutTest(unittest.TestCase):
+    """
+    Testing the adaptive timeouts (config.raft_adaptive_timeouts): the Leader derives them from the measured RTTs
+    """
+
+    def setUp(self):
+        self.adaptive = config.raft_adaptive_timeouts
+        config.raft_adaptive_timeouts = True
+
+    def tearDown(self):
+        config.raft_adaptive_timeouts = self.adaptive
+
+    def adapt(self, leader, rtt):
+        with leader.lock:
+            for id in [1, 2]:
+                leader.rtt_samples[id].clear()
+                leader.rtt_samples[id].extend([rtt] * 10)
+            leader.timeouts_updated = 0
+            leader.adapt_timeouts()
+
+    def test_leader_adapts_timeouts(self):
+        leader = make_leader()
+        ack(leader, 1, time.monotonic() - 0.002)
+        self.assertGreaterEqual(leader.get_metrics()["rtt_p99_ms"][1], 2)
+        self.adapt(leader, 0.030)
+        self.assertEqual((leader.election_timeout, leader.heartbeat_interval), 
+                         (config.raft_timeout_rtt_factor * 30, config.raft_timeout_rtt_factor * 30 // config.raft_heartbeats_per_timeout))
+        self.assertEqual(leader.get_metrics()["election_timeout_ms"][0], leader.election_timeout)
+        with leader.lock:
+            self.assertEqual(leader.make_append_entries_request(1).election_timeout, leader.election_timeout)
+        # faster followers: the timeout shrinks slowly, down to the lower bound
+        before = leader.election_timeout
+        self.adapt(leader, 0)
+        self.assertEqual(leader.election_timeout, int(before * 0.9))
+        for k in range(50):
+            self.adapt(leader, 0)
+        self.assertEqual(leader.election_timeout, config.raft_election_timeout_min)
+        # a very slow follower: the upper bound
+        self.adapt(leader, 10)
+        self.assertEqual(leader.election_timeout, config.raft_election_timeout_max)
+
+    def test_apply_latency(self):
+        # a follower measures how long the server takes to apply the committed entries, and reports it
+        follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+        self.assertTrue(follower.handle_append_entries(make_append_entries(1, 0, 0, [1, 1], leader_commit=2)).success)
+        with follower.lock:
+            follower.handed_out.append((2, time.monotonic() - 0.050))
+        follower.applied(2)
+        self.assertGreaterEqual(follower.apply_latency_p99, 0.050)
+        response = follower.handle_append_entries(make_append_entries(1, 2, 1, []))
+        self.assertEqual(response.apply_latency, follower.apply_latency_p99)
+        # the leader adds it to the round trip time of the follower
+        leader = make_leader()
+        with leader.lock:
+            request = leader.make_append_entries_request(1)
+            leader.handle_append_entries_response(1, request, leader.pipeline_epoch[1], response)
+        self.adapt(leader, 0.010)
+        self.assertEqual(leader.election_timeout, int(config.raft_timeout_rtt_factor * (10 + response.apply_latency * 1000)))
+
+    def test_follower_uses_timeout_of_leader(self):
+        follower = raft.RaftServiceServicer(config.replicas, 1, queue.Queue(), need_persistent=False)
+        request = make_append_entries(1, 0, 0, [])
+        request.election_timeout = 500
+        follower.handle_append_entries(request)
+        self.assertEqual(follower.election_timeout, 500)
+        self.assertEqual(follower.election_timeout_upper, 
+                         500 * config.election_timeout_upper_bound // config.election_timeout_lower_bound)
+        request.election_timeout = 1
+        follower.handle_append_entries(request)
+        self.assertEqual(follower.election_timeout, config.raft_election_timeout_min)
+
+if __name__ == "__main__":
+    unittest.main()
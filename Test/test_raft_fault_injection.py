@@ -0,0 +1,192 @@
+import unittest
+import threading
+import queue
+import time
+import logging
+import grpc
+import sys
+sys.path.append('../')
+import config
+import raft
+
+logging.disable(logging.CRITICAL)
+
+
+class FlakyRaft(raft.RaftServiceServicer):
+    """ A RAFT server whose incoming RPCs are dropped when the sender or the receiver is partitioned """
+    partitioned = set()     # ids of the servers that are cut off from the others
+
+    def drop(self, sender, context):
+        if sender in FlakyRaft.partitioned or self.my_id in FlakyRaft.partitioned:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "partitioned")
+
+    def rpc_append_entries(self, request, context):
+        self.drop(request.leader_id, context)
+        return super().rpc_append_entries(request, context)
+
+    def rpc_install_snapshot(self, request, context):
+        self.drop(request.leader_id, context)
+        return super().rpc_install_snapshot(request, context)
+
+    def rpc_request_vote(self, request, context):
+        self.drop(request.candidate_id, context)
+        return super().rpc_request_vote(request, context)
+
+    def rpc_pre_vote(self, request, context):
+        self.drop(request.candidate_id, context)
+        return super().rpc_pre_vote(request, context)
+
+    def rpc_timeout_now(self, request, context):
+        self.drop(request.leader_id, context)
+        return super().rpc_timeout_now(request, context)
+
+
+class Cluster:
+    """ A cluster of FlakyRaft servers in this process, with a client that keeps writing to the leader """
+    port = 31000
+
+    def __init__(self):
+        Cluster.port += 100
+        replicas = [config.ServerInfo(i, "127.0.0.1", str(Cluster.port + 10*i), str(Cluster.port + 10*i + 5))
+                    for i in range(3)]
+        FlakyRaft.partitioned = set()
+        self.nodes = [FlakyRaft(replicas, i, queue.Queue(), need_persistent=False) for i in range(3)]
+        for node in self.nodes:
+            node.my_start()
+        self.commit_times = []
+        self.leaders = []           # the successive leaders seen by the client
+        self.stopped = False
+        self.wait_for_leader()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def get_leader(self):
+        leaders = [x for x in self.nodes if x.state == raft.Leader and x.my_id not in FlakyRaft.partitioned]
+        return leaders[0] if len(leaders) == 1 else None
+
+    def wait_for_leader(self):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            leader = self.get_leader()
+            if leader is not None and leader.commit_index > 0:
+                return leader
+            time.sleep(0.01)
+        raise AssertionError("no leader")
+
+    def max_term(self):
+        return max(x.current_term for x in self.nodes)
+
+    """ Write to the leader one entry after another, and record when each commits """
+    def write_loop(self):
+        while not self.stopped:
+            leader = self.get_leader()
+            if leader is None:
+                time.sleep(0.005)
+                continue
+            if len(self.leaders) == 0 or self.leaders[-1] != (leader.my_id, leader.current_term):
+                self.leaders.append((leader.my_id, leader.current_term))
+            (index, term, is_leader) = leader.new_entry(raft.raft_pb2.Command(json="{}"))
+            if not is_leader:
+                time.sleep(0.001)
+                continue
+            deadline = time.monotonic() + 1
+            while time.monotonic() < deadline and leader.current_term == term and leader.commit_index < index:
+                time.sleep(0.001)
+            if leader.current_term == term and leader.commit_index >= index:
+                self.commit_times.append(time.monotonic())
+
+    """ The longest time without any commit in [start, end] """
+    def max_gap(self, start, end):
+        times = [start] + [t for t in self.commit_times if start < t < end] + [end]
+        return max(times[i+1] - times[i] for i in range(len(times) - 1))
+
+    def stop(self):
+        self.stopped = True
+        self.writer.join()
+        for node in self.nodes:
+            node.stop()
+
+
+class RaftFaultInjectionTest(unittest.TestCase):
+    """
+    Testing PreVote, check-quorum and leadership transfer with network partitions
+    """
+
+    def setUp(self):
+        self.options = (config.raft_pre_vote, config.raft_check_quorum)
+
+    def tearDown(self):
+        (config.raft_pre_vote, config.raft_check_quorum) = self.options
+
+    """ Partition a follower for [seconds], then heal the partition.
+        Return (term increase, number of leader changes, longest time without commit after healing)
+    """
+    def partition_follower(self, pre_vote, seconds=1.5):
+        config.raft_pre_vote = pre_vote
+        cluster = Cluster()
+        try:
+            leader = cluster.wait_for_leader()
+            follower = [x for x in cluster.nodes if x is not leader][0]
+            term = cluster.max_term()
+            time.sleep(0.5)
+            FlakyRaft.partitioned = {follower.my_id}
+            time.sleep(seconds)
+            heal_time = time.monotonic()
+            FlakyRaft.partitioned = set()
+            time.sleep(2)
+            return (cluster.max_term() - term, len(cluster.leaders) - 1,
+                    cluster.max_gap(heal_time, time.monotonic()))
+        finally:
+            cluster.stop()
+
+    def test_partitioned_follower(self):
+        (terms, changes, gap) = self.partition_follower(pre_vote=True)
+        (terms_without, changes_without, gap_without) = self.partition_follower(pre_vote=False)
+        print(f"\n  after healing a partitioned follower:"
+              f"\n    with PreVote   : term +{terms}, {changes} leader changes, no commit for {gap*1000:.0f} ms"
+              f"\n    without PreVote: term +{terms_without}, {changes_without} leader changes, no commit for {gap_without*1000:.0f} ms")
+        # The partitioned follower does not inflate the term or depose the leader
+        self.assertEqual(terms, 0)
+        self.assertEqual(changes, 0)
+        self.assertGreater(terms_without, 0)
+
+    def test_check_quorum(self):
+        config.raft_check_quorum = True
+        cluster = Cluster()
+        try:
+            leader = cluster.wait_for_leader()
+            FlakyRaft.partitioned = {leader.my_id}
+            start = time.monotonic()
+            while leader.state == raft.Leader and time.monotonic() - start < 2:
+                time.sleep(0.01)
+            # the partitioned leader steps down by itself, and the others elect a new leader
+            self.assertNotEqual(leader.state, raft.Leader)
+            self.assertLess(time.monotonic() - start, (config.election_timeout_upper_bound + 200) / 1000)
+            self.assertIsNot(cluster.wait_for_leader(), leader)
+        finally:
+            cluster.stop()
+
+    def test_leadership_transfer(self):
+        cluster = Cluster()
+        try:
+            leader = cluster.wait_for_leader()
+            target = [x for x in cluster.nodes if x is not leader][0]
+            time.sleep(0.5)
+            start = time.monotonic()
+            self.assertEqual(leader.transfer_leadership(target.my_id), (True, True, target.my_id))
+            time.sleep(1)
+            gap = cluster.max_gap(start, time.monotonic())
+            print(f"\n  leadership transfer: no commit for {gap*1000:.0f} ms")
+            self.assertIs(cluster.get_leader(), target)
+            self.assertLess(gap, config.election_timeout_lower_bound / 1000)
+            # a transfer to a partitioned server is given up, and the leader accepts writes again
+            FlakyRaft.partitioned = {leader.my_id}
+            self.assertEqual(target.transfer_leadership(leader.my_id), (True, False, -1))
+            self.assertEqual(target.state, raft.Leader)
+            self.assertTrue(target.new_entry(raft.raft_pb2.Command(json="{}"))[2])
+        finally:
+            cluster.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
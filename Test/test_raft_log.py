@@ -0,0 +1,74 @@
+import unittest
+import sys
+sys.path.append('../')
+import raft_pb2
+from raft_log import RaftLog
+
+
+def make_entries(first_index, n, term=1):
+    return [raft_pb2.LogEntry(term=term, index=i, command=raft_pb2.Command(json=f'{{"i": {i}}}'))
+            for i in range(first_index, first_index + n)]
+
+
+class RaftLogTest(unittest.TestCase):
+    """
+    Testing the compact in-memory log of the RAFT servers
+    """
+
+    def test_append_and_entry(self):
+        log = RaftLog()
+        self.assertEqual((log.last_index(), log.last_term()), (0, 0))
+        log.extend(make_entries(1, 10))
+        log.extend(make_entries(11, 5, term=3))
+        self.assertEqual((log.last_index(), log.last_term()), (15, 3))
+        self.assertEqual(log.entry(12), make_entries(12, 1, term=3)[0])
+        self.assertEqual(log.entry(0), raft_pb2.LogEntry(term=0, index=0, command=raft_pb2.Command()))
+
+    def test_truncate(self):
+        log = RaftLog()
+        log.extend(make_entries(1, 10))
+        log.truncate(6)
+        self.assertEqual(log.last_index(), 5)
+        log.truncate(8)     # (nothing to delete)
+        self.assertEqual(log.last_index(), 5)
+        log.extend(make_entries(6, 2, term=2))
+        self.assertEqual([log.term(i) for i in range(8)], [0, 1, 1, 1, 1, 1, 2, 2])
+        self.assertEqual(log.entry(5).command.json, '{"i": 5}')
+        self.assertEqual(log.entry(7), make_entries(7, 1, term=2)[0])
+
+    def test_compact(self):
+        log = RaftLog()
+        log.extend(make_entries(1, 5))
+        log.extend(make_entries(6, 5, term=2))
+        log.compact(4, 1)
+        self.assertEqual((log.snapshot_index, log.term(4), log.last_index()), (4, 1, 10))
+        self.assertEqual(log.entry(5).command.json, '{"i": 5}')
+        self.assertEqual(log.find_first_index_of_term(2), 6)
+        self.assertEqual(log.find_first_index_of_term(3), 11)
+        log.truncate(9)
+        log.extend(make_entries(9, 1, term=3))
+        self.assertEqual(log.entry(9), make_entries(9, 1, term=3)[0])
+        # a snapshot that does not match the log replaces all of it
+        log.compact(20, 5)
+        self.assertEqual((log.snapshot_index, log.last_index(), log.last_term()), (20, 20, 5))
+        log.extend(make_entries(21, 1, term=5))
+        self.assertEqual(log.entry(21).command.json, '{"i": 21}')
+
+    def test_encoded_entry(self):
+        log = RaftLog()
+        log.extend(make_entries(1, 3))
+        log.append(raft_pb2.LogEntry(term=300, index=4, command=raft_pb2.Command(json="x" * 200)))
+        header = raft_pb2.AE_Request(term=300, leader_id=2, prev_log_index=0, leader_commit=3)
+        data = header.SerializeToString() + b"".join(log.encoded_entry(i) for i in range(1, 5))
+        expected = raft_pb2.AE_Request(term=300, leader_id=2, prev_log_index=0, leader_commit=3,
+                                       entries=[log.entry(i) for i in range(1, 5)])
+        self.assertEqual(raft_pb2.AE_Request.FromString(data), expected)
+        # the cache forgets the deleted entries
+        self.assertIs(log.encoded_entry(4), log.encoded_entry(4))
+        log.truncate(4)
+        log.append(raft_pb2.LogEntry(term=301, index=4, command=raft_pb2.Command()))
+        self.assertEqual(raft_pb2.AE_Request.FromString(log.encoded_entry(4)).entries[0], log.entry(4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import sys
+sys.path.append('../')
+import raft_pb2
+from raft_storage import RaftStorage
+
+
+def make_entries(first_index, n, term=1):
+    return [raft_pb2.LogEntry(term=term, index=i, command=raft_pb2.Command(json=f'{{"i": {i}}}'))
+            for i in range(first_index, first_index + n)]
+
+
+class RaftStorageTest(unittest.TestCase):
+    """
+    Testing the write-ahead log used by the RAFT servers
+    """
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def reopen(self, storage, segment_size=4096):
+        storage.close()
+        storage = RaftStorage(self.dirname, segment_size)
+        return storage, storage.load()
+
+    def test_empty(self):
+        storage = RaftStorage(self.dirname)
+        self.assertIsNone(storage.load())
+
+    def test_meta_and_append(self):
+        storage = RaftStorage(self.dirname, 4096)
+        storage.save_meta(3, 1)
+        storage.append(make_entries(1, 10))
+        storage.append(make_entries(11, 5, term=2))
+        storage, (term, voted_for, entries) = self.reopen(storage)
+        self.assertEqual((term, voted_for), (3, 1))
+        self.assertEqual([x.index for x in entries], list(range(1, 16)))
+        self.assertEqual(entries[-1].term, 2)
+        self.assertEqual(entries[0].command.json, '{"i": 1}')
+
+    def test_segments_and_truncate(self):
+        # small segments, so that the log spans many files
+        storage = RaftStorage(self.dirname, 100)
+        storage.save_meta(1, -1)
+        storage.append(make_entries(1, 50))
+        self.assertGreater(len(storage.segments), 5)
+
+        storage.truncate(31)
+        storage.append(make_entries(31, 3, term=5))
+        storage, (_, _, entries) = self.reopen(storage, 100)
+        self.assertEqual([x.index for x in entries], list(range(1, 34)))
+        self.assertEqual([x.term for x in entries[30:]], [5, 5, 5])
+
+        # truncate everything
+        storage.truncate(1)
+        storage, (_, _, entries) = self.reopen(storage, 100)
+        self.assertEqual(entries, [])
+        storage.append(make_entries(1, 2))
+        storage, (_, _, entries) = self.reopen(storage, 100)
+        self.assertEqual(len(entries), 2)
+
+    def test_torn_write(self):
+        storage = RaftStorage(self.dirname)
+        storage.save_meta(1, -1)
+        storage.append(make_entries(1, 5))
+        storage.close()
+        # simulate a crash in the middle of writing a record
+        filename = storage.segment_filename(1)
+        with open(filename, "ab") as f:
+            f.write(b"\x00\x00\x00\x30\x01\x02")
+        storage, (_, _, entries) = self.reopen(storage)
+        self.assertEqual(len(entries), 5)
+        storage.append(make_entries(6, 1))
+        storage, (_, _, entries) = self.reopen(storage)
+        self.assertEqual([x.index for x in entries], list(range(1, 7)))
+
+    def test_group_commit(self):
+        durable = []
+        storage = RaftStorage(self.dirname, durability="batch", on_durable=durable.append)
+        storage.save_meta(1, -1)
+        lock = threading.Lock()
+        def propose(k):
+            for _ in range(10):
+                with lock:
+                    index = storage.next_index()
+                    storage.append(make_entries(index, 1))
+                storage.wait_durable(index)
+                self.assertGreaterEqual(storage.get_durable_index(), index)
+        threads = [threading.Thread(target=propose, args=(k,)) for k in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        self.assertEqual(storage.get_durable_index(), 80)
+        # concurrent proposals share fsyncs
+        self.assertLess(len(durable), 80)
+
+    def test_durability_modes(self):
+        for durability in ("none", "entry"):
+            storage = RaftStorage(os.path.join(self.dirname, durability), durability=durability)
+            storage.append(make_entries(1, 3))
+            self.assertEqual(storage.get_durable_index(), 3)
+            storage.truncate(2)
+            self.assertEqual(storage.get_durable_index(), 1)
+            storage.close()
+
+    def test_snapshot_and_compact(self):
+        storage = RaftStorage(self.dirname, 100)
+        storage.save_meta(1, -1)
+        storage.append(make_entries(1, 50))
+        storage.save_snapshot(raft_pb2.Snapshot(last_included_index=30, last_included_term=1, data=b"state"))
+        storage.compact(30)
+        self.assertLessEqual(storage.segments[0], 31)
+        self.assertGreater(storage.first_index, 1)
+        storage.append(make_entries(51, 1))
+        storage, (_, _, entries) = self.reopen(storage, 100)
+        self.assertEqual(entries[-1].index, 51)
+        self.assertLessEqual(entries[0].index, 31)
+        self.assertEqual(storage.load_snapshot().data, b"state")
+
+        # a snapshot that replaces the whole log
+        storage.reset(101)
+        storage.append(make_entries(101, 2))
+        storage, (_, _, entries) = self.reopen(storage, 100)
+        self.assertEqual([x.index for x in entries], [101, 102])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -76,6 +76,13 @@ class StateMachineTestSellerRelated(unittest.TestCase):
         js = json.loads(response.json)
         self.assertFalse(js["success"])
         self.assertTrue("fully match" in js["message"])
+
+    def test_snapshot(self):
+        data = self.sm.take_snapshot()
+        sm = StateMachine()
+        sm.restore_snapshot(data)
+        self.assertEqual(sm.accounts, self.sm.accounts)
+        self.assertEqual(sm.auctions, self.sm.auctions)
     
     # same with seller_finish_auction
     def test_seller_start_auction(self):
@@ -102,6 +109,37 @@ class StateMachineTestSellerRelated(unittest.TestCase):
         self.assertFalse(js["success"])
         self.assertTrue("has already finished" in js["message"])
 
+    def test_progress(self):
+        progress = dict(self.sm.auctions[0], started=True, round_id=3, current_price=3)
+        # (received before the start of the auction is applied: returned once it is started)
+        self.assertTrue(self.sm.update_progress(dict(progress)))
+        request = {"op":config.BUYER_FETCH_AUCTIONS, "username":"buyer1"}
+        js = json.loads(self.sm.apply(dict(request)).json)
+        self.assertEqual(js["message"][0]["current_price"], 0)
+        self.sm.auctions[0]["started"] = True
+        self.assertFalse(self.sm.update_progress(dict(progress, round_id=2)))     # older
+        js = json.loads(self.sm.apply(request).json)
+        self.assertEqual(js["message"][0]["current_price"], 3)
+        # the progress is not in the snapshots
+        self.assertEqual(json.loads(self.sm.take_snapshot())["auctions"][0]["current_price"], 0)
+
+        # a withdrawal written to the log replaces a progress of the same round
+        update = dict(progress, buyers={"buyer1": True, "buyer2": False})
+        update["op"] = config.SELLER_UPDATE_AUCTION
+        self.assertTrue(json.loads(self.sm.apply(update).json)["success"])
+        request = {"op":config.SELLER_FETCH_AUCTIONS, "username":"test_seller"}
+        js = json.loads(self.sm.apply(request).json)
+        self.assertEqual(js["message"][0]["buyers"], {"buyer1": True, "buyer2": False})
+
+        # a finished auction has no progress any more
+        self.assertTrue(self.sm.update_progress(dict(progress, round_id=5, current_price=5)))
+        finish = dict(progress, round_id=4, op=config.SELLER_FINISH_AUCTION, username="test_seller")
+        self.assertTrue(json.loads(self.sm.apply(finish).json)["success"])
+        self.assertFalse(self.sm.update_progress(dict(progress, round_id=6)))
+        request = {"op":config.SELLER_FETCH_AUCTIONS, "username":"test_seller"}
+        js = json.loads(self.sm.apply(request).json)
+        self.assertEqual((js["message"][0]["round_id"], js["message"][0]["finished"]), (4, True))
+
 class StateMachineTestBuyerRelated(unittest.TestCase):
     """
     Testing buyer called state machine functions
@@ -228,5 +266,93 @@ class StateMachineTestBuyerRelated(unittest.TestCase):
 
 
 
+
+class StateMachineTestWatch(unittest.TestCase):
+    """
+    Testing the versions of the auctions, for the clients watching them
+    """
+
+    def setUp(self):
+        self.sm = StateMachine()
+        self.sm.apply({"op":config.LOGIN, "username":"seller", "address":"127.0.0.1:4051"}, 1)
+        self.sm.apply({"op":config.LOGIN, "username":"buyer", "address":"127.0.0.1:2048"}, 2)
+        for (index, name) in [(3, "a"), (4, "b")]:
+            self.sm.apply({"op":config.SELLER_CREATE_AUCTION, "seller_username":"seller", "auction_name":name, "item_name":"item",
+                           "base_price":0, "price_increment_period":300, "increment":1, "item_description":"description"}, index)
+
+    def watched(self, version, username="buyer"):
+        request = {"op":config.BUYER_FETCH_AUCTIONS, "username":username}
+        js = json.loads(self.sm.watched_auctions(request, version))
+        return [auction["auction_id"] for auction in js["message"]] if js["success"] else None
+
+    def test_changed_auctions(self):
+        self.assertEqual(self.watched(0), ["1", "2"])
+        self.assertEqual(self.watched(3), ["2"])
+        self.assertEqual(self.watched(4), [])
+        # only the entries that change an auction give it a new version
+        self.sm.apply({"op":config.BUYER_JOIN_AUCTION, "username":"buyer", "auction_id":"1"}, 5)
+        self.sm.apply({"op":config.BUYER_JOIN_AUCTION, "username":"nobody", "auction_id":"2"}, 6)
+        self.assertEqual(self.watched(4), ["1"])
+        self.assertEqual(self.sm.last_change, 5)
+        self.assertIsNone(self.watched(0, "nobody"))
+
+    def test_snapshot_versions(self):
+        # the versions are not in the snapshot: all the auctions get its index
+        sm = StateMachine()
+        sm.restore_snapshot(self.sm.take_snapshot(), 4)
+        self.assertEqual(sm.versions, {1: 4, 2: 4})
+        self.assertEqual(sm.last_change, 4)
+        self.sm = sm
+        self.assertEqual(self.watched(3), ["1", "2"])
+
+class StateMachineTestSessions(unittest.TestCase):
+    """
+    Testing the client sessions: a write sent several times is applied once
+    """
+
+    def setUp(self):
+        self.sm = StateMachine()
+        self.sm.accounts = {"seller":"127.0.0.1:4051"}
+
+    def create(self, name, session):
+        request = {"op":config.SELLER_CREATE_AUCTION, "seller_username":"seller", "auction_name":name, "item_name":"item",
+                   "base_price":0, "price_increment_period":300, "increment":1, "item_description":"description",
+                   "session":session}
+        return json.loads(self.sm.apply(request).json)
+
+    def test_duplicate_write(self):
+        first = self.create("a", ["c1", 1, 1, 100.0])
+        self.assertTrue(first["success"])
+        # sent again (to another replica): same response, and no other auction
+        self.assertEqual(self.create("a", ["c1", 1, 1, 101.0]), first)
+        self.assertEqual(len(self.sm.auctions), 1)
+        # another write of the client, and the same write of another client
+        self.assertTrue(self.create("b", ["c1", 2, 1, 102.0])["success"])
+        self.assertFalse(self.create("a", ["c2", 1, 1, 102.0])["success"])     # (the auction exists)
+        # the client has the response to write 1: it is not kept any more, and write 1 is not applied again
+        self.assertTrue(self.create("c", ["c1", 3, 2, 103.0])["success"])
+        self.assertEqual(list(self.sm.sessions["c1"]["responses"]), ["2", "3"])
+        self.assertFalse(self.create("d", ["c1", 1, 2, 104.0])["success"])
+        self.assertEqual(len(self.sm.auctions), 3)
+        # the sessions are in the snapshots
+        sm = StateMachine()
+        sm.restore_snapshot(self.sm.take_snapshot())
+        self.assertEqual(sm.sessions, self.sm.sessions)
+        self.assertEqual(sm.cached_response("c1", 3).json, self.sm.cached_response("c1", 3).json)
+
+    def test_eviction(self):
+        self.create("a", ["c1", 1, 1, 100.0])
+        self.create("b", ["c2", 1, 1, 100.0 + config.client_session_ttl / 2000])
+        # the session of c1 expires, and c2 is the least recently used one
+        self.create("c", ["c3", 1, 1, 100.0 + config.client_session_ttl / 1000])
+        self.assertEqual(list(self.sm.sessions), ["c2", "c3"])
+        self.max = config.client_session_max
+        config.client_session_max = 1
+        try:
+            self.create("d", ["c3", 2, 1, 101.0 + config.client_session_ttl / 1000])
+        finally:
+            config.client_session_max = self.max
+        self.assertEqual(list(self.sm.sessions), ["c3"])
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import json
+import sys
+sys.path.append('../')
+import config
+import sharding
+from server_state_machine import StateMachine
+
+
+def create_request(seller, name):
+    return {"op": config.SELLER_CREATE_AUCTION, "seller_username": seller, "auction_name": name,
+            "item_name": "item", "base_price": 0, "price_increment_period": 300, "increment": 1,
+            "item_description": "description"}
+
+
+class ShardingTest(unittest.TestCase):
+    """
+    Testing the partition of the auctions across several RAFT groups
+    """
+
+    def setUp(self):
+        self.n_shards = config.n_shards
+        config.n_shards = 3
+
+    def tearDown(self):
+        config.n_shards = self.n_shards
+
+    def test_route(self):
+        self.assertEqual(sharding.route({"op": config.LOGIN, "username": "a", "address": ""}), [0, 1, 2])
+        self.assertEqual(sharding.route({"op": config.BUYER_FETCH_AUCTIONS, "username": "a"}), [0, 1, 2])
+        for auction_id in range(1, 10):
+            self.assertEqual(sharding.route({"op": config.BUYER_JOIN_AUCTION, "username": "a", "auction_id": str(auction_id)}),
+                             [(auction_id - 1) % 3])
+        shard = sharding.shard_of_username("seller7")
+        self.assertEqual(sharding.route(create_request("seller7", "x")), [shard])
+        self.assertEqual(sharding.route({"op": config.GET_USER_ADDRESS, "username": "seller7"}), [shard])
+
+    def test_merge_responses(self):
+        request = {"op": config.SELLER_FETCH_AUCTIONS, "username": "a"}
+        responses = [{"success": True, "message": [{"auction_id": "1"}, {"auction_id": "4"}]},
+                     {"success": True, "message": [{"auction_id": "2"}]},
+                     {"success": True, "message": []}]
+        merged = sharding.merge_responses(request, responses)
+        self.assertEqual([auction["auction_id"] for auction in merged["message"]], ["1", "2", "4"])
+        failure = {"success": False, "message": "User a does not exist."}
+        self.assertEqual(sharding.merge_responses(request, responses[:1] + [failure]), failure)
+
+    def test_shard_replicas(self):
+        replicas = sharding.shard_replicas(config.replicas, 2)
+        self.assertEqual([int(r.raft_port) for r in replicas],
+                         [int(r.raft_port) + 2 * config.shard_port_offset for r in config.replicas])
+        self.assertEqual([r.client_port for r in replicas], [r.client_port for r in config.replicas])
+        # the leaders of the shards are spread over the replicas
+        self.assertEqual(len({sharding.preferred_leader(config.replicas, g) for g in range(3)}), min(3, config.n_replicas))
+
+    def test_state_machines(self):
+        # the state machine of each shard numbers its auctions in its own residue class
+        # (apply() deletes the op of the request it is given, hence the copies)
+        machines = [StateMachine(g, 3) for g in range(3)]
+        login = {"op": config.LOGIN, "username": "buyer", "address": "127.0.0.1:2048"}
+        for sm in machines:
+            sm.apply(dict(login))
+        created = []
+        for k in range(6):
+            request = create_request(f"seller{k}", f"auction{k}")
+            sm = machines[sharding.route(request)[0]]
+            sm.apply({"op": config.LOGIN, "username": f"seller{k}", "address": ""})
+            js = json.loads(sm.apply(dict(request)).json)
+            self.assertTrue(js["success"])
+            created.append(int(js["message"].split()[1]))
+        self.assertEqual(len(set(created)), 6)
+        for auction_id in created:
+            request = {"op": config.BUYER_JOIN_AUCTION, "username": "buyer", "auction_id": str(auction_id)}
+            (shard,) = sharding.route(request)
+            self.assertTrue(json.loads(machines[shard].apply(dict(request)).json)["success"])
+            # another shard does not have the auction
+            js = json.loads(machines[(shard + 1) % 3].apply(request).json)
+            self.assertFalse(js["success"])
+        fetch = {"op": config.BUYER_FETCH_AUCTIONS, "username": "buyer"}
+        merged = sharding.merge_responses(fetch, [json.loads(sm.apply(dict(fetch)).json) for sm in machines])
+        self.assertEqual([int(auction["auction_id"]) for auction in merged["message"]], sorted(created))
+
+
+if __name__ == "__main__":
+    unittest.main()
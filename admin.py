@@ -0,0 +1,121 @@
+""" Administration commands for the platform server replicas:
+
+    $ python3 admin.py transfer_leader [target_id] [shard]
+        Ask the current leader (of shard [shard], 0 if not given) to hand over its leadership to replica [target_id]
+        (or, if target_id is not given or is -1, to the most up-to-date replica), e.g. before restarting the leader. 
+        Writes are paused only while the target catches up and wins its election. 
+
+    $ python3 admin.py add_server id ip_addr client_port raft_port [learner]
+        Add replica [id] to the cluster (in every shard), e.g. a new server started with
+        'python3 server.py id ip_addr client_port raft_port', or move replica [id] to another address. 
+        It is first added as a learner, and becomes a voter once it has caught up with the log
+        (unless "learner" is given: it then stays a learner). 
+
+    $ python3 admin.py remove_server id
+        Remove replica [id] from the cluster (in every shard), e.g. before shutting it down for good. 
+
+    $ python3 admin.py metrics [shard]
+        Print the metrics of the RAFT server of every replica (for shard [shard], 0 if not given):
+        its state and term, its lease, its election timeout and heartbeat interval, the measured round trip times, ...
+"""
+import sys
+import json
+import grpc
+import raft_pb2
+import raft_pb2_grpc
+import config
+import sharding
+
+
+def transfer_leader(target_id=-1, shard=0):
+    """ Send the transfer request to all replicas of the RAFT group of [shard]; only the leader handles it.
+        Return (success, new_leader_id)
+    """
+    for replica in sharding.shard_replicas(config.replicas, shard):
+        channel = grpc.insecure_channel(replica.ip_addr + ':' + replica.raft_port)
+        stub = raft_pb2_grpc.RaftServiceStub(channel)
+        try:
+            response = stub.rpc_transfer_leadership(raft_pb2.TL_Request(target_id=target_id), timeout=5)
+        except grpc.RpcError:
+            continue
+        if response.is_leader:
+            return (response.success, response.new_leader_id)
+    return (False, -1)
+
+
+def change_membership(member, remove=False):
+    """ Send the membership change of [member] (a raft_pb2.Member) to all replicas of the RAFT group of every shard;
+        only the leader of each group handles it. 
+        Return whether the change is committed in all the shards
+    """
+    for shard in range(config.n_shards):
+        request = raft_pb2.CM_Request(member=member, remove=remove)
+        if not remove:
+            request.member.raft_port = str(int(member.raft_port) + shard * config.shard_port_offset)
+        success = False
+        for replica in sharding.shard_replicas(config.replicas, shard):
+            channel = grpc.insecure_channel(replica.ip_addr + ':' + replica.raft_port)
+            stub = raft_pb2_grpc.RaftServiceStub(channel)
+            try:
+                response = stub.rpc_change_membership(request, timeout=config.raft_membership_timeout / 1000 + 5)
+            except grpc.RpcError:
+                continue
+            if response.is_leader:
+                success = response.success
+                break
+        if not success:
+            return False
+    return True
+
+
+def get_metrics(shard=0):
+    """ The metrics of the RAFT servers of [shard] (see raft.RaftServiceServicer.get_metrics()):
+        a list with a dictionary per replica (None if it does not answer)
+    """
+    metrics = []
+    for replica in sharding.shard_replicas(config.replicas, shard):
+        channel = grpc.insecure_channel(replica.ip_addr + ':' + replica.raft_port)
+        stub = raft_pb2_grpc.RaftServiceStub(channel)
+        try:
+            metrics.append(json.loads(stub.rpc_get_metrics(raft_pb2.GM_Request(), timeout=5).json))
+        except grpc.RpcError:
+            metrics.append(None)
+    return metrics
+
+
+USAGE = """ERROR: Please use
+    python3 admin.py transfer_leader [target_id] [shard]
+    python3 admin.py add_server id ip_addr client_port raft_port [learner]
+    python3 admin.py remove_server id
+    python3 admin.py metrics [shard]"""
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(USAGE)
+        sys.exit()
+    if sys.argv[1] == "transfer_leader":
+        target_id = int(sys.argv[2]) if len(sys.argv) > 2 else -1
+        shard = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+        (success, new_leader_id) = transfer_leader(target_id, shard)
+        if success:
+            print(f"Leadership transferred to replica [{new_leader_id}]")
+        else:
+            print("Leadership transfer failed (no leader found, or the target could not catch up in time)")
+    elif sys.argv[1] == "add_server" and len(sys.argv) in [6, 7]:
+        member = raft_pb2.Member(id=int(sys.argv[2]), ip_addr=sys.argv[3], client_port=sys.argv[4], raft_port=sys.argv[5],
+                                 learner=(len(sys.argv) == 7 and sys.argv[6] == "learner"))
+        if change_membership(member):
+            print(f"Replica [{member.id}] added as a {'learner' if member.learner else 'voter'}")
+        else:
+            print("Membership change failed (no leader found, or the new replica could not catch up in time)")
+    elif sys.argv[1] == "remove_server" and len(sys.argv) == 3:
+        if change_membership(raft_pb2.Member(id=int(sys.argv[2])), remove=True):
+            print(f"Replica [{sys.argv[2]}] removed")
+        else:
+            print("Membership change failed (no leader found, or the change could not commit in time)")
+    elif sys.argv[1] == "metrics" and len(sys.argv) in [2, 3]:
+        shard = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+        for (id, metrics) in enumerate(get_metrics(shard)):
+            print(f"Replica [{id}]: " + (json.dumps(metrics) if metrics is not None else "no response"))
+    else:
+        print(USAGE)
@@ -13,7 +13,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rauction.proto\x12\x07\x61uction\"7\n\x0fUserAuctionPair\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x12\n\nauction_id\x18\x02 \x01(\t\"w\n\x14\x41nnouncePriceRequest\x12\x12\n\nauction_id\x18\x01 \x01(\t\x12\x10\n\x08round_id\x18\x02 \x01(\x03\x12\r\n\x05price\x18\x03 \x01(\x03\x12*\n\x0c\x62uyer_status\x18\x04 \x03(\x0b\x32\x14.auction.BuyerStatus\"~\n\x14\x46inishAuctionRequest\x12\x12\n\nauction_id\x18\x01 \x01(\t\x12\x17\n\x0fwinner_username\x18\x02 \x01(\t\x12\r\n\x05price\x18\x03 \x01(\x03\x12*\n\x0c\x62uyer_status\x18\x04 \x03(\x0b\x32\x14.auction.BuyerStatus\"&\n\x16PlatformServiceRequest\x12\x0c\n\x04json\x18\x01 \x01(\t\":\n\x17PlatformServiceResponse\x12\x11\n\tis_leader\x18\x01 \x01(\x08\x12\x0c\n\x04json\x18\x02 \x01(\t\"2\n\x0eSuccessMessage\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"/\n\x0b\x42uyerStatus\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61\x63tive\x18\x02 \x01(\x08\x32\xa2\x01\n\x0c\x42uyerService\x12H\n\x0e\x61nnounce_price\x12\x1d.auction.AnnouncePriceRequest\x1a\x17.auction.SuccessMessage\x12H\n\x0e\x66inish_auction\x12\x1d.auction.FinishAuctionRequest\x1a\x17.auction.SuccessMessage2N\n\rSellerService\x12=\n\x08withdraw\x12\x18.auction.UserAuctionPair\x1a\x17.auction.SuccessMessage2j\n\x0fPlatformService\x12W\n\x12rpc_platform_serve\x12\x1f.auction.PlatformServiceRequest\x1a .auction.PlatformServiceResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rauction.proto\x12\x07\x61uction\"7\n\x0fUserAuctionPair\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x12\n\nauction_id\x18\x02 \x01(\t\"w\n\x14\x41nnouncePriceRequest\x12\x12\n\nauction_id\x18\x01 \x01(\t\x12\x10\n\x08round_id\x18\x02 \x01(\x03\x12\r\n\x05price\x18\x03 \x01(\x03\x12*\n\x0c\x62uyer_status\x18\x04 \x03(\x0b\x32\x14.auction.BuyerStatus\"~\n\x14\x46inishAuctionRequest\x12\x12\n\nauction_id\x18\x01 \x01(\t\x12\x17\n\x0fwinner_username\x18\x02 \x01(\t\x12\r\n\x05price\x18\x03 \x01(\x03\x12*\n\x0c\x62uyer_status\x18\x04 \x03(\x0b\x32\x14.auction.BuyerStatus\"\x85\x01\n\x16PlatformServiceRequest\x12\x0c\n\x04json\x18\x01 \x01(\t\x12\x11\n\tmin_index\x18\x02 \x01(\x03\x12\r\n\x05shard\x18\x03 \x01(\x05\x12\x11\n\tclient_id\x18\x04 \x01(\t\x12\x10\n\x08sequence\x18\x05 \x01(\x03\x12\x16\n\x0e\x61\x63ked_sequence\x18\x06 \x01(\x03\"\x93\x01\n\x17PlatformServiceResponse\x12\x11\n\tis_leader\x18\x01 \x01(\x08\x12\x0c\n\x04json\x18\x02 \x01(\t\x12\x15\n\rapplied_index\x18\x03 \x01(\x03\x12\x15\n\rfollower_read\x18\x04 \x01(\x08\x12\x16\n\x0eleader_address\x18\x05 \x01(\t\x12\x11\n\tleader_id\x18\x06 \x01(\x05\".\n\x0f\x41uctionProgress\x12\r\n\x05shard\x18\x01 \x01(\x05\x12\x0c\n\x04json\x18\x02 \x01(\t\"W\n\x16\x41uctionProgressRequest\x12*\n\x08progress\x18\x01 \x03(\x0b\x32\x18.auction.AuctionProgress\x12\x11\n\tforwarded\x18\x02 \x01(\x08\"D\n\x14WatchAuctionsRequest\x12\x0c\n\x04json\x18\x01 \x01(\t\x12\r\n\x05shard\x18\x02 \x01(\x05\x12\x0f\n\x07version\x18\x03 \x01(\x03\"_\n\x15WatchAuctionsResponse\x12\x0c\n\x04json\x18\x01 \x01(\t\x12\x0f\n\x07version\x18\x02 \x01(\x03\x12\x0f\n\x07refused\x18\x03 \x01(\x08\x12\x16\n\x0eleader_address\x18\x04 \x01(\t\"2\n\x0eSuccessMessage\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"/\n\x0b\x42uyerStatus\x12\x10\n\x08username\x18\x01 \x01(\t\x12\x0e\n\x06\x61\x63tive\x18\x02 \x01(\x08\x32\xa2\x01\n\x0c\x42uyerService\x12H\n\x0e\x61nnounce_price\x12\x1d.auction.AnnouncePriceRequest\x1a\x17.auction.SuccessMessage\x12H\n\x0e\x66inish_auction\x12\x1d.auction.FinishAuctionRequest\x1a\x17.auction.SuccessMessage2N\n\rSellerService\x12=\n\x08withdraw\x12\x18.auction.UserAuctionPair\x1a\x17.auction.SuccessMessage2\x99\x02\n\x0fPlatformService\x12Y\n\x12rpc_platform_serve\x12\x1f.auction.PlatformServiceRequest\x1a .auction.PlatformServiceResponse\"\x00\x12R\n\x14rpc_auction_progress\x12\x1f.auction.AuctionProgressRequest\x1a\x17.auction.SuccessMessage\"\x00\x12W\n\x12rpc_watch_auctions\x12\x1d.auction.WatchAuctionsRequest\x1a\x1e.auction.WatchAuctionsResponse\"\x00\x30\x01\x62\x06proto3')
 
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'auction_pb2', globals())
@@ -26,18 +26,26 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _ANNOUNCEPRICEREQUEST._serialized_end=202
   _FINISHAUCTIONREQUEST._serialized_start=204
   _FINISHAUCTIONREQUEST._serialized_end=330
-  _PLATFORMSERVICEREQUEST._serialized_start=332
-  _PLATFORMSERVICEREQUEST._serialized_end=370
-  _PLATFORMSERVICERESPONSE._serialized_start=372
-  _PLATFORMSERVICERESPONSE._serialized_end=430
-  _SUCCESSMESSAGE._serialized_start=432
-  _SUCCESSMESSAGE._serialized_end=482
-  _BUYERSTATUS._serialized_start=484
-  _BUYERSTATUS._serialized_end=531
-  _BUYERSERVICE._serialized_start=534
-  _BUYERSERVICE._serialized_end=696
-  _SELLERSERVICE._serialized_start=698
-  _SELLERSERVICE._serialized_end=776
-  _PLATFORMSERVICE._serialized_start=778
-  _PLATFORMSERVICE._serialized_end=884
+  _PLATFORMSERVICEREQUEST._serialized_start=333
+  _PLATFORMSERVICEREQUEST._serialized_end=466
+  _PLATFORMSERVICERESPONSE._serialized_start=469
+  _PLATFORMSERVICERESPONSE._serialized_end=616
+  _AUCTIONPROGRESS._serialized_start=618
+  _AUCTIONPROGRESS._serialized_end=664
+  _AUCTIONPROGRESSREQUEST._serialized_start=666
+  _AUCTIONPROGRESSREQUEST._serialized_end=753
+  _WATCHAUCTIONSREQUEST._serialized_start=755
+  _WATCHAUCTIONSREQUEST._serialized_end=823
+  _WATCHAUCTIONSRESPONSE._serialized_start=825
+  _WATCHAUCTIONSRESPONSE._serialized_end=920
+  _SUCCESSMESSAGE._serialized_start=922
+  _SUCCESSMESSAGE._serialized_end=972
+  _BUYERSTATUS._serialized_start=974
+  _BUYERSTATUS._serialized_end=1021
+  _BUYERSERVICE._serialized_start=1024
+  _BUYERSERVICE._serialized_end=1186
+  _SELLERSERVICE._serialized_start=1188
+  _SELLERSERVICE._serialized_end=1266
+  _PLATFORMSERVICE._serialized_start=1269
+  _PLATFORMSERVICE._serialized_end=1550
 # @@protoc_insertion_point(module_scope)
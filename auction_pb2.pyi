@@ -17,6 +17,22 @@ class AnnouncePriceRequest(_message.Message):
     round_id: int
     def __init__(self, auction_id: _Optional[str] = ..., round_id: _Optional[int] = ..., price: _Optional[int] = ..., buyer_status: _Optional[_Iterable[_Union[BuyerStatus, _Mapping]]] = ...) -> None: ...
 
+class AuctionProgress(_message.Message):
+    __slots__ = ["json", "shard"]
+    JSON_FIELD_NUMBER: _ClassVar[int]
+    SHARD_FIELD_NUMBER: _ClassVar[int]
+    json: str
+    shard: int
+    def __init__(self, shard: _Optional[int] = ..., json: _Optional[str] = ...) -> None: ...
+
+class AuctionProgressRequest(_message.Message):
+    __slots__ = ["forwarded", "progress"]
+    FORWARDED_FIELD_NUMBER: _ClassVar[int]
+    PROGRESS_FIELD_NUMBER: _ClassVar[int]
+    forwarded: bool
+    progress: _containers.RepeatedCompositeFieldContainer[AuctionProgress]
+    def __init__(self, progress: _Optional[_Iterable[_Union[AuctionProgress, _Mapping]]] = ..., forwarded: bool = ...) -> None: ...
+
 class BuyerStatus(_message.Message):
     __slots__ = ["active", "username"]
     ACTIVE_FIELD_NUMBER: _ClassVar[int]
@@ -38,18 +54,36 @@ class FinishAuctionRequest(_message.Message):
     def __init__(self, auction_id: _Optional[str] = ..., winner_username: _Optional[str] = ..., price: _Optional[int] = ..., buyer_status: _Optional[_Iterable[_Union[BuyerStatus, _Mapping]]] = ...) -> None: ...
 
 class PlatformServiceRequest(_message.Message):
-    __slots__ = ["json"]
+    __slots__ = ["acked_sequence", "client_id", "json", "min_index", "sequence", "shard"]
+    ACKED_SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    CLIENT_ID_FIELD_NUMBER: _ClassVar[int]
     JSON_FIELD_NUMBER: _ClassVar[int]
+    MIN_INDEX_FIELD_NUMBER: _ClassVar[int]
+    SEQUENCE_FIELD_NUMBER: _ClassVar[int]
+    SHARD_FIELD_NUMBER: _ClassVar[int]
+    acked_sequence: int
+    client_id: str
     json: str
-    def __init__(self, json: _Optional[str] = ...) -> None: ...
+    min_index: int
+    sequence: int
+    shard: int
+    def __init__(self, json: _Optional[str] = ..., min_index: _Optional[int] = ..., shard: _Optional[int] = ..., client_id: _Optional[str] = ..., sequence: _Optional[int] = ..., acked_sequence: _Optional[int] = ...) -> None: ...
 
 class PlatformServiceResponse(_message.Message):
-    __slots__ = ["is_leader", "json"]
+    __slots__ = ["applied_index", "follower_read", "is_leader", "json", "leader_address", "leader_id"]
+    APPLIED_INDEX_FIELD_NUMBER: _ClassVar[int]
+    FOLLOWER_READ_FIELD_NUMBER: _ClassVar[int]
     IS_LEADER_FIELD_NUMBER: _ClassVar[int]
     JSON_FIELD_NUMBER: _ClassVar[int]
+    LEADER_ADDRESS_FIELD_NUMBER: _ClassVar[int]
+    LEADER_ID_FIELD_NUMBER: _ClassVar[int]
+    applied_index: int
+    follower_read: bool
     is_leader: bool
     json: str
-    def __init__(self, is_leader: bool = ..., json: _Optional[str] = ...) -> None: ...
+    leader_address: str
+    leader_id: int
+    def __init__(self, is_leader: bool = ..., json: _Optional[str] = ..., applied_index: _Optional[int] = ..., follower_read: bool = ..., leader_address: _Optional[str] = ..., leader_id: _Optional[int] = ...) -> None: ...
 
 class SuccessMessage(_message.Message):
     __slots__ = ["message", "success"]
@@ -66,3 +100,25 @@ class UserAuctionPair(_message.Message):
     auction_id: str
     username: str
     def __init__(self, username: _Optional[str] = ..., auction_id: _Optional[str] = ...) -> None: ...
+
+class WatchAuctionsRequest(_message.Message):
+    __slots__ = ["json", "shard", "version"]
+    JSON_FIELD_NUMBER: _ClassVar[int]
+    SHARD_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
+    json: str
+    shard: int
+    version: int
+    def __init__(self, json: _Optional[str] = ..., shard: _Optional[int] = ..., version: _Optional[int] = ...) -> None: ...
+
+class WatchAuctionsResponse(_message.Message):
+    __slots__ = ["json", "leader_address", "refused", "version"]
+    JSON_FIELD_NUMBER: _ClassVar[int]
+    LEADER_ADDRESS_FIELD_NUMBER: _ClassVar[int]
+    REFUSED_FIELD_NUMBER: _ClassVar[int]
+    VERSION_FIELD_NUMBER: _ClassVar[int]
+    json: str
+    leader_address: str
+    refused: bool
+    version: int
+    def __init__(self, json: _Optional[str] = ..., version: _Optional[int] = ..., refused: bool = ..., leader_address: _Optional[str] = ...) -> None: ...
@@ -174,6 +174,16 @@ class PlatformServiceStub(object):
                 request_serializer=auction__pb2.PlatformServiceRequest.SerializeToString,
                 response_deserializer=auction__pb2.PlatformServiceResponse.FromString,
                 )
+        self.rpc_auction_progress = channel.unary_unary(
+                '/auction.PlatformService/rpc_auction_progress',
+                request_serializer=auction__pb2.AuctionProgressRequest.SerializeToString,
+                response_deserializer=auction__pb2.SuccessMessage.FromString,
+                )
+        self.rpc_watch_auctions = channel.unary_stream(
+                '/auction.PlatformService/rpc_watch_auctions',
+                request_serializer=auction__pb2.WatchAuctionsRequest.SerializeToString,
+                response_deserializer=auction__pb2.WatchAuctionsResponse.FromString,
+                )
 
 
 class PlatformServiceServicer(object):
@@ -185,6 +195,18 @@ class PlatformServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def rpc_auction_progress(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def rpc_watch_auctions(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_PlatformServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -193,6 +215,16 @@ def add_PlatformServiceServicer_to_server(servicer, server):
                     request_deserializer=auction__pb2.PlatformServiceRequest.FromString,
                     response_serializer=auction__pb2.PlatformServiceResponse.SerializeToString,
             ),
+            'rpc_auction_progress': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_auction_progress,
+                    request_deserializer=auction__pb2.AuctionProgressRequest.FromString,
+                    response_serializer=auction__pb2.SuccessMessage.SerializeToString,
+            ),
+            'rpc_watch_auctions': grpc.unary_stream_rpc_method_handler(
+                    servicer.rpc_watch_auctions,
+                    request_deserializer=auction__pb2.WatchAuctionsRequest.FromString,
+                    response_serializer=auction__pb2.WatchAuctionsResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'auction.PlatformService', rpc_method_handlers)
@@ -219,3 +251,37 @@ class PlatformService(object):
             auction__pb2.PlatformServiceResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_auction_progress(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/auction.PlatformService/rpc_auction_progress',
+            auction__pb2.AuctionProgressRequest.SerializeToString,
+            auction__pb2.SuccessMessage.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_watch_auctions(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/auction.PlatformService/rpc_watch_auctions',
+            auction__pb2.WatchAuctionsRequest.SerializeToString,
+            auction__pb2.WatchAuctionsResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -12,6 +12,7 @@ import time
 import threading
 import copy
 
+import config
 import utils
 from utils import UserData, AuctionData, ItemData, price_to_string
 
@@ -81,7 +82,7 @@ class Buyer(QObject):
         threading.Thread(target=rpc_server.wait_for_termination, daemon=True).start()
         print(f"Buyer {self.data.username} RPC server started at {rpc_address}.")
 
-        # Start a loop to periodically fetch data from the platform and update the UI.
+        # Start a loop to get the data from the platform (as it changes, see data_fetch_loop()) and update the UI.
         threading.Thread(target = self.data_fetch_loop, daemon=True).start()
 
         # Finally, update UI (by emitting signal to notify the UI component)
@@ -250,18 +251,39 @@ class Buyer(QObject):
 
 
     def data_fetch_loop(self):
+        # The auctions come from the platform as they change (see utils.watch_auctions()),
+        # unless config.watch_auctions is off: then, all of them are fetched every second
+        if config.watch_auctions:
+            request = { "op": "BUYER_FETCH_AUCTIONS",
+                        "username": self.data.username }
+            utils.watch_auctions(request, self.server_stubs, self.handle_watched_auctions)
         while True:
-            self.fetch_auctions_from_server_and_update()  # first, fetch all auctions from server
+            if not config.watch_auctions:
+                self.fetch_auctions_from_server_and_update()  # first, fetch all auctions from server
             self.update_seller_address_in_all_auctions()  # then, update the addresses of sellers in those auctions
             time.sleep(1)
     
 
+    def handle_watched_auctions(self, auctions):
+        """ The platform sends the auctions that changed (dictionaries): update the local data. """
+        list_of_auctions = []
+        for d in auctions:
+            a = AuctionData()
+            a.update_from_dict(d)
+            list_of_auctions.append(a)
+        self.update_auctions_from_platform(list_of_auctions)
+    
+
     def fetch_auctions_from_server_and_update(self):
         """ Fetch all auctions from the platform to update the local data. """
-        auction_list_needs_update = False   # records whether the auciton list in the UI needs to be updated
         ok, platform_auctions = self.get_all_auctions_from_server()
         if not ok: return 
+        self.update_auctions_from_platform(platform_auctions)
+    
 
+    def update_auctions_from_platform(self, platform_auctions):
+        """ Update the local data with auctions from the platform (a list of AuctionData). """
+        auction_list_needs_update = False   # records whether the auciton list in the UI needs to be updated
         for pa in platform_auctions:
             with self.data.lock:
                 if pa.id in self.data.auctions:
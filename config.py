@@ -5,15 +5,17 @@ need_persistent = False      # whether we need our servers to be persistent
 local = True        # whether to run the system locally
 
 class ServerInfo():
-    def __init__(self, id, ip_addr, client_port, raft_port):
+    def __init__(self, id, ip_addr, client_port, raft_port, learner=False):
         self.id = id, 
         self.ip_addr = ip_addr
         self.client_port = client_port
         self.raft_port = raft_port
+        self.learner = learner    # a learner receives the log and serves reads, but does not vote or count toward quorum
 
 replicas = ( ServerInfo(0, "127.0.0.1", "20000", "30000"), 
              ServerInfo(1, "127.0.0.1", "20010", "30010"), 
              ServerInfo(2, "127.0.0.1", "20020", "30020"), 
+             # ServerInfo(3, "127.0.0.1", "20030", "30030", learner=True),   # e.g., a learner for read traffic
            )
 
 if local:
@@ -24,9 +26,119 @@ n_replicas = len(replicas)
 # assert n_replicas > 2*F
 
 
-leader_broadcast_interval = 40  # millisecond
+# Implementation of the RAFT servers:
+#   "threads" : raft.RaftServiceServicer, a thread pool gRPC server and one thread per replicator
+#   "asyncio" : raft_aio.AsyncRaftServiceServicer, the same protocol and persistence on one asyncio event loop (grpc.aio)
+raft_implementation = "threads"
+
+leader_broadcast_interval = 40  # millisecond (only if raft_adaptive_timeouts is False, see below)
 election_timeout_lower_bound = 200
 election_timeout_upper_bound = 400
+raft_rpc_timeout = 500          # millisecond, deadline of append_entries / install_snapshot RPCs
+raft_pre_vote = True            # ask the voters with a pre-vote round before starting an election (no term inflation)
+raft_check_quorum = True        # a leader that has not heard from a majority for election_timeout_upper_bound steps down
+raft_membership_timeout = 10000  # millisecond, how long a membership change (python3 admin.py add_server / remove_server)
+                                 # waits for a new member to catch up and for the configuration entries to commit
+
+# Adaptive timeouts: the Leader measures the round trip times of its append_entries requests to the voters
+# (they include the time the followers take to write the entries), the voters report their apply latencies
+# (from when RAFT gives committed entries to the server until they are applied), and the Leader measures how late its
+# own heartbeats are (GC pauses, a loaded host). It derives the election timeout from their 99th percentiles:
+# raft_timeout_rtt_factor * (RTT + apply latency + delay), within [raft_election_timeout_min, raft_election_timeout_max].
+# The heartbeat interval is then election timeout / raft_heartbeats_per_timeout, and the followers use the
+# election timeout of their Leader. election_timeout_lower_bound is the initial election timeout (the heartbeat interval
+# is then election_timeout_lower_bound / raft_heartbeats_per_timeout); leader_broadcast_interval is only used if
+# raft_adaptive_timeouts is False, with the fixed election timeouts. Elections are randomized in [t, t * upper_bound / lower_bound].
+# The leader lease lasts raft_election_timeout_min - raft_lease_clock_drift, since no server uses a shorter timeout. 
+raft_adaptive_timeouts = True
+raft_election_timeout_min = 150         # millisecond
+raft_election_timeout_max = 2000        # millisecond
+raft_timeout_rtt_factor = 10
+raft_heartbeats_per_timeout = 5
+raft_rtt_window = 256                   # number of samples kept (per follower, and of heartbeat delays)
+raft_timeout_update_interval = 1000     # millisecond, how often the Leader updates the timeouts
+
+# Replication from the leader to each follower
+raft_max_inflight_append = 4               # max number of pipelined append_entries requests in flight per follower
+raft_max_append_entries = 512              # max number of entries in one append_entries request
+raft_max_append_bytes = 1024 * 1024        # max size (bytes) of the entries in one append_entries request
+raft_entry_cache_size = 4096               # number of encoded log entries kept by the leader, to assemble append_entries requests
+
+raft_wal_segment_size = 4 * 1024 * 1024   # bytes, size of a RAFT write-ahead log segment file
+
+# How RAFT log entries are made durable (only used when need_persistent = True):
+#   "none"  : never fsync (fastest, entries may be lost if the machine crashes)
+#   "batch" : group commit, entries written within a short window are fsync-ed together
+#   "entry" : fsync every entry before returning (slowest)
+raft_durability = "batch"
+raft_group_commit_window = 2              # millisecond, how long a group commit waits for more entries
+raft_group_commit_bytes = 256 * 1024      # bytes, a group commit starts right away once this many bytes are pending
+
+raft_snapshot_threshold = 1000    # take a snapshot of the state machine after this many entries are applied since the last one
+raft_max_apply_batch = 256       # max number of committed entries given to the server at once
+
+# How the leader serves read-only platform requests (PLATFORM_READ_ONLY_OP):
+#   "read_index" : confirm the leadership by a round of heartbeats before each read (batched among concurrent reads)
+#   "lease"      : serve reads locally, without any round trip, while a majority has acked the leader within
+#                  election_timeout_lower_bound - raft_lease_clock_drift. Assumes bounded clock drift between servers. 
+raft_read_mode = "read_index"
+raft_lease_clock_drift = 50       # millisecond, safety margin of the leader lease
+
+# Every raft_metrics_log_interval, a server logs the metrics of its RAFT servers (state, lease, timeouts, round trip
+# times, see RaftServiceServicer.get_metrics()); 0 to never log them. They are also given by 'python3 admin.py metrics'
+raft_metrics_log_interval = 10000   # millisecond
+
+# Follower reads: followers and learners serve FOLLOWER_READ_OP from their own state machine,
+# once they have applied the log up to the min_index given by the client (the latest index the client has seen)
+follower_reads = True
+follower_read_timeout = 200       # millisecond, how long a follower waits to catch up with min_index before refusing
+
+# Multi-RAFT (see sharding.py): the auctions are partitioned into n_shards shards, each replicated by its own RAFT group,
+# and every server hosts one RAFT instance per shard (the group of shard g uses raft_port + g * shard_port_offset).
+# Accounts are replicated to every shard. With shard_balance_leaders, the leader of shard g hands over its leadership
+# to the g-th voter (modulo the number of voters) whenever it can, so the leaders are spread across the replicas. 
+n_shards = 1
+shard_port_offset = 1000
+shard_balance_leaders = True
+shard_balance_interval = 2000     # millisecond, how often a server checks the leaders of its shards
+
+# Auction progress channel: sellers send the progress of their started auctions (price, round) every second
+# as soft state (see StateMachine.update_progress()), instead of SELLER_UPDATE_AUCTION requests in the RAFT log.
+# A server keeps the latest progress of each auction in memory and forwards what it receives to the other servers,
+# in batches (one per auction_progress_forward_interval, with the latest progress of each auction). 
+# Only the state transitions (start, finish, withdrawals of buyers) go through the log. 
+auction_progress_channel = True
+auction_progress_forward_interval = 100   # millisecond
+auction_progress_timeout = 500            # millisecond, deadline of a progress RPC
+
+# Watching the auctions (see server.RaftShard.watch() and utils.watch_auctions()): buyers and sellers get the auctions
+# through a stream, which sends them all, then the ones changed by the applied entries, instead of fetching them
+# every second. A server sends an empty response every watch_keepalive_interval without changes, and a client that
+# gets nothing for watch_timeout reconnects (to any replica, from the version it has). A server serves at most
+# watch_max_streams watches; a refused client fetches the auctions, and tries again after watch_retry_interval. 
+watch_auctions = True
+watch_keepalive_interval = 1000     # millisecond
+watch_timeout = 5000                # millisecond
+watch_retry_interval = 1000         # millisecond
+watch_max_streams = 256
+
+# Client sessions (see StateMachine.apply()): every client numbers its writes, and the state machine of each shard
+# keeps the responses to the latest writes of each client, so that a write sent again (e.g. to another replica after
+# a failed call) is answered from there instead of being applied twice. A session expires client_session_ttl after
+# the last write of the client (by the clock of the leaders), and at most client_session_max sessions are kept
+# (the least recently used one is evicted first), with at most client_session_max_responses responses each. 
+client_session_ttl = 600000            # millisecond
+client_session_max = 10000
+client_session_max_responses = 64
+
+platform_write_timeout = 10000   # millisecond, how long a write (or a read, for its read index) waits to be applied at most (or until the deadline of the client)
+
+# Client routing (see utils.rpc_to_shard()): a client sends its requests to the leader it knows of, follows the leader
+# hints of the servers that are not the leader (at most client_max_hops), and otherwise sends the request to all the
+# replicas at once, with a shorter deadline
+client_rpc_timeout = 5000       # millisecond
+client_probe_timeout = 1000     # millisecond
+client_max_hops = 3
 
 SERVER_ERROR = 190
 
@@ -43,6 +155,8 @@ SELLER_FINISH_AUCTION = "SELLER_FINISH_AUCTION"
 SELLER_FETCH_AUCTIONS = "SELLER_FETCH_AUCTIONS"
 SELLER_UPDATE_AUCTION = "SELLER_UPDATE_AUCTION"
 PLATFORM_READ_ONLY_OP = [GET_USER_ADDRESS, BUYER_FETCH_AUCTIONS, SELLER_FETCH_AUCTIONS]
+FOLLOWER_READ_OP = [BUYER_FETCH_AUCTIONS, SELLER_FETCH_AUCTIONS]    # read-only ops that followers may serve
+SCATTER_GATHER_OP = [BUYER_FETCH_AUCTIONS, SELLER_FETCH_AUCTIONS]   # ops sent to every shard, whose results are merged
 
 OPERATION_NOT_SUPPORTED = 404
 
@@ -0,0 +1,77 @@
+""" The results that a platform server waits for: the responses to the requests it added to its RAFT log
+    as the leader, by log index (see RaftShard.serve()).
+    Each request gets a concurrent.futures.Future when it is added to the log, which is resolved when the entry
+    at its index is applied:
+      - with the response, if the entry is still the one of the request (same term),
+      - with None if another entry has replaced it (e.g. the leader changed before the request was committed),
+        if a snapshot covers it (its response is unknown), or if the server stops.
+    Entries are removed as soon as they are resolved, or when their waiter gives up (see cancel()),
+    so the table only holds the requests in progress.
+    An entry is removed and its Future resolved (or cancelled) under the lock, so a Future is settled only once
+    even if its waiter gives up while its entry is applied.
+"""
+import threading
+from concurrent.futures import Future
+
+
+class PendingResults:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = dict()       # index -> (term, Future)
+
+
+    """ Number of requests waiting for their results """
+    def __len__(self):
+        with self.lock:
+            return len(self.pending)
+
+
+    """ Register the request added to the log at [index] in term [term], and return its Future.
+        A request still waiting at the same index (of an older term) cannot be committed any more: it fails.
+    """
+    def register(self, index, term):
+        future = Future()
+        with self.lock:
+            old = self.pending.pop(index, None)
+            self.pending[index] = (term, future)
+            if old is not None:
+                old[1].set_result(None)
+        return future
+
+
+    """ The entry at [index], of term [term], has been applied, with [response] (None if it has no response):
+        resolve the request waiting at [index], if any
+    """
+    def deliver(self, index, term, response):
+        with self.lock:
+            pending = self.pending.pop(index, None)
+            if pending is not None:
+                pending[1].set_result(response if pending[0] == term else None)
+
+
+    """ The state machine was replaced by a snapshot up to [index]: the requests up to it fail """
+    def fail_through(self, index):
+        with self.lock:
+            failed = [self.pending.pop(i) for i in [i for i in self.pending if i <= index]]
+            for (term, future) in failed:
+                future.set_result(None)
+
+
+    """ All the requests fail (e.g. the server stops) """
+    def fail_all(self):
+        with self.lock:
+            failed = list(self.pending.values())
+            self.pending = dict()
+            for (term, future) in failed:
+                future.set_result(None)
+
+
+    """ The waiter of the request at [index] gives up (e.g. its deadline has passed): forget its [future]. 
+        If it has been resolved in the meantime, it keeps its result. 
+    """
+    def cancel(self, index, future):
+        with self.lock:
+            if index in self.pending and self.pending[index][1] is future:
+                del self.pending[index]
+                future.cancel()
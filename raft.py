@@ -11,10 +11,15 @@ import raft_pb2_grpc
 import threading
 import queue
 import random
+import json
 
 import os
+import time
 from time import sleep
+from collections import deque
 import config
+from raft_storage import RaftStorage
+from raft_log import RaftLog
 
 Follower = 0
 Candidate = 1
@@ -28,17 +33,68 @@ class DEBUG:
         return str(s)
 
 
+""" An append_entries request made by the Leader (see make_append_entries_request()):
+    [header] is a raft_pb2.AE_Request without entries, and [entries] the encoded entries (see RaftLog.encoded_entry()).
+    Its fields read like those of the raft_pb2.AE_Request (request.term, len(request.entries), ...),
+    and it is serialized by concatenation, without building nor copying any raft_pb2.LogEntry. 
+"""
+class EncodedAERequest:
+    def __init__(self, header, entries):
+        self.header = header
+        self.entries = entries
+
+    def __getattr__(self, name):
+        return getattr(self.header, name)
+
+    def SerializeToString(self):
+        return self.header.SerializeToString() + b"".join(self.entries)
+
+
+""" A stub of RAFT server at [channel] (grpc.Channel or grpc.aio.Channel),
+    whose rpc_append_entries sends EncodedAERequest objects
+"""
+def make_raft_stub(channel):
+    stub = raft_pb2_grpc.RaftServiceStub(channel)
+    stub.rpc_append_entries = channel.unary_unary('/raft.RaftService/rpc_append_entries',
+                                                  request_serializer=EncodedAERequest.SerializeToString,
+                                                  response_deserializer=raft_pb2.AE_Response.FromString)
+    return stub
+
+
+""" The [q]-quantile (0 <= q <= 1) of the numbers in [samples] (a non-empty collection) """
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[int(q * (len(samples) - 1))]
+
+
+""" The configuration (raft_pb2.Membership) of [replicas]: a list of config.ServerInfo indexed by id,
+    with None for the ids that are not members
+"""
+def make_membership(replicas):
+    membership = raft_pb2.Membership()
+    for i in range(len(replicas)):
+        if replicas[i] is not None:
+            membership.members.append(raft_pb2.Member(id=i, ip_addr=replicas[i].ip_addr, client_port=replicas[i].client_port,
+                                                      raft_port=replicas[i].raft_port,
+                                                      learner=getattr(replicas[i], "learner", False)))
+    return membership
+
+
 class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
 
     """" Initialization of a RAFT server:
          - Input:
-             replicas    : List of the addresses and ports of all replicas
+             replicas    : List of the addresses and ports of all replicas, indexed by id
+                           (the initial members; the configuration entries of the log change them)
              my_id       : The id of the current server replica
              apply_queue : Given by the High-layer server. 
-                           RAFT server puts to this queue log entries that have been commited.
+                           RAFT server puts to this queue, in order, lists of consecutive log entries
+                           that have been commited, or a raft_pb2.Snapshot that replaces the state machine. 
                            The upper-layer server will pick entires from this queue to execute. 
+             group       : The id of the RAFT group, when each server hosts several (one per shard, see sharding.py):
+                           each group has its own log and persistent states. 
     """
-    def __init__(self, replicas, my_id, apply_queue, need_persistent=True):
+    def __init__(self, replicas, my_id, apply_queue, need_persistent=True, group=0):
         super().__init__()
 
         self.lock = threading.Lock()
@@ -47,106 +103,342 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         ## Persistent states: 
         self.current_term = 0
         self.voted_for = -1
-        dummy_command = raft_pb2.Command()
-        self.logs = [raft_pb2.LogEntry(term=0, index=0, command=dummy_command)]
+        self.saved_meta = None     # the (current_term, voted_for) on disk, see save()
+        self.logs = RaftLog()   # the log entries, stored compactly (see raft_log.py)
         # (index of the first "real" log entry is 1)
 
+        # Log compaction: entries up to snapshot_index are replaced by a snapshot of the state machine.
+        # The log then starts with a dummy entry with index snapshot_index and term snapshot_term
+        self.snapshot_index = 0
+        self.snapshot_term = 0
+        self.snapshot_data = b""
+
         ## Volatile states: 
         self.commit_index = 0  # index of highest log entry known to be committed
         self.last_applied = 0  # index of the highest log entry applied to state machine
+                               # (i.e., given to the upper-layer server through apply_queue)
+
+        # The applier thread (see apply_loop()) is the only one that puts to apply_queue
+        self.apply_cond = threading.Condition(self.lock)   # notifies the applier
+        self.pending_snapshot = None   # a raft_pb2.Snapshot to give to the upper-layer server before the next entries
         
         self.state = Follower
 
         ## Set up information for other replicas
         self.my_id = my_id
-        self.replicas = replicas
+        self.my_info = replicas[my_id]      # (my address)
+        # The members of the cluster are given by the configuration in effect (see apply_membership()):
+        #   replicas[i] is the address of member i (None if i is not a member), replica_stubs[i] its stub,
+        #   and the states of the replicas are lists indexed by id, of length n_replicas (the largest id + 1). 
+        # Learners receive the log like the other replicas, but do not vote, never become candidates,
+        # and do not count toward any majority. The other members are voters. 
+        self.replicas = list(replicas)
         self.n_replicas = len(replicas)     # number of replicas
-        self.replica_stubs = []
-        for i in range(self.n_replicas):
-            if (i != my_id):
-                channel = grpc.insecure_channel(replicas[i].ip_addr + ':' + replicas[i].raft_port)
-                s = raft_pb2_grpc.RaftServiceStub(channel)
-                self.replica_stubs.append(s)
-            else:
-                self.replica_stubs.append(None)
+        self.replica_stubs = [None for i in range(self.n_replicas)]
+        self.voters = []
+        self.n_voters = 0
+        self.is_learner = True
+        self.replicators = set()        # the followers whose replicator is running
+        self.started = False            # set by my_start()
         
         # Leader's states: reinitialized after election
         self.match_index = None
         self.next_index = None
 
+        # Proposals: new_entry() adds client commands to the log, and the proposer thread (see propose_loop())
+        #   writes all the entries proposed since its last run to the WAL at once and wakes up the replicators
+        self.proposal_cond = threading.Condition(self.lock)   # notifies the proposer
+        self.proposals = []     # entries in the log of the Leader that have not been written to the WAL yet
+
+        # Replication: one replicator thread per follower (see replicate_loop())
+        self.replicate_cond = threading.Condition(self.lock)   # notifies the replicators
+        self.inflight = [0 for i in range(self.n_replicas)]        # number of requests in flight to each follower
+        self.heartbeat_due = [False for i in range(self.n_replicas)]  # whether a heartbeat should be sent now
+        self.pipeline_epoch = [0 for i in range(self.n_replicas)]  # incremented when a pipeline restarts
+
+        # ReadIndex: the Leader confirms it is still the Leader by a round of heartbeats before serving a read.
+        #   Every request sent by a replicator is tagged with the current heartbeat_round,
+        #   acked_round[id] is the latest round to which follower [id] has responded in the current term. 
+        self.read_cond = threading.Condition(self.lock)   # notifies the reads waiting for a round or a commit
+        self.heartbeat_round = 0
+        self.acked_round = [0 for i in range(self.n_replicas)]
+        self.read_round_wanted = 0      # the round that waiting reads need
+        self.read_round_started = 0     # the last round started for reads
+
+        # Leader lease (config.raft_read_mode = "lease"): acked_time[id] is the time (time.monotonic())
+        #   when the Leader sent the latest request that follower [id] has responded to in the current term. 
+        #   Followers do not vote for another server within their election timeout after hearing
+        #   from their Leader, so the Leader keeps its leadership (and can serve reads locally)
+        #   until a shorter time after a majority acked (see get_lease_expiry()). 
+        self.acked_time = [0 for i in range(self.n_replicas)]
+        self.lease_holding = False      # whether the lease was valid at the last check (for logging)
+        self.last_heard_leader = 0      # time when this server last heard from a Leader of the current term
+        self.leader_id = -1             # the Leader of the current term, -1 if unknown (given to clients, see get_leader())
+        self.lease_reads = 0            # number of reads served with the lease
+        self.read_index_reads = 0       # number of reads served with a round of heartbeats
+
         # events: used to notify the main loop
         self.heard_heartbeat = False
         self.grant_vote = False
         self.received_majority_vote = threading.Event()
 
+        # PreVote (config.raft_pre_vote): before starting an election, a server asks the voters
+        #   whether they would vote for it in the next term, without changing any term. 
+        #   So a server that cannot win (e.g., it was partitioned) does not inflate the terms and depose the Leader. 
+        self.pre_vote_term = 0          # the term asked about in the current pre-vote round
+        self.pre_vote_count = 0
+        self.received_majority_pre_vote = threading.Event()
+        # Check-quorum (config.raft_check_quorum): a Leader that has not heard from a majority
+        #   for the upper bound of its election timeout steps down. 
+        self.leader_since = 0           # time when this server became the Leader
+
+        # Leadership transfer (see transfer_leadership()): the Leader stops accepting proposals,
+        #   brings the target up to date, then tells it to start an election at once (rpc_timeout_now)
+        self.transfer_target = -1       # the target of the transfer in progress, -1 if none
+        self.transfer_deadline = 0      # the transfer is given up after this time
+        self.timeout_now_sent = False
+
+        # Timeouts (in ms, see set_election_timeout()): adapted by the Leader if config.raft_adaptive_timeouts,
+        #   from the round trip times of its append_entries requests to each follower (rtt_samples[id], in seconds),
+        #   the apply latencies the followers report (follower_apply_latency[id], their 99th percentiles in seconds)
+        #   and how late its heartbeats are sent (heartbeat_delays, in seconds). See adapt_timeouts(). 
+        self.rtt_samples = [deque(maxlen=config.raft_rtt_window) for i in range(self.n_replicas)]
+        self.follower_apply_latency = [0.0] * self.n_replicas
+        self.heartbeat_delays = deque(maxlen=config.raft_rtt_window)
+        # Apply latency of this server (see applied()): (last index, time) of the batches given to the upper-level
+        #   server and not applied yet, the latencies of the last batches (in seconds), and their 99th percentile
+        self.handed_out = deque(maxlen=config.raft_rtt_window)
+        self.apply_latencies = deque(maxlen=config.raft_rtt_window)
+        self.apply_latency_p99 = 0.0
+        self.timeouts_updated = 0       # time of the last update of the timeouts
+        self.set_election_timeout(config.election_timeout_lower_bound)
+        if not config.raft_adaptive_timeouts:
+            self.heartbeat_interval = config.leader_broadcast_interval
+
+        self.stopped = False            # set by stop()
+        self.rpc_server = None
+
+        # Membership: the configuration changes with configuration entries in the log (see change_membership()),
+        #   and the latest one in the log is in effect, whether it is committed or not. 
+        #   memberships is the list of (index, raft_pb2.Membership) of the configurations in the log, oldest first;
+        #   the first one is the configuration at snapshot_index ([replicas] at first). 
+        self.memberships = [(0, make_membership(replicas))]
+        self.apply_membership()
+
         ## Deal with persistency:
         #  record whether we need persistency or not 
         self.need_persistent = need_persistent
-        #  the file where the persistent states are saved
+        #  the directory where the persistent states are saved:
+        #  current_term and voted_for go to a small metadata file, log entries go to a write-ahead log
         if not os.path.exists("./RAFT_records"):
             os.makedirs("./RAFT_records")
-        self.filename = f"./RAFT_records/record{self.my_id}"
+        self.filename = f"./RAFT_records/record{self.my_id}"    # (file used by older versions)
+        if group > 0:
+            self.filename += f"_group{group}"
+        self.storage = None
         if self.need_persistent:
+            dirname = f"./RAFT_records/node{self.my_id}" + (f"_group{group}" if group > 0 else "")
+            self.storage = RaftStorage(dirname, on_durable=self.on_durable)
             with self.lock:
                 self.retrieve()
     
 
-    """ This function saves the persistent states of the RAFT server
-        to disk file [self.filename], if need_persistent = True
+    """ This function saves current_term and voted_for of the RAFT server
+        to the metadata file, if need_persistent = True and they have changed since the last save.
+        (Log entries are saved separately by save_log_append() and save_log_truncate())
         *** Lock must be acquired before calling this function ***
     """
     def save(self): 
         assert self.lock.locked()
-        if not self.need_persistent:
+        if not self.need_persistent or self.saved_meta == (self.current_term, self.voted_for):
             return
-        # [persistent] is a gRPC object used to record all the states
-        # that need to be saved
-        persistent = raft_pb2.Persistent(
-                                        current_term = self.current_term, 
-                                        voted_for = self.voted_for, 
-                                        logs = self.logs
-                                    )
         try: 
-            with open(self.filename, "wb") as f:
-                # use gRPC object's own serializing function
-                # to convert this object into a binary string to write to file f
-                f.write(persistent.SerializeToString())
+            self.storage.save_meta(self.current_term, self.voted_for)
+            self.saved_meta = (self.current_term, self.voted_for)
         except:
             print("   save() fails\n")
     
 
-    """ This function retrieve the persistent states from disk
+    """ Append log entries to the write-ahead log on disk. Only the new entries are written.
+        *** Lock must be acquired before calling this function ***
+    """
+    def save_log_append(self, entries):
+        assert self.lock.locked()
+        if not self.need_persistent:
+            return
+        try:
+            self.storage.append(entries)
+        except:
+            print("   save_log_append() fails\n")
+    
+
+    """ Delete log entries with index >= [index] from the write-ahead log on disk.
+        *** Lock must be acquired before calling this function ***
+    """
+    def save_log_truncate(self, index):
+        assert self.lock.locked()
+        if not self.need_persistent:
+            return
+        try:
+            self.storage.truncate(index)
+        except:
+            print("   save_log_truncate() fails\n")
+    
+
+    """ Index of the last log entry that is on disk.
+        (With config.raft_durability = "batch", new entries become durable a little after they are appended)
+        *** Lock must be acquired before calling this function ***
+    """
+    def get_durable_index(self):
+        assert self.lock.locked()
+        if not self.need_persistent:
+            return self.get_last_index()
+        return min(self.storage.get_durable_index(), self.get_last_index())
+    
+
+    """ Called by the group commit of self.storage when more log entries become durable.
+        The Leader only counts itself towards a majority for entries that are durable,
+        so the commit_index may advance now. 
+    """
+    def on_durable(self, durable_index):
+        with self.lock:
+            if self.state == Leader:
+                self.update_commit_index()
+    
+
+    """ This function retrieve the persistent states from disk:
+        reads current_term and voted_for from the metadata file,
+        and rebuilds the log by scanning the write-ahead log segments. 
         *** Lock must be acquired before calling this function ***
     """
     def retrieve(self):
         assert self.lock.locked()
         if not self.need_persistent:
             return
-        # [persistent] is a gRPC object used to record all the states
-        # that need to be retrived
+        try: 
+            result = self.storage.load()
+        except:
+            print("   retrieve() fails.\n")
+            return
+        if result is None:
+            self.retrieve_old_record()
+            return
+        # copy the states from disk
+        (self.current_term, self.voted_for, entries) = result
+        self.saved_meta = (self.current_term, self.voted_for)
+        snapshot = self.storage.load_snapshot()
+        if snapshot is not None:
+            self.reset_log_to_snapshot(snapshot.last_included_index, snapshot.last_included_term, snapshot.data,
+                                       snapshot.membership if snapshot.HasField("membership") else None)
+            # the snapshot has been committed and applied before: give it to the upper-layer server again
+            self.commit_index = self.last_applied = self.snapshot_index
+            self.pending_snapshot = snapshot
+        
+        entries = [x for x in entries if x.index > self.snapshot_index]
+        if len(entries) > 0 and entries[0].index != self.snapshot_index + 1:
+            entries = []    # (should not happen) a gap between the snapshot and the log
+        if len(entries) == 0 and self.storage.next_index() != self.snapshot_index + 1:
+            self.storage.reset(self.snapshot_index + 1)
+        self.logs.extend(entries)
+        self.track_membership(entries)
+        self.storage.compact(self.snapshot_index)
+        print(f"  Retrieved!  current_term = {self.current_term}, voted_for = {self.voted_for}, log_len = {self.get_last_index()}, snapshot_index = {self.snapshot_index}")
+    
+
+    """ Older versions saved the whole raft_pb2.Persistent object to [self.filename] on every change.
+        If such a file exists, import its states to the new storage format. 
+        *** Lock must be acquired before calling this function ***
+    """
+    def retrieve_old_record(self):
+        assert self.lock.locked()
+        if not os.path.exists(self.filename):
+            return
         persistent = raft_pb2.Persistent()
         try: 
             with open(self.filename, "rb") as f:
-                # use gRPC object's own parsing function to parse from
-                # the binary string read from file f
                 persistent.ParseFromString(f.read())
         except:
             print("   retrieve() fails.\n")
             return
-        # copy the states from [persistent]
         self.current_term = persistent.current_term
         self.voted_for = persistent.voted_for
-        self.logs = [x for x in persistent.logs]
-        print(f"  Retrieved!  current_term = {self.current_term}, voted_for = {self.voted_for}, log_len = {len(self.logs)}")
+        self.logs.extend(persistent.logs[1:])
+        self.save()
+        self.save_log_append(persistent.logs[1:])
+        print(f"  Retrieved from {self.filename}!  current_term = {self.current_term}, voted_for = {self.voted_for}, log_len = {self.get_last_index()}")
     
 
     """ Get the index of the last entry in the log """
     def get_last_index(self):
-        return len(self.logs) - 1
+        return self.logs.last_index()
     
     """ Get the term of the last log entry """
     def get_last_term(self):
-        return self.logs[self.get_last_index()].term
+        return self.logs.last_term()
+    
+    """ Get the log entry with index [index] (a new raft_pb2.LogEntry)  (snapshot_index <= index <= last index) """
+    def get_entry(self, index):
+        return self.logs.entry(index)
+    
+    """ Get the term of the log entry with index [index]  (snapshot_index <= index <= last index) """
+    def get_term(self, index):
+        return self.logs.term(index)
+    
+
+    """ Find the first index whose entry has term >= [term] in the log (terms in a log never decrease),
+        using binary search. Return the last index + 1 if there is no such entry. 
+    """
+    def find_first_index_of_term(self, term):
+        return self.logs.find_first_index_of_term(term)
+    
+    """ Find the last index whose entry has term <= [term] in the log, using binary search. 
+        Return snapshot_index if there is no such entry. 
+    """
+    def find_last_index_of_term(self, term):
+        return self.find_first_index_of_term(term + 1) - 1
+    
+
+    """ Replace the log up to [index] by a snapshot.
+        If the log contains the entry [index] with term [term], the entries after it are kept;
+        otherwise the whole log is discarded. 
+        [membership] is the configuration at [index] (by default, the one in the log). 
+        *** Lock must be acquired before calling this function ***
+    """
+    def reset_log_to_snapshot(self, index, term, data, membership=None):
+        if membership is None:
+            membership = self.get_membership(index)
+        self.logs.compact(index, term)
+        self.snapshot_index = index
+        self.snapshot_term = term
+        self.snapshot_data = data
+        self.memberships = [(index, membership)] + [x for x in self.memberships if index < x[0] <= self.get_last_index()]
+        self.apply_membership()
+    
+
+    """ Called by the upper-layer server after it has applied all entries up to [index]:
+        [data] is a snapshot of its state machine at that point. 
+        RAFT saves the snapshot and drops all the log entries up to [index]. 
+        - Input: 
+            index : the index of the last log entry applied to the snapshot
+            data  : bytes, the serialized state machine
+    """
+    def snapshot(self, index, data):
+        with self.lock:
+            if index <= self.snapshot_index or index > self.last_applied:
+                return
+            term = self.get_term(index)
+            membership = self.get_membership(index)
+            self.reset_log_to_snapshot(index, term, data)
+            logging.info(f"  RAFT [{self.my_id}] - snapshot at index {index}, {self.get_last_index() - index} entries remain in the log")
+            if self.need_persistent:
+                try:
+                    self.storage.save_snapshot(raft_pb2.Snapshot(last_included_index=index,
+                                                                 last_included_term=term,
+                                                                 data=data,
+                                                                 membership=membership))
+                    self.storage.compact(index)
+                except:
+                    print("   snapshot() fails\n")
     
 
     """ When receiving a new client request, the upper-layer server calls
@@ -161,6 +453,11 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             term      :  current term
             is_leader :  whether this server is the current Leader.
                          If no, the command is not added to the log. 
+        This function does not wait for the entry to be durable: concurrent proposals are
+        made durable together by the group commit of self.storage, and the entry is only
+        committed (and then applied) after that. 
+        Nor does it write or replicate the entry itself: it hands the entry to the proposer thread,
+        which coalesces the concurrent proposals into one WAL write and one append_entries request per follower. 
     """
     def new_entry(self, command):
         logging.info(f"  RAFT [{self.my_id}] - new entry: " + command.json)   
@@ -168,6 +465,9 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             if self.state != Leader:
                 logging.info(f"      RAFT [{self.my_id}]: not leader, cannot add entry")
                 return (-1, self.current_term, False)
+            if self.transfer_target >= 0:
+                logging.info(f"      RAFT [{self.my_id}]: transferring the leadership, cannot add entry")
+                return (-1, self.current_term, False)
             
             term = self.current_term
             index = self.get_last_index() + 1
@@ -177,10 +477,38 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             self.logs.append( log_entry )
             logging.info(f"  RAFT [{self.my_id}] adds entry {term, index} to log")
 
-            self.save()
+            self.proposals.append(log_entry)
+            self.proposal_cond.notify()
             return (index, term, True)
     
 
+    """ The proposer thread: as soon as entries are proposed, writes them to the WAL and starts replicating them
+        (instead of waiting for the next heartbeat). 
+        Entries proposed while the proposer is busy are handled together in its next run. 
+    """
+    def propose_loop(self):
+        while True:
+            with self.lock:
+                while len(self.proposals) == 0:
+                    self.proposal_cond.wait()
+                self.flush_proposals()
+    
+
+    """ Write the proposed entries to the WAL and wake up the replicators
+        *** Lock must be acquired before calling this function ***
+    """
+    def flush_proposals(self):
+        assert self.lock.locked()
+        if len(self.proposals) == 0:
+            return
+        logging.debug(f"  RAFT [{self.my_id}] - flush {len(self.proposals)} proposals")
+        self.save_log_append(self.proposals)
+        self.proposals = []
+        if self.state == Leader:
+            self.replicate_cond.notify_all()
+            self.update_commit_index()
+    
+
     """ Append_entries RPC.  See RAFT paper for details
         - Input:
             request  : pb2.AE_Request object, the request from the RAFT client that calls this RPC
@@ -188,10 +516,21 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             response : pb2.AE_Response object, RPC response to the client. 
     """
     def rpc_append_entries(self, request, context):
+        response = self.handle_append_entries(request)
+        # Reply success only after the new entries are durable
+        if response.success and self.need_persistent:
+            self.storage.wait_durable(request.prev_log_index + len(request.entries))
+        return response
+    
+
+    """ Handle an append_entries request (without waiting for the new entries to be durable)
+    """
+    def handle_append_entries(self, request):
         logging.debug(f"  RAFT [{self.my_id}] - AE - from Leader {request.leader_id},    my state={self.state}")
         self.lock.acquire()
         try:
             response = raft_pb2.AE_Response()
+            response.apply_latency = self.apply_latency_p99
             
             # Step 1: Reply False if term < current_term
             logging.debug(f"     request.term = {request.term}, my current term = {self.current_term}.")
@@ -204,115 +543,209 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
                 self.convert_to_follower(request.term)
             
             self.heard_heartbeat = True
+            self.last_heard_leader = time.monotonic()
+            self.leader_id = request.leader_id
+            if request.election_timeout > 0 and request.election_timeout != self.election_timeout:
+                self.set_election_timeout(request.election_timeout)     # (the one chosen by the Leader)
             last_index = self.get_last_index()
 
             response.term = self.current_term
             response.success = False
 
-            # print(f"        logs before AE: " + DEBUG.logs_to_string(self.logs))
+            # print(f"        logs before AE: " + DEBUG.logs_to_string([self.get_entry(i) for i in range(self.snapshot_index, self.get_last_index() + 1)]))
             # print(f"        comming entries: " + DEBUG.logs_to_string(request.entries))
             # logging.info(f"         prev_log_index = {request.prev_log_index},  prev_log_term = {request.prev_log_term}")
 
+            prev_log_index = request.prev_log_index
+            prev_log_term = request.prev_log_term
+            entries = request.entries
+            # Entries up to snapshot_index are already committed and in the snapshot: skip them
+            if prev_log_index < self.snapshot_index:
+                skip = min(self.snapshot_index - prev_log_index, len(entries))
+                entries = entries[skip:]
+                prev_log_index = self.snapshot_index
+                prev_log_term = self.snapshot_term
+
             # Step 2: Reply False if Follower's log doesn't contain an entry at prev_log_index
             #         whose term matches prev_log_term
             #   - case 1: Follower's log is shorter than prev_log_index
-            if request.prev_log_index > last_index:
+            if prev_log_index > last_index:
+                response.conflict_term = 0
+                response.conflict_index = last_index + 1
                 return response
-            #   - case 2: term doesn't match
-            if self.logs[request.prev_log_index].term != request.prev_log_term:
+            #   - case 2: term doesn't match. 
+            #     Tell the leader the conflicting term and where it starts,
+            #     so the leader can skip all the entries of that term at once
+            if self.get_term(prev_log_index) != prev_log_term:
+                response.conflict_term = self.get_term(prev_log_index)
+                response.conflict_index = self.find_first_index_of_term(response.conflict_term)
                 return response
             
             # Step 3: If an existing entry conflicts with a new one (same index but different terms),
             #         Delete the existing entry and all that follow it. 
-            i = request.prev_log_index + 1;  j = 0
-            while i<=last_index and j<len(request.entries):
-                if self.logs[i].term != request.entries[j].term:
+            #   (only the entries of the request are compared, and the log is only cut on a real conflict:
+            #    the entries after the request's ones may be right, e.g. when an older request arrives late)
+            i = prev_log_index + 1;  j = 0
+            while i<=last_index and j<len(entries):
+                if self.get_term(i) != entries[j].term:
+                    # print("    last_index =", last_index, "   i =", i, "    j =", j)
+                    self.logs.truncate(i)   # keep log[0, ..., i-1]. Delete i and after
+                    self.save_log_truncate(i)
+                    self.forget_membership(i)
                     break
                 i+=1; j+=1
-            # print("    last_index =", last_index, "   i =", i, "    j =", j)
-            self.logs = self.logs[:i]   # keep log[0, ..., i-1]. Delete i and after
             
             # Step 4: Append any new entries not already in the log
-            self.logs.extend( request.entries[j:] )
+            if j < len(entries):
+                new_entries = entries[j:]
+                self.logs.extend( new_entries )
+                self.save_log_append( new_entries )
+                self.track_membership( new_entries )
 
             # Step 5: If leader_commit > commit_index,
             #         set commit_index = min(leader_commit, index of last new entry)
-            if request.leader_commit > self.commit_index:
-                last_index = self.get_last_index()
-                self.commit_index = min(request.leader_commit, last_index)
+            #   (the index of the last new entry may be behind commit_index, when an older request arrives late)
+            if min(request.leader_commit, prev_log_index + len(entries)) > self.commit_index:
+                self.commit_index = min(request.leader_commit, prev_log_index + len(entries))
                 # upon comit_index changes, apply logs:
                 logging.debug(f"      commit_index = {self.commit_index}" ) 
-                threading.Thread(target=self.apply_logs, daemon=True).start()
+                self.apply_cond.notify()
             
-            # logging.info(f"    logs after AE: " + DEBUG.logs_to_string(self.logs))
+            # logging.info(f"    logs after AE: " + DEBUG.logs_to_string([self.get_entry(i) for i in range(self.snapshot_index, self.get_last_index() + 1)]))
 
             response.success = True
             return response
         
         finally:
-            self.save()     # current_term and logs might chagne, so we need to save
+            self.save()     # current_term might chagne, so we need to save (the log is saved above; nothing is written if unchanged)
             self.lock.release()
     
 
-    """ Send append_entries RPC to a RAFT server,
-        wait for response, and handle response
+    """ Handle the (finished) append_entries RPC sent by the replicator of follower [id]
         - Input: id      : id of the target RAFT server, 
-                 request : append_entries request to send
+                 request : the append_entries request that was sent
+                 epoch   : self.pipeline_epoch[id] when the request was sent
+                 hb_round: self.heartbeat_round when the request was sent
+                 sent_time: time.monotonic() when the request was sent
+                 future  : the gRPC future of the RPC
     """
-    def send_append_entries(self, id, request):
-        try:
-            response = self.replica_stubs[id].rpc_append_entries(request)
-        except grpc.RpcError:
-            # RPC fails: does nothing and return
-            return
-        logging.debug(f"    Sent to {id}, term = {request.term}")
-        
+    def on_append_entries_done(self, id, request, epoch, hb_round, sent_time, future):
         with self.lock:
-            if (self.state != Leader or request.term != self.current_term
-                                     or response.term < self.current_term):
-                return
-            
-            if response.term > self.current_term:
-                # If the target server has a newer term, turn myself to a Follower
-                self.convert_to_follower(response.term)
+            self.inflight[id] -= 1
+            self.replicate_cond.notify_all()
+            try:
+                response = future.result()
+            except grpc.RpcError:
+                # RPC fails: restart the pipeline from the last index known to be replicated
+                if self.state == Leader and request.term == self.current_term:
+                    self.reset_pipeline(id)
                 return
-            
-            if response.success:
-                # If success: update next_index[id] and match_index[id]
-                new_match_index = request.prev_log_index + len(request.entries)
-                logging.debug(f"       Success, match_index[{id}]: {self.match_index[id]} -> {new_match_index}")
-                if new_match_index > self.match_index[id]:
-                    self.match_index[id] = new_match_index
+            logging.debug(f"    Sent to {id}, term = {request.term}")
+            self.handle_append_entries_response(id, request, epoch, response, hb_round, sent_time)
+    
+
+    """ Handle the response of an append_entries RPC sent to follower [id]
+        *** Lock must be acquired before calling this function ***
+    """
+    def handle_append_entries_response(self, id, request, epoch, response, hb_round=0, sent_time=0):
+        assert self.lock.locked()
+        if (self.state != Leader or request.term != self.current_term
+                                 or response.term < self.current_term):
+            return
+        
+        if response.term > self.current_term:
+            # If the target server has a newer term, turn myself to a Follower
+            self.convert_to_follower(response.term)
+            return
+        
+        # The follower still accepts me as the Leader (whether success or not)
+        self.ack_round(id, hb_round, sent_time)
+        if sent_time > 0:
+            self.rtt_samples[id].append(time.monotonic() - sent_time)
+        self.follower_apply_latency[id] = response.apply_latency
+        
+        if response.success:
+            # If success: update match_index[id]
+            # (next_index[id] has already been advanced when the request was sent)
+            new_match_index = request.prev_log_index + len(request.entries)
+            logging.debug(f"       Success, match_index[{id}]: {self.match_index[id]} -> {new_match_index}")
+            if new_match_index > self.match_index[id]:
+                self.match_index[id] = new_match_index
+            if self.next_index[id] <= self.match_index[id]:
                 self.next_index[id] = self.match_index[id] + 1
+            self.maybe_send_timeout_now()
+        elif epoch == self.pipeline_epoch[id]:
+            # Not success: the requests pipelined after this one will fail too. 
+            # Move next_index[id] back (relative to this request) and restart the pipeline from there. 
+            # Rejections of requests sent before the last restart are ignored. 
+            self.next_index[id] = self.backtrack_next_index(request, response)
+            self.pipeline_epoch[id] += 1
+            self.replicate_cond.notify_all()
+        
+        self.update_commit_index()
+    
+
+    """ Compute the new next_index of a follower that rejected [request], using the hints in [response]:
+          - if the follower's log is too short, continue right after its last entry; 
+          - if the leader has entries of conflict_term, continue after its last entry of that term; 
+          - otherwise, skip all the follower's entries of conflict_term, 
+            and all the leader's entries with terms > conflict_term (they cannot match the follower's log). 
+        Without hints (conflict_index = 0), just decrement by one. 
+        *** Lock must be acquired before calling this function ***
+    """
+    def backtrack_next_index(self, request, response):
+        assert self.lock.locked()
+        if response.conflict_index <= 0:
+            next_index = request.prev_log_index
+        elif response.conflict_term == 0:
+            next_index = response.conflict_index
+        else:
+            last = self.find_last_index_of_term(response.conflict_term)
+            if self.get_term(last) == response.conflict_term:
+                next_index = last + 1
             else:
-                # Not success: decrement next_index[id] (and retry in the next broadcast)
-                self.next_index[id] -= 1
-                """  is this safe?  What if multiple threads call send_append_entries(), and then 
-                     all decrement self.next_index[id] ?? 
-                """
-            
-            # RAFT paper:
-            #   "If   there exists an N such that N > commit_index,
-            #         a majority of mathch_index[id] >= N,
-            #         and log[N].term == current_term, 
-            #    then set commit_index = N"
-            N = self.get_last_index()
-            while (N > self.commit_index):
-                if self.logs[N].term == self.current_term:
-                    count = 1
-                    for i in range(self.n_replicas):
-                        if i != self.my_id and self.match_index[i] >= N:
-                            count += 1
-                    if count > self.n_replicas // 2:
-                        self.commit_index = N
-                        # upon comit_index changes, apply logs:
-                        logging.debug(f"       commit_index = {N}")
-                        threading.Thread(target=self.apply_logs, daemon=True).start()
-                        break 
-                N -= 1
-
-
-    """ Broadcast append_entries RPCs to all other RAFT servers
+                next_index = min(response.conflict_index, last + 1)
+        return max(1, min(next_index, request.prev_log_index))
+    
+
+    """ Restart the replication pipeline of follower [id] from match_index[id] + 1
+        *** Lock must be acquired before calling this function ***
+    """
+    def reset_pipeline(self, id):
+        assert self.lock.locked()
+        self.next_index[id] = self.match_index[id] + 1
+        self.pipeline_epoch[id] += 1
+        self.replicate_cond.notify_all()
+
+
+    """ Advance the commit_index of the Leader if a majority of replicas have stored an entry.
+        *** Lock must be acquired before calling this function ***
+    """
+    def update_commit_index(self):
+        assert self.lock.locked()
+        # RAFT paper:
+        #   "If   there exists an N such that N > commit_index,
+        #         a majority of mathch_index[id] >= N,
+        #         and log[N].term == current_term, 
+        #    then set commit_index = N"
+        # The largest N stored by a majority is the majority-th largest match_index
+        # (the Leader counts itself only up to its durable entries);
+        # since terms only grow along the log, if log[N].term != current_term, no entry <= N is from current_term
+        N = self.get_quorum_value(self.match_index, self.get_durable_index())
+        if N > self.commit_index and self.get_term(N) == self.current_term:
+            self.commit_index = N
+            self.read_cond.notify_all()
+            # upon comit_index changes, apply logs:
+            logging.debug(f"       commit_index = {N}")
+            self.apply_cond.notify()
+            if self.my_id not in self.voters and self.memberships[-1][0] <= N:
+                # the configuration that removes this Leader (or makes it a learner) is committed
+                logging.info(f"  RAFT [{self.my_id}] - not a voter any more, step down")
+                self.step_down()
+
+
+    """ Broadcast append_entries RPCs (heartbeats) to all other RAFT servers:
+        asks the replicator of every follower to send a request now. 
         *** Lock must be acquired before calling this function ***
     """
     def broadcast_append_entries(self):
@@ -320,18 +753,303 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         assert self.lock.locked()
         if self.state != Leader:
             return
-        
+        self.heartbeat_round += 1
         for i in range(self.n_replicas):
-            if i != self.my_id:
-                request = raft_pb2.AE_Request()
-                request.term = self.current_term
-                request.leader_id = self.my_id
-                request.prev_log_index = self.next_index[i] - 1
-                request.prev_log_term = self.logs[request.prev_log_index].term
-                request.leader_commit = self.commit_index
-                entries = self.logs[self.next_index[i] : ]
-                request.entries.extend( entries )  # use extend to deep copy entries to request.entries
-                threading.Thread(target = self.send_append_entries, args=(i, request), daemon=True).start()
+            self.heartbeat_due[i] = True
+        self.replicate_cond.notify_all()
+    
+
+    """ The replicator of follower [id]: a long-lived thread that sends append_entries requests
+        (or the snapshot) to the follower while this server is the Leader. 
+          - New entries are pipelined: up to config.raft_max_inflight_append requests can be in flight,
+            each carrying at most config.raft_max_append_entries entries / config.raft_max_append_bytes bytes. 
+          - A heartbeat is sent when broadcast_append_entries() asks for it; 
+            it carries no entries if the follower is already caught up. 
+    """
+    def replicate_loop(self, id):
+        while True:
+            with self.lock:
+                while not self.need_to_replicate(id):
+                    if self.replicas[id] is None:
+                        self.replicators.discard(id)    # [id] has been removed from the cluster
+                        return
+                    self.replicate_cond.wait()
+                self.heartbeat_due[id] = False
+                self.inflight[id] += 1
+                epoch = self.pipeline_epoch[id]
+                hb_round = self.heartbeat_round
+                sent_time = time.monotonic()
+                if self.next_index[id] <= self.snapshot_index:
+                    request = self.make_install_snapshot_request()
+                    rpc = self.replica_stubs[id].rpc_install_snapshot
+                    callback = self.on_install_snapshot_done
+                else:
+                    request = self.make_append_entries_request(id)
+                    rpc = self.replica_stubs[id].rpc_append_entries
+                    callback = self.on_append_entries_done
+                    # optimistically assume the request succeeds, so the next one carries the following entries
+                    self.next_index[id] += len(request.entries)
+            
+            # send the request without holding the lock
+            future = rpc.future(request, timeout=config.raft_rpc_timeout / 1000)
+            future.add_done_callback(lambda f, request=request, epoch=epoch, hb_round=hb_round,
+                                            sent_time=sent_time, callback=callback: 
+                                        callback(id, request, epoch, hb_round, sent_time, f))
+    
+
+    """ Whether the replicator of follower [id] should send a request now
+        *** Lock must be acquired before calling this function ***
+    """
+    def need_to_replicate(self, id):
+        if self.state != Leader or self.replicas[id] is None:
+            return False
+        if self.inflight[id] >= config.raft_max_inflight_append:
+            return False
+        if self.next_index[id] <= self.snapshot_index and self.inflight[id] > 0:
+            return False    # send the snapshot only when nothing else is in flight, and nothing after it
+        return self.heartbeat_due[id] or self.next_index[id] <= self.get_last_index()
+    
+
+    """ Make an append_entries request (an EncodedAERequest) for follower [id], starting from next_index[id].
+        The entries are encoded once and shared by the requests to all the followers (and their retries). 
+        *** Lock must be acquired before calling this function ***
+    """
+    def make_append_entries_request(self, id):
+        header = raft_pb2.AE_Request()
+        header.term = self.current_term
+        header.leader_id = self.my_id
+        header.prev_log_index = self.next_index[id] - 1
+        header.prev_log_term = self.get_term(header.prev_log_index)
+        header.leader_commit = self.commit_index
+        if config.raft_adaptive_timeouts:
+            header.election_timeout = self.election_timeout
+        entries = []
+        n_bytes = 0
+        last_index = min(self.get_last_index(), header.prev_log_index + config.raft_max_append_entries)
+        for index in range(self.next_index[id], last_index + 1):
+            entry = self.logs.encoded_entry(index)
+            n_bytes += len(entry)
+            if n_bytes > config.raft_max_append_bytes and len(entries) > 0:
+                break
+            entries.append(entry)
+        return EncodedAERequest(header, entries)
+    
+
+    """ Make an install_snapshot request carrying the current snapshot
+        *** Lock must be acquired before calling this function ***
+    """
+    def make_install_snapshot_request(self):
+        request = raft_pb2.IS_Request()
+        request.term = self.current_term
+        request.leader_id = self.my_id
+        request.last_included_index = self.snapshot_index
+        request.last_included_term = self.snapshot_term
+        request.data = self.snapshot_data
+        request.membership.CopyFrom(self.memberships[0][1])
+        return request
+    
+
+    """ ReadIndex: called by the upper-layer server before serving a read-only request
+        without adding it to the log. 
+        The Leader records its commit_index, then confirms that it is still the Leader
+        by a round of heartbeats acknowledged by a majority. 
+        Concurrent reads share one round: while a round for reads is in flight,
+        the reads that arrive wait for the next round, which starts when the current one finishes. 
+        With config.raft_read_mode = "lease", the round is skipped while the Leader holds its lease. 
+        - Return: (index, is_leader)
+            index     : the upper-layer server can serve the read once it has applied all entries up to index
+            is_leader : False if this server is not the Leader (or cannot confirm it in time)
+    """
+    def read_index(self):
+        timeout = config.raft_rpc_timeout / 1000
+        with self.lock:
+            if self.state != Leader:
+                return (-1, False)
+            term = self.current_term
+            # A new Leader does not know which entries are committed
+            # until it has committed an entry of its own term (the no-op added in convert_to_leader())
+            if not self.read_cond.wait_for(lambda: self.state != Leader or self.current_term != term or
+                                                   self.get_term(self.commit_index) == term, timeout):
+                return (-1, False)
+            if self.state != Leader or self.current_term != term:
+                return (-1, False)
+            
+            index = self.commit_index
+            if config.raft_read_mode == "lease" and self.check_lease():
+                self.lease_reads += 1
+                return (index, True)
+            
+            self.read_index_reads += 1
+            target_round = self.heartbeat_round + 1
+            self.read_round_wanted = max(self.read_round_wanted, target_round)
+            self.start_read_round()
+            if not self.read_cond.wait_for(lambda: self.state != Leader or self.current_term != term or
+                                                   self.get_quorum_round() >= target_round, timeout):
+                return (-1, False)
+            if self.state != Leader or self.current_term != term:
+                return (-1, False)
+            return (index, True)
+    
+
+    """ Start a round of heartbeats for the waiting reads, unless a round for reads is still in flight
+        *** Lock must be acquired before calling this function ***
+    """
+    def start_read_round(self):
+        assert self.lock.locked()
+        if self.read_round_wanted > self.heartbeat_round and self.get_quorum_round() >= self.read_round_started:
+            self.broadcast_append_entries()
+            self.read_round_started = self.heartbeat_round
+    
+
+    """ Follower [id] responded to a request of heartbeat round [hb_round], sent at [sent_time],
+        in the current term
+        *** Lock must be acquired before calling this function ***
+    """
+    def ack_round(self, id, hb_round, sent_time=0):
+        assert self.lock.locked()
+        self.acked_time[id] = max(self.acked_time[id], sent_time)
+        if hb_round > self.acked_round[id]:
+            self.acked_round[id] = hb_round
+            self.read_cond.notify_all()
+            self.start_read_round()
+    
+
+    """ The largest x such that a majority of the voters have a value >= x,
+        where values[i] is the value of replica i, and [my_value] is the value of myself. 
+        *** Lock must be acquired before calling this function ***
+    """
+    def get_quorum_value(self, values, my_value):
+        sorted_values = sorted([my_value if i == self.my_id else values[i] for i in self.voters], reverse=True)
+        return sorted_values[self.n_voters // 2]
+    
+
+    """ The latest heartbeat round acknowledged by a majority (including myself)
+        *** Lock must be acquired before calling this function ***
+    """
+    def get_quorum_round(self):
+        return self.get_quorum_value(self.acked_round, self.heartbeat_round)
+    
+
+    """ Time (time.monotonic()) until which the Leader holds its lease:
+        election_timeout_lower_bound - raft_lease_clock_drift after the latest time 
+        at which a majority (including myself) had acked its requests. 
+        With adaptive timeouts, raft_election_timeout_min instead of election_timeout_lower_bound:
+        a follower may use a shorter election timeout than this Leader (e.g. the one of a previous Leader). 
+        *** Lock must be acquired before calling this function ***
+    """
+    def get_lease_expiry(self):
+        assert self.lock.locked()
+        timeout = config.raft_election_timeout_min if config.raft_adaptive_timeouts else config.election_timeout_lower_bound
+        duration = (timeout - config.raft_lease_clock_drift) / 1000
+        quorum_time = self.get_quorum_value(self.acked_time, time.monotonic())
+        if quorum_time == 0:
+            return 0
+        return quorum_time + duration
+    
+
+    """ Whether this server is the Leader and holds a valid lease.
+        Logs when the lease is acquired or lost (e.g. the Leader cannot reach a majority any more). 
+        *** Lock must be acquired before calling this function ***
+    """
+    def check_lease(self):
+        assert self.lock.locked()
+        valid = self.state == Leader and self.transfer_target < 0 and time.monotonic() < self.get_lease_expiry()
+        if valid != self.lease_holding:
+            self.lease_holding = valid
+            if valid:
+                logging.info(f"  RAFT [{self.my_id}] - lease acquired in term {self.current_term}")
+            else:
+                logging.info(f"  RAFT [{self.my_id}] - lease lost in term {self.current_term}")
+        return valid
+    
+
+    """ Whether this server has heard from a Leader of the current term within its election timeout
+        (in the "lease" read mode, a vote is then refused, because the Leader may hold a lease)
+        *** Lock must be acquired before calling this function ***
+    """
+    def leader_is_alive(self):
+        assert self.lock.locked()
+        if self.state == Leader:
+            return self.check_lease()
+        return time.monotonic() - self.last_heard_leader < self.election_timeout / 1000
+    
+
+    """ Install_snapshot RPC.  See RAFT paper for details
+        (the snapshot is sent in one message, instead of in chunks)
+        - Input:
+            request  : pb2.IS_Request object
+        - Return:
+            response : pb2.IS_Response object
+    """
+    def rpc_install_snapshot(self, request, context):
+        logging.info(f"  RAFT [{self.my_id}] - IS - from Leader {request.leader_id}, last_included_index = {request.last_included_index}")
+        with self.lock:
+            response = raft_pb2.IS_Response()
+            if request.term < self.current_term:
+                response.term = self.current_term
+                return response
+            if request.term > self.current_term:
+                self.convert_to_follower(request.term)
+            self.heard_heartbeat = True
+            self.last_heard_leader = time.monotonic()
+            self.leader_id = request.leader_id
+            response.term = self.current_term
+
+            # Ignore the snapshot if it is older than what we have already committed
+            if request.last_included_index <= self.commit_index:
+                return response
+            
+            self.reset_log_to_snapshot(request.last_included_index, request.last_included_term, request.data,
+                                       request.membership if request.HasField("membership") else None)
+            snapshot = raft_pb2.Snapshot(last_included_index=request.last_included_index,
+                                         last_included_term=request.last_included_term,
+                                         data=request.data,
+                                         membership=self.memberships[0][1])
+            if self.need_persistent:
+                try:
+                    self.storage.save_snapshot(snapshot)
+                    if self.get_last_index() == self.snapshot_index:
+                        self.storage.reset(self.snapshot_index + 1)
+                    else:
+                        self.storage.compact(self.snapshot_index)
+                except:
+                    print("   rpc_install_snapshot() fails to save\n")
+            
+            # The upper-layer server replaces its state machine by the snapshot
+            self.commit_index = self.last_applied = self.snapshot_index
+            self.pending_snapshot = snapshot
+            self.apply_cond.notify()
+            return response
+    
+
+    """ Handle the (finished) install_snapshot RPC sent by the replicator of follower [id]
+        - Input: id      : id of the target RAFT server, 
+                 request : the install_snapshot request that was sent
+                 epoch   : self.pipeline_epoch[id] when the request was sent
+                 hb_round: self.heartbeat_round when the request was sent
+                 sent_time: time.monotonic() when the request was sent
+                 future  : the gRPC future of the RPC
+    """
+    def on_install_snapshot_done(self, id, request, epoch, hb_round, sent_time, future):
+        with self.lock:
+            self.inflight[id] -= 1
+            self.replicate_cond.notify_all()
+            if self.state != Leader or request.term != self.current_term:
+                return
+            try:
+                response = future.result()
+            except grpc.RpcError:
+                self.reset_pipeline(id)
+                return
+            if response.term > self.current_term:
+                self.convert_to_follower(response.term)
+                return
+            self.ack_round(id, hb_round, sent_time)
+            if request.last_included_index > self.match_index[id]:
+                self.match_index[id] = request.last_included_index
+            if self.next_index[id] <= self.match_index[id]:
+                self.next_index[id] = self.match_index[id] + 1
+            self.maybe_send_timeout_now()
     
 
     """ check if candidate's log is as least as up-to-date as mine: 
@@ -356,7 +1074,13 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         try:
             response = raft_pb2.RV_Response()
 
-            if request.term < self.current_term:
+            if request.term < self.current_term  or  self.is_learner:
+                response.term = self.current_term
+                response.vote_granted = False
+                return response
+            
+            if config.raft_read_mode == "lease" and not request.leadership_transfer and self.leader_is_alive():
+                # The current Leader may hold a lease: do not vote (and do not move to the new term)
                 response.term = self.current_term
                 response.vote_granted = False
                 return response
@@ -397,7 +1121,11 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         except grpc.RpcError:
             logging.debug(f"       no response from {id}")
             return
-        
+        self.handle_request_vote_response(id, request, response)
+    
+
+    """ Handle the response of the request_vote RPC sent to RAFT server [id] """
+    def handle_request_vote_response(self, id, request, response):
         with self.lock:
             logging.debug(f"      got response from {id}: vote_granted = {response.vote_granted},  term = {response.term}")
             if (self.state != Candidate  or  request.term != self.current_term
@@ -410,16 +1138,17 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             
             if response.vote_granted:
                 self.vote_count += 1
-                if self.vote_count == self.n_replicas // 2 + 1:
+                if self.vote_count == self.n_voters // 2 + 1:
                     # votes reach majority. Ready to convert to leader. Do this only once. 
                     self.received_majority_vote.set()
     
 
     """ Broadcast request_vote RPC to all Raft replicas.
         If receive a majority of vote, will set the event to notify the main loop
+        (transfer: whether the election was asked by the Leader, see rpc_timeout_now())
         *** Lock must be acquired before calling this function ***
     """
-    def broadcast_request_vote(self):
+    def broadcast_request_vote(self, transfer=False):
         logging.debug(f"  RAFT [{self.my_id, self.state}] - broadcast request vote - current_term = {self.current_term}")
         assert self.lock.locked()
         if self.state != Candidate:
@@ -429,26 +1158,534 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         request.candidate_id = self.my_id
         request.last_log_index = self.get_last_index()
         request.last_log_term = self.get_last_term()
-        for i in range(self.n_replicas):
+        request.leadership_transfer = transfer
+        for i in self.voters:
             if i != self.my_id:
                 threading.Thread(target=self.send_request_vote, args=(i, request), daemon=True).start()
     
 
-    """ 'Apply' the committed logs:
-        namely, put the committed log entries to apply_queue to notify the upper-level server
+    """ Pre_vote RPC: would this server vote for the sender in term request.term ?
+        Grant if the sender's term and log are up-to-date, and this server has not heard from a Leader
+        within its election timeout (i.e., it also thinks that a new election is needed). 
+        Nothing changes on this server. 
+        - Input:
+            request  : pb2.RV_Request object (request.term is the next term of the sender)
+        - Return:
+            response : pb2.RV_Response object
+    """
+    def rpc_pre_vote(self, request, context):
+        with self.lock:
+            response = raft_pb2.RV_Response()
+            response.term = self.current_term
+            leader_alive = (self.state == Leader or
+                            time.monotonic() - self.last_heard_leader < self.election_timeout / 1000)
+            response.vote_granted = (request.term > self.current_term and not leader_alive and not self.is_learner
+                                     and self.is_up_to_date(request.last_log_index, request.last_log_term))
+            logging.debug(f"  RAFT [{self.my_id}] - pre-vote for [{request.candidate_id}] in term {request.term}: {response.vote_granted}")
+            return response
+    
+
+    """ Run a pre-vote round before an election (if config.raft_pre_vote is True).
+        - Return: whether a majority would vote for this server, so it can become a Candidate
     """
-    def apply_logs(self):
+    def pre_vote(self, from_state):
+        if not config.raft_pre_vote:
+            return True
         with self.lock:
-            for i in range(self.last_applied+1, self.commit_index+1):
-                logging.info(f"    RAFT [{self.my_id}] puts log entry [{i}] to apply_queue,  commit_index={self.commit_index}")
-                self.apply_queue.put(self.logs[i])
-                self.last_applied = i
+            if not self.start_pre_vote(from_state):
+                return False
+        return self.received_majority_pre_vote.wait( self.get_random_election_timeout_second() )
+    
+
+    """ Start a pre-vote round for term current_term + 1: send pre_vote RPCs to the voters
+        - Return: False if the state is not [from_state] any more
+        *** Lock must be acquired before calling this function ***
+    """
+    def start_pre_vote(self, from_state):
+        assert self.lock.locked()
+        if self.state != from_state or self.is_learner:
+            return False
+        self.pre_vote_term = self.current_term + 1
+        self.pre_vote_count = 1
+        self.received_majority_pre_vote.clear()
+        if self.pre_vote_count >= self.n_voters // 2 + 1:
+            self.received_majority_pre_vote.set()
+        request = raft_pb2.RV_Request()
+        request.term = self.pre_vote_term
+        request.candidate_id = self.my_id
+        request.last_log_index = self.get_last_index()
+        request.last_log_term = self.get_last_term()
+        logging.info(f"  RAFT [{self.my_id}] - pre-vote for term {request.term}")
+        self.broadcast_pre_vote(request)
+        return True
+    
+
+    """ Send the pre_vote RPC [request] to the voters
+        *** Lock must be acquired before calling this function ***
+    """
+    def broadcast_pre_vote(self, request):
+        for i in self.voters:
+            if i != self.my_id:
+                threading.Thread(target=self.send_pre_vote, args=(i, request), daemon=True).start()
+    
+
+    """ Send pre_vote RPC to RAFT server [id], wait for response, and handle response """
+    def send_pre_vote(self, id, request):
+        try:
+            response = self.replica_stubs[id].rpc_pre_vote(request, timeout=config.raft_rpc_timeout / 1000)
+        except grpc.RpcError:
+            return
+        self.handle_pre_vote_response(id, request, response)
+    
+
+    """ Handle the response of the pre_vote RPC sent to RAFT server [id] """
+    def handle_pre_vote_response(self, id, request, response):
+        with self.lock:
+            if response.term > self.current_term:
+                self.convert_to_follower(response.term)
+                return
+            if request.term != self.pre_vote_term or self.state == Leader:
+                return
+            if response.vote_granted:
+                self.pre_vote_count += 1
+                if self.pre_vote_count == self.n_voters // 2 + 1:
+                    self.received_majority_pre_vote.set()
+    
+
+    """ Check-quorum: step down if this Leader has not heard from a majority
+        for the upper bound of its election timeout (if config.raft_check_quorum is True). 
+        Then it stops accepting writes (and serving reads) that could not commit anyway. 
+        *** Lock must be acquired before calling this function ***
+    """
+    def check_quorum(self):
+        assert self.lock.locked()
+        if not config.raft_check_quorum or self.state != Leader:
+            return
+        now = time.monotonic()
+        last_quorum = max(self.get_quorum_value(self.acked_time, now), self.leader_since)
+        if now - last_quorum > self.election_timeout_upper / 1000:
+            logging.info(f"  RAFT [{self.my_id}] - check-quorum fails: no majority for {int((now - last_quorum) * 1000)} ms, step down")
+            self.step_down()
+    
+
+    """ The Leader becomes a Follower in the same term (so it keeps its vote)
+        *** Lock must be acquired before calling this function ***
+    """
+    def step_down(self):
+        assert self.lock.locked()
+        self.flush_proposals()
+        self.state = Follower
+        self.transfer_target = -1
+        self.last_heard_leader = 0
+        self.leader_id = -1
+        self.reset_events()
+        self.read_cond.notify_all()     # waiting reads fail
+        self.check_lease()              # the lease is lost
+    
+
+    """ Transfer the leadership to RAFT server [target] (or, if target = -1, to the most up-to-date voter),
+        e.g. before this server is restarted. Blocks until the transfer succeeds or is given up. 
+        The Leader stops accepting new entries, waits until the target has the whole log,
+        and then sends it rpc_timeout_now, so it starts an election right away (without waiting
+        for an election timeout) and wins it. If this does not happen within the upper bound of the election timeout,
+        the transfer is given up and this server accepts new entries again. 
+        - Return: (is_leader, success, new_leader_id)
+    """
+    def transfer_leadership(self, target=-1):
+        with self.lock:
+            if self.state != Leader:
+                return (False, False, -1)
+            others = [i for i in self.voters if i != self.my_id]
+            if target == -1 and len(others) > 0:
+                target = max(others, key=lambda i: self.match_index[i])
+            if target == self.my_id:
+                return (True, True, self.my_id)
+            if target not in others:
+                return (True, False, -1)
+            term = self.current_term
+            logging.info(f"  RAFT [{self.my_id}] - transfer the leadership to [{target}] in term {term}")
+            self.transfer_target = target
+            self.transfer_deadline = time.monotonic() + self.election_timeout_upper / 1000
+            self.timeout_now_sent = False
+            self.check_lease()      # no lease during the transfer
+            self.maybe_send_timeout_now()
+            self.read_cond.wait_for(lambda: self.state != Leader or self.current_term != term
+                                            or self.transfer_target != target)
+            success = self.current_term != term     # (the target has started an election)
+            return (True, success, target if success else -1)
+    
+
+    """ Send rpc_timeout_now to the target of the leadership transfer, once it has the whole log
+        *** Lock must be acquired before calling this function ***
+    """
+    def maybe_send_timeout_now(self):
+        assert self.lock.locked()
+        target = self.transfer_target
+        if target < 0 or self.timeout_now_sent or self.match_index[target] < self.get_last_index():
+            return
+        self.timeout_now_sent = True
+        request = raft_pb2.TN_Request(term=self.current_term, leader_id=self.my_id)
+        self.send_timeout_now(target, request)
+    
+
+    """ Send rpc_timeout_now [request] to RAFT server [id] (without waiting for the response)
+        (the caller holds the lock, and a callback added to a call that is already over runs at once:
+         the response is handled in another thread, since handling it takes the lock)
+    """
+    def send_timeout_now(self, id, request):
+        future = self.replica_stubs[id].rpc_timeout_now.future(request, timeout=config.raft_rpc_timeout / 1000)
+        future.add_done_callback(lambda f: threading.Thread(target=self.handle_timeout_now_response, args=(f,),
+                                                            daemon=True).start())
+    
+
+    """ Handle the response of rpc_timeout_now (the transfer goes on when the target asks for votes) """
+    def handle_timeout_now_response(self, future):
+        try:
+            response = future.result()
+        except grpc.RpcError:
+            return      # the transfer will be given up after the deadline
+        with self.lock:
+            if response.term > self.current_term:
+                self.convert_to_follower(response.term)
+    
+
+    """ Whether this server is the Leader and voter [id] could take over its leadership right away:
+        [id] has acked the whole log within the election timeout
+        (used by the server to move the leaders of its RAFT groups to their preferred replicas)
+    """
+    def can_transfer_to(self, id):
+        with self.lock:
+            return (self.state == Leader and self.transfer_target < 0 and id != self.my_id and id in self.voters
+                    and self.match_index[id] == self.get_last_index()
+                    and time.monotonic() - self.acked_time[id] < self.election_timeout / 1000)
+    
+
+    """ Give up the leadership transfer in progress if its deadline has passed
+        *** Lock must be acquired before calling this function ***
+    """
+    def check_transfer(self):
+        assert self.lock.locked()
+        if self.transfer_target >= 0 and time.monotonic() > self.transfer_deadline:
+            logging.info(f"  RAFT [{self.my_id}] - give up the leadership transfer to [{self.transfer_target}]")
+            self.transfer_target = -1
+            self.read_cond.notify_all()
+    
+
+    """ Timeout_now RPC: the Leader asks this server to start an election at once
+        (the election is marked as a leadership transfer, so the voters ignore the Leader's lease)
+        - Input:
+            request  : pb2.TN_Request object
+        - Return:
+            response : pb2.TN_Response object
+    """
+    def rpc_timeout_now(self, request, context):
+        with self.lock:
+            response = raft_pb2.TN_Response()
+            if request.term > self.current_term:
+                self.convert_to_follower(request.term)
+            response.term = self.current_term
+            if request.term < self.current_term or self.state != Follower or self.is_learner:
+                return response
+            logging.info(f"  RAFT [{self.my_id}] - timeout_now from Leader {request.leader_id}: start an election")
+            self.start_campaign_now()
+            return response
+    
+
+    """ Start campaign_now() (called by rpc_timeout_now())
+        *** Lock must be acquired before calling this function ***
+    """
+    def start_campaign_now(self):
+        threading.Thread(target=self.campaign_now, daemon=True).start()
+    
+
+    """ Become a Candidate now (skipping the pre-vote) and become the Leader as soon as a majority votes """
+    def campaign_now(self):
+        self.convert_to_candidate(Follower, transfer=True)
+        if self.received_majority_vote.wait( self.get_random_election_timeout_second() ):
+            self.convert_to_leader()
+    
+
+    """ Admin command: transfer the leadership (see transfer_leadership())
+        - Input:
+            request  : pb2.TL_Request object
+        - Return:
+            response : pb2.TL_Response object
+    """
+    def rpc_transfer_leadership(self, request, context):
+        (is_leader, success, new_leader_id) = self.transfer_leadership(request.target_id)
+        return raft_pb2.TL_Response(is_leader=is_leader, success=success, new_leader_id=new_leader_id)
+    
+
+    """ Make the latest configuration (self.memberships[-1]) the one in effect: set the voters, 
+        extend the states of the replicas to the new ids, and connect to the new members (and start their replicators). 
+        The replicator of a removed member stops by itself. 
+        *** Lock must be acquired before calling this function ***
+    """
+    def apply_membership(self):
+        members = {m.id: m for m in self.memberships[-1][1].members}
+        n = max([self.n_replicas] + [i + 1 for i in members])
+        if n > self.n_replicas:
+            k = n - self.n_replicas
+            self.replicas += [None] * k
+            self.replica_stubs += [None] * k
+            self.inflight += [0] * k
+            self.heartbeat_due += [False] * k
+            self.pipeline_epoch += [0] * k
+            self.acked_round += [0] * k
+            self.acked_time += [0] * k
+            self.rtt_samples += [deque(maxlen=config.raft_rtt_window) for i in range(k)]
+            self.follower_apply_latency += [0.0] * k
+            if self.next_index is not None:
+                self.next_index += [self.get_last_index() + 1] * k
+                self.match_index += [0] * k
+            self.n_replicas = n
+        for i in range(n):
+            member = members.get(i)
+            old = self.replicas[i]
+            if member is None:
+                self.replicas[i] = None
+                continue
+            self.replicas[i] = config.ServerInfo(i, member.ip_addr, member.client_port, member.raft_port, member.learner)
+            if i != self.my_id and (self.replica_stubs[i] is None or old is None
+                                    or (old.ip_addr, old.raft_port) != (member.ip_addr, member.raft_port)):
+                self.connect_replica(i)
+                if self.started:
+                    self.start_replicator(i)
+        self.voters = [i for i in sorted(members) if not members[i].learner]
+        self.n_voters = len(self.voters)
+        self.is_learner = self.my_id not in self.voters
+    
+
+    """ Create the stub of member [id], at the address in self.replicas[id]
+        *** Lock must be acquired before calling this function ***
+    """
+    def connect_replica(self, id):
+        channel = grpc.insecure_channel(self.replicas[id].ip_addr + ':' + self.replicas[id].raft_port)
+        self.replica_stubs[id] = make_raft_stub(channel)
+    
+
+    """ Start the replicator of follower [id], if it is not running
+        *** Lock must be acquired before calling this function ***
+    """
+    def start_replicator(self, id):
+        if id not in self.replicators:
+            self.replicators.add(id)
+            threading.Thread(target=self.replicate_loop, args=(id,), daemon=True).start()
+    
+
+    """ Record the configuration entries among [entries], just appended to the log, and apply the latest one
+        *** Lock must be acquired before calling this function ***
+    """
+    def track_membership(self, entries):
+        n = len(self.memberships)
+        for entry in entries:
+            if entry.command.HasField("membership"):
+                self.memberships.append((entry.index, entry.command.membership))
+        if len(self.memberships) > n:
+            self.apply_membership()
+    
+
+    """ The log entries with index >= [index] have been deleted: go back to the configuration before them
+        *** Lock must be acquired before calling this function ***
+    """
+    def forget_membership(self, index):
+        if self.memberships[-1][0] >= index:
+            self.memberships = [x for x in self.memberships if x[0] < index]
+            self.apply_membership()
+    
+
+    """ The configuration (raft_pb2.Membership) in effect after the entry [index]  (snapshot_index <= index)
+        *** Lock must be acquired before calling this function ***
+    """
+    def get_membership(self, index):
+        return [membership for (i, membership) in self.memberships if i <= index][-1]
+    
+
+    """ Add RAFT server [member] (a raft_pb2.Member) to the cluster, or change its address or its role,
+        or, if [remove], remove the server member.id from the cluster. 
+        The configuration changes one server at a time (single-server changes, see the RAFT dissertation, 4.1),
+        by a configuration entry in the log, which takes effect on a server as soon as it is in its log:
+        a majority of the old voters and a majority of the new ones always overlap. 
+        A new voter is first added as a learner, and promoted once it has caught up with the log,
+        so that commits do not wait for a voter that is far behind. 
+        Blocks until the (last) configuration entry is committed, or config.raft_membership_timeout. 
+        A Leader that removes itself steps down once the change is committed. 
+        - Return: (is_leader, success)
+    """
+    def change_membership(self, member, remove=False):
+        deadline = time.monotonic() + config.raft_membership_timeout / 1000
+        with self.lock:
+            if self.state != Leader:
+                return (False, False)
+            term = self.current_term
+            members = {m.id: m for m in self.memberships[-1][1].members}
+            if remove:
+                if member.id not in members:
+                    return (True, True)
+                del members[member.id]
+                return (True, self.propose_membership(members, term, deadline))
+            if members.get(member.id) == member:
+                return (True, True)
+            if not member.learner:
+                learner = raft_pb2.Member()
+                learner.CopyFrom(member)
+                learner.learner = True
+                if members.get(member.id) != learner:
+                    members[member.id] = learner
+                    if not self.propose_membership(members, term, deadline):
+                        return (True, False)
+                logging.info(f"  RAFT [{self.my_id}] - wait for [{member.id}] to catch up")
+                caught_up = lambda: (self.state != Leader or self.current_term != term or 
+                                     self.get_last_index() - self.match_index[member.id] <= config.raft_max_append_entries)
+                if not self.wait_until(caught_up, deadline) or self.state != Leader or self.current_term != term:
+                    return (True, False)
+            members[member.id] = member
+            return (True, self.propose_membership(members, term, deadline))
+    
+
+    """ Append a configuration entry with [members] (a dict: id -> raft_pb2.Member) to the log of this Leader of term [term],
+        once the previous configuration is committed and an entry of the current term is committed,
+        then wait until the entry is committed. 
+        - Return: whether the entry was committed before [deadline]
+        *** Lock must be acquired before calling this function ***
+    """
+    def propose_membership(self, members, term, deadline):
+        assert self.lock.locked()
+        ready = lambda: (self.state != Leader or self.current_term != term or 
+                         (self.transfer_target < 0 and self.memberships[-1][0] <= self.commit_index
+                                                   and self.get_term(self.commit_index) == term))
+        if not self.wait_until(ready, deadline) or self.state != Leader or self.current_term != term:
+            return False
+        index = self.get_last_index() + 1
+        membership = raft_pb2.Membership(members=[members[i] for i in sorted(members)])
+        entry = raft_pb2.LogEntry(term=term, index=index, command=raft_pb2.Command(membership=membership))
+        self.logs.append(entry)
+        self.proposals.append(entry)
+        self.proposal_cond.notify()
+        self.track_membership([entry])
+        logging.info(f"  RAFT [{self.my_id}] - configuration at index {index}: voters {self.voters}, "
+                     + f"learners {[m.id for m in membership.members if m.learner]}")
+        # (a Leader that removed itself steps down in the same term once the entry is committed)
+        self.wait_until(lambda: self.current_term != term or self.commit_index >= index, deadline)
+        return self.current_term == term and self.commit_index >= index
+    
+
+    """ Wait until [predicate]() is true or time.monotonic() passes [deadline],
+        checking it whenever read_cond is notified (commits, changes of state) and at every heartbeat. 
+        - Return: whether [predicate]() is true
+        *** Lock must be acquired before calling this function ***
+    """
+    def wait_until(self, predicate, deadline):
+        while not predicate():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.read_cond.wait(min(remaining, self.heartbeat_interval / 1000))
+        return True
+    
+
+    """ Admin command: change the membership (see change_membership())
+        - Input:
+            request  : pb2.CM_Request object
+        - Return:
+            response : pb2.CM_Response object
+    """
+    def rpc_change_membership(self, request, context):
+        (is_leader, success) = self.change_membership(request.member, request.remove)
+        return raft_pb2.CM_Response(is_leader=is_leader, success=success)
+    
+
+    """ Admin command: the metrics of this RAFT server (see get_metrics()), as json
+        - Input:
+            request  : pb2.GM_Request object
+        - Return:
+            response : pb2.GM_Response object
+    """
+    def rpc_get_metrics(self, request, context):
+        return raft_pb2.GM_Response(json=json.dumps(self.get_metrics()))
+    
+
+    """ The applier thread: 'applies' the committed logs,
+        namely, puts the committed log entries to apply_queue to notify the upper-level server. 
+        Woken up by apply_cond when the commit_index advances (or a snapshot is installed),
+        it takes the newly committed entries (at most config.raft_max_apply_batch at a time)
+        and puts them as one list, without holding the lock. 
+        Since this is the only thread that puts to apply_queue, the upper-level server gets everything in order. 
+    """
+    def apply_loop(self):
+        while True:
+            with self.lock:
+                while self.pending_snapshot is None and self.last_applied >= self.commit_index:
+                    self.apply_cond.wait()
+                if self.pending_snapshot is not None:
+                    batch = self.pending_snapshot
+                    self.pending_snapshot = None
+                else:
+                    first = self.last_applied + 1
+                    last = min(self.commit_index, first + config.raft_max_apply_batch - 1)
+                    batch = [self.get_entry(i) for i in range(first, last + 1)]
+                    self.last_applied = last
+                    self.handed_out.append((last, time.monotonic()))
+                    logging.debug(f"    RAFT [{self.my_id}] puts log entries [{first}, {last}] to apply_queue,  commit_index={self.commit_index}")
+            self.apply_queue.put(batch)
+    
+
+    """ The upper-level server has applied the committed entries up to [index] (to its state machine).
+        The apply latency of a batch is the time from when apply_loop() gave it to the server until it is applied
+        (it grows when the server is loaded: GC pauses, a slow host). Followers report its 99th percentile
+        to the Leader in their append_entries responses, and the Leader takes it into account in adapt_timeouts(). 
+    """
+    def applied(self, index):
+        now = time.monotonic()
+        with self.lock:
+            while len(self.handed_out) > 0 and self.handed_out[0][0] <= index:
+                self.apply_latencies.append(now - self.handed_out.popleft()[1])
+            if len(self.apply_latencies) > 0:
+                self.apply_latency_p99 = percentile(self.apply_latencies, 0.99)
     
 
     def DEBUG_information(self):
         return (   f"    RAFT [{self.my_id}], state = [{self.state}], "
                  + f"last_applied=[{self.last_applied}], commit_index=[{self.commit_index}], "
-                 + f"log length = [{self.get_last_index()}], term=[{self.current_term}]")
+                 + f"log length = [{self.get_last_index()}], term=[{self.current_term}], "
+                 + f"lease=[{self.lease_holding}]")
+    
+
+    """ The Leader as far as this server knows: (id, config.ServerInfo), or (-1, None) if unknown """
+    def get_leader(self):
+        with self.lock:
+            if self.leader_id < 0 or self.leader_id >= self.n_replicas or self.replicas[self.leader_id] is None:
+                return (-1, None)
+            return (self.leader_id, self.replicas[self.leader_id])
+    
+
+    """ Some statistics of the RAFT server, as a dict (for logging / monitoring) """
+    def get_metrics(self):
+        with self.lock:
+            lease_remaining = 0
+            if self.state == Leader and self.check_lease():
+                lease_remaining = self.get_lease_expiry() - time.monotonic()
+            return { "state": self.state,
+                     "term": self.current_term,
+                     "leader_id": self.leader_id,
+                     "commit_index": self.commit_index,
+                     "last_applied": self.last_applied,
+                     "read_mode": config.raft_read_mode,
+                     "lease_valid": self.lease_holding,
+                     "lease_remaining_ms": int(lease_remaining * 1000),
+                     "lease_reads": self.lease_reads,
+                     "read_index_reads": self.read_index_reads,
+                     "heartbeat_interval_ms": self.heartbeat_interval,
+                     "election_timeout_ms": (self.election_timeout, self.election_timeout_upper),
+                     "rtt_p50_ms": {i: round(percentile(self.rtt_samples[i], 0.5) * 1000, 2)
+                                    for i in range(self.n_replicas) if len(self.rtt_samples[i]) > 0},
+                     "rtt_p99_ms": {i: round(percentile(self.rtt_samples[i], 0.99) * 1000, 2)
+                                    for i in range(self.n_replicas) if len(self.rtt_samples[i]) > 0},
+                     "apply_latency_p99_ms": round(self.apply_latency_p99 * 1000, 2),
+                     "follower_apply_latency_p99_ms": {i: round(self.follower_apply_latency[i] * 1000, 2)
+                                                       for i in range(self.n_replicas) if self.follower_apply_latency[i] > 0},
+                     "heartbeat_delay_p99_ms": round(percentile(self.heartbeat_delays, 0.99) * 1000, 2)
+                                               if len(self.heartbeat_delays) > 0 else 0 }
 
 
     """ Convert the current RAFT server to Follower
@@ -457,17 +1694,24 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
     """
     def convert_to_follower(self, term):
         assert self.lock.locked
+        self.flush_proposals()          # the WAL must contain the whole log before it is changed by the new Leader
         self.state = Follower
+        if term != self.current_term:
+            self.leader_id = -1
         self.current_term = term
         self.voted_for = -1
+        self.transfer_target = -1
+        self.read_cond.notify_all()     # waiting reads fail
+        self.check_lease()              # the lease is lost
         logging.info(self.DEBUG_information())
         logging.info(f"  RAFT [{self.my_id, self.state}] - convert to Follower")
         self.save()    ## Persistent states chagne. Need to save. 
         
 
     """ Convert the current RAFT server to Candidate
+        (transfer: whether the election was asked by the Leader, see rpc_timeout_now())
     """
-    def convert_to_candidate(self, from_state):
+    def convert_to_candidate(self, from_state, transfer=False):
         logging.info(f"  RAFT [{self.my_id}] - convert to Candidate from state {from_state}")
         logging.info(self.DEBUG_information())
         with self.lock:
@@ -480,10 +1724,11 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
             self.state = Candidate
             self.reset_events()
             self.current_term += 1
+            self.leader_id = -1
             self.voted_for = self.my_id
             self.vote_count = 1
             
-            self.broadcast_request_vote()
+            self.broadcast_request_vote(transfer)
 
             self.save()     ## Persistent states chagne. Need to save.
     
@@ -498,11 +1743,29 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
                 return 
 
             self.state = Leader
+            self.leader_id = self.my_id
+            self.leader_since = time.monotonic()
+            self.transfer_target = -1
             self.reset_events()
 
             last_log_index = self.get_last_index()
             self.next_index = [last_log_index + 1 for i in range(self.n_replicas)]
             self.match_index = [0 for i in range(self.n_replicas)]
+            self.pipeline_epoch = [x + 1 for x in self.pipeline_epoch]
+            self.acked_round = [0 for i in range(self.n_replicas)]
+            self.acked_time = [0 for i in range(self.n_replicas)]
+            self.read_round_wanted = self.read_round_started = self.heartbeat_round = 0
+            self.rtt_samples = [deque(maxlen=config.raft_rtt_window) for i in range(self.n_replicas)]
+            self.follower_apply_latency = [0.0] * self.n_replicas
+            self.heartbeat_delays.clear()
+            self.timeouts_updated = self.leader_since
+
+            # Add a no-op entry (with an empty command), 
+            # so that the entries of previous terms get committed (and reads can be served) soon
+            noop_entry = raft_pb2.LogEntry(term=self.current_term, index=last_log_index + 1,
+                                           command=raft_pb2.Command())
+            self.logs.append(noop_entry)
+            self.save_log_append([noop_entry])
 
             self.broadcast_append_entries()
 
@@ -520,59 +1783,133 @@ class RaftServiceServicer(raft_pb2_grpc.RaftServiceServicer):
         self.received_majority_vote.clear()
     
 
+    """ Set the election timeout of this server to [timeout] ms (clamped to the configured bounds):
+        elections are randomized in [timeout, timeout * election_timeout_upper_bound / election_timeout_lower_bound],
+        and a Leader sends heartbeats every timeout / raft_heartbeats_per_timeout
+    """
+    def set_election_timeout(self, timeout):
+        if config.raft_adaptive_timeouts:
+            timeout = min(max(timeout, config.raft_election_timeout_min), config.raft_election_timeout_max)
+        self.election_timeout = int(timeout)
+        self.election_timeout_upper = int(timeout * config.election_timeout_upper_bound / config.election_timeout_lower_bound)
+        self.heartbeat_interval = max(1, self.election_timeout // config.raft_heartbeats_per_timeout)
+    
+
+    """ Adaptive timeouts (config.raft_adaptive_timeouts): every raft_timeout_update_interval, 
+        the Leader sets its election timeout to raft_timeout_rtt_factor times the sum of
+          - the 99th percentile of the round trip times to a voter plus the 99th percentile of its apply latency
+            (as it reports it, see applied()), for the slowest voter, and
+          - the 99th percentile of the delays of its heartbeats (how late the main loop woke up). 
+        The timeout grows at once, but shrinks by at most 10% per update, so a short calm period does not
+        undo it. The followers learn it from the append_entries requests. 
+        *** Lock must be acquired before calling this function ***
+    """
+    def adapt_timeouts(self):
+        assert self.lock.locked()
+        now = time.monotonic()
+        if not config.raft_adaptive_timeouts or now - self.timeouts_updated < config.raft_timeout_update_interval / 1000:
+            return
+        self.timeouts_updated = now
+        rtts = [percentile(self.rtt_samples[i], 0.99) + self.follower_apply_latency[i] for i in self.voters 
+                if i != self.my_id and len(self.rtt_samples[i]) > 0]
+        delay = percentile(self.heartbeat_delays, 0.99) if len(self.heartbeat_delays) > 0 else 0
+        timeout = config.raft_timeout_rtt_factor * (max(rtts, default=0) + delay) * 1000
+        timeout = max(timeout, self.election_timeout * 0.9)
+        old = (self.election_timeout, self.heartbeat_interval)
+        self.set_election_timeout(timeout)
+        if (self.election_timeout, self.heartbeat_interval) != old:
+            logging.info(f"  RAFT [{self.my_id}] - election timeout {self.election_timeout} ms, "
+                         + f"heartbeat interval {self.heartbeat_interval} ms (RTT + apply latency p99 {int(max(rtts, default=0) * 1000)} ms, "
+                         + f"heartbeat delay p99 {int(delay * 1000)} ms)")
+    
+
     """ function that returns a randomzied election timeout (in seconds)"""
     def get_random_election_timeout_second(self):
-        return random.randint(config.election_timeout_lower_bound,
-                              config.election_timeout_upper_bound) / 1000
+        return random.randint(self.election_timeout, self.election_timeout_upper) / 1000
     
 
     """ Main loop of RAFT server """
     def main_loop(self):
         print(f"  RAFT [{self.my_id}] main loop starts.")
         
-        while True:
+        while not self.stopped:
             state = self.state
             
             if state == Leader:
-                sleep(config.leader_broadcast_interval / 1000)
+                due = time.monotonic() + self.heartbeat_interval / 1000
+                sleep(self.heartbeat_interval / 1000)
                 # sleep(0.5)
                 # At this point, the state of the server may already change (to Follower).
                 with self.lock:
                     if self.state == Leader:
+                        self.heartbeat_delays.append(max(0, time.monotonic() - due))
                         self.broadcast_append_entries()
+                        self.check_quorum()
+                        self.check_transfer()
+                        self.adapt_timeouts()
+                    self.check_lease()      # logs when the lease is lost
 
             elif state == Follower:
                 sleep( self.get_random_election_timeout_second() )
                 logging.debug(f"     heartbeat = {self.heard_heartbeat}")
                 with self.lock:
-                    to_convert_to_candidate =  (not self.heard_heartbeat) and (not self.grant_vote)
+                    # (a learner never becomes a candidate)
+                    to_convert_to_candidate =  (not self.heard_heartbeat) and (not self.grant_vote) and (not self.is_learner)
                     self.heard_heartbeat = False
                     self.grant_vote = False
-                if to_convert_to_candidate:
+                if to_convert_to_candidate and self.pre_vote(state):
                     self.convert_to_candidate(state)
             
             elif state == Candidate:
                 if self.received_majority_vote.wait( self.get_random_election_timeout_second() ): 
                     # received majority vote, can convert to leader
                     self.convert_to_leader()
-                else:
+                elif self.pre_vote(state):
                     # Didn't receive enough votes, convert to candidate again. 
                     # If self.state already become Follower (which is different from state),
                     # then convert_to_candidate will directly return 
                     self.convert_to_candidate(state)
+                else:
+                    # A majority would not vote for me: wait as a Follower (in the same term)
+                    with self.lock:
+                        if self.state == Candidate:
+                            self.state = Follower
+    
+
+    """ Stop the RAFT server: its RPC server and its main loop (e.g., to restart it) """
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.state == Leader:
+                self.step_down()
+            self.state = Follower
+        if self.rpc_server is not None:
+            self.rpc_server.stop(0)
     
 
     """ Customized start of RAFT server"""
     def my_start(self):
         # Start the RPC server
-        my_ip_addr = self.replicas[self.my_id].ip_addr
-        raft_port = self.replicas[self.my_id].raft_port
+        my_ip_addr = self.my_info.ip_addr
+        raft_port = self.my_info.raft_port
         rpc_server = grpc.server(futures.ThreadPoolExecutor(max_workers=128))
         raft_pb2_grpc.add_RaftServiceServicer_to_server(self, rpc_server)
         rpc_server.add_insecure_port(my_ip_addr + ":" + raft_port)
         rpc_server.start()   # calls the gRPC start() function 
         print(f"  RAFT [{self.my_id}] RPC server starts at {my_ip_addr}:{raft_port}")
         threading.Thread(target=rpc_server.wait_for_termination, daemon=True).start()
+        self.rpc_server = rpc_server
+        
+        # Start the applier and the proposer
+        threading.Thread(target=self.apply_loop, daemon=True).start()
+        threading.Thread(target=self.propose_loop, daemon=True).start()
+
+        # Start the replicators of the followers (and of the members added later, see apply_membership())
+        with self.lock:
+            self.started = True
+            for i in range(self.n_replicas):
+                if i != self.my_id and self.replicas[i] is not None:
+                    self.start_replicator(i)
         
         # Start the main loop
         threading.Thread(target=self.main_loop, daemon=True).start()
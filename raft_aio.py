@@ -0,0 +1,384 @@
+""" An asyncio version of the RAFT server (config.raft_implementation = "asyncio"), built on grpc.aio.
+
+    It has the same states, log, persistence format and protocol as raft.RaftServiceServicer,
+    and reuses all its handlers; only the transport and the timers are different:
+    the RPC server, the election timer / heartbeats, the replicators and the request_vote RPCs
+    all run as coroutines on one event loop (in one thread),
+    instead of a thread pool plus one thread per replicator and per outgoing request_vote.
+    The applier and the proposer (which talk to the upper-layer server) are still threads, 
+    and the handlers of the incoming RPCs (which take the lock and write to the disk) run in a small thread pool, 
+    so that they never block the event loop.
+"""
+import logging
+import asyncio
+from concurrent import futures
+import grpc
+import raft_pb2
+import raft_pb2_grpc
+
+import threading
+import time
+import config
+import raft
+from raft import Follower, Candidate, Leader
+
+
+""" Used in place of the threading.Condition / threading.Event of raft.RaftServiceServicer
+    that wake up the coroutines: notify_all() / set() can be called from any thread,
+    and sets the asyncio.Event of each coroutine waiting for it (see new_event()). 
+"""
+class LoopEvent:
+    def __init__(self):
+        self.loop = None     # the event loop, set when it starts
+        self.events = []
+        self.flag = False
+
+    def start(self, loop):
+        self.loop = loop
+
+    """ A new asyncio.Event, set each time this LoopEvent is set (the coroutine clears it itself) """
+    def new_event(self):
+        event = asyncio.Event()
+        if self.flag:
+            event.set()
+        self.events.append(event)
+        return event
+
+    def set(self):
+        self.flag = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.set_events)
+
+    def set_events(self):
+        for event in self.events:
+            event.set()
+
+    def clear(self):
+        self.flag = False
+
+    def is_set(self):
+        return self.flag
+
+    notify = set
+    notify_all = set
+
+    """ Wait until set, for at most [timeout] seconds. Return whether it is set. 
+        (only used by one coroutine) 
+    """
+    async def wait(self, timeout):
+        if len(self.events) == 0:
+            self.new_event()
+        event = self.events[0]
+        deadline = self.loop.time() + timeout
+        while not self.flag:
+            event.clear()    # (it may have been set before the last clear())
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return self.flag
+
+
+class AsyncRaftServiceServicer(raft.RaftServiceServicer):
+
+    def __init__(self, replicas, my_id, apply_queue, need_persistent=True, group=0):
+        self.loop = None    # (set before the initialization of the base class, which connects to the members)
+        super().__init__(replicas, my_id, apply_queue, need_persistent, group)
+        # wakes up the replicators, and the main loop when a Candidate receives a majority of votes
+        self.replicate_cond = LoopEvent()
+        self.received_majority_vote = LoopEvent()
+        self.received_majority_pre_vote = LoopEvent()
+        self.executor = futures.ThreadPoolExecutor(max_workers=4)   # for blocking waits on the disk
+        self.handler_executor = futures.ThreadPoolExecutor(max_workers=8)   # for the handlers of the incoming RPCs
+        self.tasks = set()     # the running tasks (the event loop only keeps weak references to them)
+
+
+    """ Run coroutine [coro] as a task on the event loop """
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+
+    """ Run coroutine [coro] as a task on the event loop, from any thread """
+    def spawn_threadsafe(self, coro):
+        self.loop.call_soon_threadsafe(self.spawn, coro)
+
+
+    ## RPC handlers: the ones of raft.RaftServiceServicer, as coroutines.
+    ## They take the lock (and may write to the disk): they run in handler_executor, not on the event loop
+
+    """ Run [function]([args]) in handler_executor and return its result """
+    async def run_handler(self, function, *args):
+        return await self.loop.run_in_executor(self.handler_executor, function, *args)
+
+    async def rpc_append_entries(self, request, context):
+        response = await self.run_handler(self.handle_append_entries, request)
+        # Reply success only after the new entries are durable
+        if response.success and self.need_persistent:
+            await self.loop.run_in_executor(self.executor, self.storage.wait_durable,
+                                            request.prev_log_index + len(request.entries))
+        return response
+
+    async def rpc_request_vote(self, request, context):
+        return await self.run_handler(super().rpc_request_vote, request, context)
+
+    async def rpc_install_snapshot(self, request, context):
+        return await self.run_handler(super().rpc_install_snapshot, request, context)
+
+    async def rpc_pre_vote(self, request, context):
+        return await self.run_handler(super().rpc_pre_vote, request, context)
+
+    async def rpc_timeout_now(self, request, context):
+        return await self.run_handler(super().rpc_timeout_now, request, context)
+
+    async def rpc_transfer_leadership(self, request, context):
+        # (transfer_leadership() blocks until the transfer is over: run it outside the event loop)
+        return await self.loop.run_in_executor(self.executor, super().rpc_transfer_leadership, request, context)
+
+    async def rpc_change_membership(self, request, context):
+        # (change_membership() blocks until the change is committed: run it outside the event loop)
+        return await self.loop.run_in_executor(self.executor, super().rpc_change_membership, request, context)
+
+    async def rpc_get_metrics(self, request, context):
+        return await self.run_handler(super().rpc_get_metrics, request, context)
+
+
+    ## Members added by a configuration entry (see raft.RaftServiceServicer.apply_membership()):
+    ## their grpc.aio stubs and their replicators are created on the event loop (once it runs, see async_start())
+
+    def connect_replica(self, id):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.connect_replica_now, id)
+
+    def connect_replica_now(self, id):
+        with self.lock:
+            if self.replicas[id] is not None:
+                channel = grpc.aio.insecure_channel(self.replicas[id].ip_addr + ':' + self.replicas[id].raft_port)
+                self.replica_stubs[id] = raft.make_raft_stub(channel)
+
+    def start_replicator(self, id):
+        if id not in self.replicators:
+            self.replicators.add(id)
+            self.loop.call_soon_threadsafe(lambda: self.spawn(self.replicate_loop(id)))
+
+
+    """ Send a request (append_entries or install_snapshot) to follower [id] and handle the response with [callback]
+        (see replicate_loop() of raft.RaftServiceServicer)
+    """
+    async def send_request(self, id, rpc, request, epoch, hb_round, sent_time, callback):
+        future = futures.Future()
+        try:
+            future.set_result(await rpc(request, timeout=config.raft_rpc_timeout / 1000))
+        except grpc.RpcError as e:
+            future.set_exception(e)
+        callback(id, request, epoch, hb_round, sent_time, future)
+
+
+    """ The replicator of follower [id], as a coroutine """
+    async def replicate_loop(self, id):
+        if id not in self.replicate_events:
+            self.replicate_events[id] = self.replicate_cond.new_event()
+        event = self.replicate_events[id]
+        while True:
+            event.clear()
+            with self.lock:
+                if self.replicas[id] is None:
+                    self.replicators.discard(id)    # [id] has been removed from the cluster
+                    return
+                if self.need_to_replicate(id):
+                    self.heartbeat_due[id] = False
+                    self.inflight[id] += 1
+                    epoch = self.pipeline_epoch[id]
+                    hb_round = self.heartbeat_round
+                    sent_time = time.monotonic()
+                    if self.next_index[id] <= self.snapshot_index:
+                        request = self.make_install_snapshot_request()
+                        rpc = self.replica_stubs[id].rpc_install_snapshot
+                        callback = self.on_install_snapshot_done
+                    else:
+                        request = self.make_append_entries_request(id)
+                        rpc = self.replica_stubs[id].rpc_append_entries
+                        callback = self.on_append_entries_done
+                        self.next_index[id] += len(request.entries)
+                else:
+                    request = None
+            if request is None:
+                await event.wait()
+            else:
+                self.spawn(self.send_request(id, rpc, request, epoch, hb_round, sent_time, callback))
+
+
+    """ Send request_vote RPC to a RAFT server, as a coroutine """
+    async def send_request_vote(self, id, request):
+        try:
+            response = await self.replica_stubs[id].rpc_request_vote(request, timeout=config.raft_rpc_timeout / 1000)
+        except grpc.RpcError:
+            logging.debug(f"       no response from {id}")
+            return
+        self.handle_request_vote_response(id, request, response)
+
+
+    """ Broadcast request_vote RPC to all Raft replicas (called on the event loop)
+        *** Lock must be acquired before calling this function ***
+    """
+    def broadcast_request_vote(self, transfer=False):
+        assert self.lock.locked()
+        if self.state != Candidate:
+            return
+        request = raft_pb2.RV_Request()
+        request.term = self.current_term
+        request.candidate_id = self.my_id
+        request.last_log_index = self.get_last_index()
+        request.last_log_term = self.get_last_term()
+        request.leadership_transfer = transfer
+        for i in self.voters:
+            if i != self.my_id:
+                self.spawn(self.send_request_vote(i, request))
+
+
+    """ Run a pre-vote round before an election, as a coroutine (see raft.RaftServiceServicer.pre_vote()) """
+    async def pre_vote(self, from_state):
+        if not config.raft_pre_vote:
+            return True
+        with self.lock:
+            if not self.start_pre_vote(from_state):
+                return False
+        return await self.received_majority_pre_vote.wait( self.get_random_election_timeout_second() )
+
+
+    """ Send the pre_vote RPC [request] to the voters (called on the event loop)
+        *** Lock must be acquired before calling this function ***
+    """
+    def broadcast_pre_vote(self, request):
+        for i in self.voters:
+            if i != self.my_id:
+                self.spawn(self.send_pre_vote(i, request))
+
+
+    """ Send pre_vote RPC to RAFT server [id], as a coroutine """
+    async def send_pre_vote(self, id, request):
+        try:
+            response = await self.replica_stubs[id].rpc_pre_vote(request, timeout=config.raft_rpc_timeout / 1000)
+        except grpc.RpcError:
+            return
+        self.handle_pre_vote_response(id, request, response)
+
+
+    """ Send rpc_timeout_now [request] to RAFT server [id] (may be called outside the event loop) """
+    def send_timeout_now(self, id, request):
+        self.spawn_threadsafe(self.send_timeout_now_async(id, request))
+
+    async def send_timeout_now_async(self, id, request):
+        future = futures.Future()
+        try:
+            future.set_result(await self.replica_stubs[id].rpc_timeout_now(request, timeout=config.raft_rpc_timeout / 1000))
+        except grpc.RpcError as e:
+            future.set_exception(e)
+        self.handle_timeout_now_response(future)
+
+
+    """ Start campaign_now() on the event loop (called by rpc_timeout_now())
+        *** Lock must be acquired before calling this function ***
+    """
+    def start_campaign_now(self):
+        self.spawn_threadsafe(self.campaign_now())
+
+
+    """ Become a Candidate now and become the Leader as soon as a majority votes, as a coroutine """
+    async def campaign_now(self):
+        self.convert_to_candidate(Follower, transfer=True)
+        if await self.received_majority_vote.wait( self.get_random_election_timeout_second() ):
+            self.convert_to_leader()
+
+
+    """ Main loop of RAFT server, as a coroutine """
+    async def main_loop(self):
+        print(f"  RAFT [{self.my_id}] main loop starts (asyncio).")
+
+        while not self.stopped:
+            state = self.state
+
+            if state == Leader:
+                due = time.monotonic() + self.heartbeat_interval / 1000
+                await asyncio.sleep(self.heartbeat_interval / 1000)
+                with self.lock:
+                    if self.state == Leader:
+                        self.heartbeat_delays.append(max(0, time.monotonic() - due))
+                        self.broadcast_append_entries()
+                        self.check_quorum()
+                        self.check_transfer()
+                        self.adapt_timeouts()
+                    self.check_lease()      # logs when the lease is lost
+
+            elif state == Follower:
+                await asyncio.sleep( self.get_random_election_timeout_second() )
+                with self.lock:
+                    # (a learner never becomes a candidate)
+                    to_convert_to_candidate =  (not self.heard_heartbeat) and (not self.grant_vote) and (not self.is_learner)
+                    self.heard_heartbeat = False
+                    self.grant_vote = False
+                if to_convert_to_candidate and await self.pre_vote(state):
+                    self.convert_to_candidate(state)
+
+            elif state == Candidate:
+                if await self.received_majority_vote.wait( self.get_random_election_timeout_second() ):
+                    self.convert_to_leader()
+                elif await self.pre_vote(state):
+                    self.convert_to_candidate(state)
+                else:
+                    with self.lock:
+                        if self.state == Candidate:
+                            self.state = Follower
+
+
+    """ Start the RPC server, the replicators and the main loop on the event loop """
+    async def async_start(self):
+        self.loop = asyncio.get_running_loop()
+        self.received_majority_vote.start(self.loop)
+        self.received_majority_pre_vote.start(self.loop)
+        self.replicate_cond.start(self.loop)
+        # one asyncio.Event per replicator (by id), all set by replicate_cond.notify_all()
+        self.replicate_events = dict()
+
+        for i in range(self.n_replicas):
+            if i != self.my_id:
+                self.connect_replica_now(i)
+
+        my_ip_addr = self.my_info.ip_addr
+        raft_port = self.my_info.raft_port
+        rpc_server = grpc.aio.server()
+        raft_pb2_grpc.add_RaftServiceServicer_to_server(self, rpc_server)
+        rpc_server.add_insecure_port(my_ip_addr + ":" + raft_port)
+        await rpc_server.start()
+        print(f"  RAFT [{self.my_id}] RPC server (asyncio) starts at {my_ip_addr}:{raft_port}")
+
+        with self.lock:
+            self.started = True
+            for i in range(self.n_replicas):
+                if i != self.my_id and self.replicas[i] is not None:
+                    self.start_replicator(i)
+        self.spawn(self.main_loop())
+        self.rpc_server = rpc_server
+        await rpc_server.wait_for_termination()
+
+
+    """ Stop the RAFT server: its RPC server and its main loop """
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            if self.state == Leader:
+                self.step_down()
+            self.state = Follower
+        if self.rpc_server is not None:
+            self.loop.call_soon_threadsafe(lambda: self.spawn(self.rpc_server.stop(0)))
+
+
+    """ Customized start of RAFT server """
+    def my_start(self):
+        threading.Thread(target=self.apply_loop, daemon=True).start()
+        threading.Thread(target=self.propose_loop, daemon=True).start()
+        threading.Thread(target=asyncio.run, args=(self.async_start(),), daemon=True).start()
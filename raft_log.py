@@ -0,0 +1,146 @@
+""" The in-memory log of a RAFT server, stored compactly:
+      - the terms of the entries in an array('q'),
+      - their commands, serialized (raft_pb2.Command), one after another in a bytearray,
+        with the offset of the end of each command in an array('Q').
+    raft_pb2.LogEntry objects are only built when an entry is needed (to be applied),
+    instead of keeping one protobuf object (and one JSON string) per entry.
+    To be sent, the latest entries are encoded once, and the encodings are kept in a cache (see encoded_entry()),
+    so that append_entries requests are assembled by concatenation for every follower and every retry.
+
+    Entries are addressed by their RAFT index. The log starts with a dummy entry, whose index and term
+    are the ones of the last entry replaced by the snapshot (0 and 0 without a snapshot),
+    followed by the entries snapshot_index + 1, ..., last_index().
+"""
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+import raft_pb2
+import config
+
+
+""" The protobuf encoding of the non-negative integer [n] (varint) """
+def encode_varint(n):
+    data = bytearray()
+    while n > 0x7f:
+        data.append((n & 0x7f) | 0x80)
+        n >>= 7
+    data.append(n)
+    return bytes(data)
+
+
+# Key of field "repeated LogEntry entries = 5" of raft_pb2.AE_Request (wire type 2: length-delimited)
+AE_REQUEST_ENTRIES_KEY = bytes([5 << 3 | 2])
+
+
+class RaftLog:
+
+    def __init__(self, snapshot_index=0, snapshot_term=0):
+        self.reset(snapshot_index, snapshot_term)
+
+
+    """ Discard all the entries: the log only has the dummy entry ([snapshot_index], [snapshot_term]) """
+    def reset(self, snapshot_index, snapshot_term):
+        self.snapshot_index = snapshot_index
+        self.terms = array('q', [snapshot_term])  # terms[k] = term of entry (snapshot_index + k)
+        self.data = bytearray()                   # the serialized commands
+        self.ends = array('Q', [0])               # the command of entry (snapshot_index + k) ends at ends[k] in the
+                                                  # stream of all commands, and starts at ends[k-1]
+        self.base = 0                             # position of data[0] in that stream (commands dropped by compact())
+        self.encoded = OrderedDict()              # cache: index -> encoded entry, oldest first (see encoded_entry())
+
+
+    """ Get the index of the last entry in the log """
+    def last_index(self):
+        return self.snapshot_index + len(self.terms) - 1
+
+    """ Get the term of the last entry in the log """
+    def last_term(self):
+        return self.terms[-1]
+
+    """ Get the term of the entry with index [index]  (snapshot_index <= index <= last index) """
+    def term(self, index):
+        return self.terms[index - self.snapshot_index]
+
+    """ Get the serialized command of the entry with index [index]  (snapshot_index < index <= last index) """
+    def command_bytes(self, index):
+        k = index - self.snapshot_index
+        return bytes(self.data[self.ends[k-1] - self.base : self.ends[k] - self.base])
+
+
+    """ Build the raft_pb2.LogEntry with index [index]  (snapshot_index <= index <= last index) """
+    def entry(self, index):
+        entry = raft_pb2.LogEntry(term=self.term(index), index=index)
+        if index > self.snapshot_index:
+            entry.command.ParseFromString(self.command_bytes(index))
+        else:
+            entry.command.SetInParent()
+        return entry
+
+
+    """ The entry with index [index] (snapshot_index < index <= last index), encoded as one element
+        of the entries of a raft_pb2.AE_Request: a serialized request is the serialized request without entries
+        followed by the encoded entries. 
+        The encodings of the last config.raft_entry_cache_size entries encoded are cached. 
+    """
+    def encoded_entry(self, index):
+        encoded = self.encoded.get(index)
+        if encoded is None:
+            k = index - self.snapshot_index
+            command = self.data[self.ends[k-1] - self.base : self.ends[k] - self.base]
+            # a raft_pb2.LogEntry: term = 1 (varint), index = 2 (varint), command = 3 (length-delimited)
+            entry = b"".join([b"\x08", encode_varint(self.terms[k]), b"\x10", encode_varint(index),
+                              b"\x1a", encode_varint(len(command)), command])
+            encoded = AE_REQUEST_ENTRIES_KEY + encode_varint(len(entry)) + entry
+            if len(self.encoded) >= config.raft_entry_cache_size:
+                self.encoded.popitem(last=False)     # (the oldest one)
+            self.encoded[index] = encoded
+        return encoded
+
+
+    """ Append raft_pb2.LogEntry [entry], whose index is last index + 1 """
+    def append(self, entry):
+        assert entry.index == self.last_index() + 1
+        self.terms.append(entry.term)
+        self.data += entry.command.SerializeToString()
+        self.ends.append(self.base + len(self.data))
+
+    """ Append raft_pb2.LogEntry objects [entries], whose indexes follow the last index """
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+
+    """ Delete the entries with index >= [index]  (index > snapshot_index) """
+    def truncate(self, index):
+        k = index - self.snapshot_index
+        if k >= len(self.terms):
+            return
+        del self.data[self.ends[k-1] - self.base:]
+        del self.terms[k:]
+        del self.ends[k:]
+        self.encoded = OrderedDict((i, x) for (i, x) in self.encoded.items() if i < index)
+
+
+    """ Replace the entries up to [index] by the dummy entry ([index], [term]).
+        If the log contains the entry [index] with term [term], the entries after it are kept;
+        otherwise the whole log is discarded.
+    """
+    def compact(self, index, term):
+        if not (self.snapshot_index <= index <= self.last_index() and self.term(index) == term):
+            self.reset(index, term)
+            return
+        k = index - self.snapshot_index
+        del self.data[:self.ends[k] - self.base]
+        self.base = self.ends[k]
+        del self.terms[:k]
+        del self.ends[:k]
+        self.encoded = OrderedDict((i, x) for (i, x) in self.encoded.items() if i > index)
+        self.snapshot_index = index
+
+
+    """ Find the first index whose entry has term >= [term] (terms in a log never decrease),
+        using binary search. Return the last index + 1 if there is no such entry.
+    """
+    def find_first_index_of_term(self, term):
+        return self.snapshot_index + bisect_left(self.terms, term, 1)
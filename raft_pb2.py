@@ -13,7 +13,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nraft.proto\x12\x04raft\"\x17\n\x07\x43ommand\x12\x0c\n\x04json\x18\x01 \x01(\t\"G\n\x08LogEntry\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\r\n\x05index\x18\x02 \x01(\x03\x12\x1e\n\x07\x63ommand\x18\x03 \x01(\x0b\x32\r.raft.Command\"S\n\nPersistent\x12\x14\n\x0c\x63urrent_term\x18\x01 \x01(\x03\x12\x11\n\tvoted_for\x18\x02 \x01(\x05\x12\x1c\n\x04logs\x18\x03 \x03(\x0b\x32\x0e.raft.LogEntry\"\x94\x01\n\nAE_Request\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x11\n\tleader_id\x18\x02 \x01(\x05\x12\x16\n\x0eprev_log_index\x18\x03 \x01(\x03\x12\x15\n\rprev_log_term\x18\x04 \x01(\x03\x12\x1f\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x0e.raft.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x03\",\n\x0b\x41\x45_Response\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x0f\n\x07success\x18\x02 \x01(\x08\"_\n\nRV_Request\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\x05\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x03\x12\x15\n\rlast_log_term\x18\x04 \x01(\x03\"1\n\x0bRV_Response\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\x32\x85\x01\n\x0bRaftService\x12;\n\x12rpc_append_entries\x12\x10.raft.AE_Request\x1a\x11.raft.AE_Response\"\x00\x12\x39\n\x10rpc_request_vote\x12\x10.raft.RV_Request\x1a\x11.raft.RV_Response\"\x00\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nraft.proto\x12\x04raft\"=\n\x07\x43ommand\x12\x0c\n\x04json\x18\x01 \x01(\t\x12$\n\nmembership\x18\x02 \x01(\x0b\x32\x10.raft.Membership\"^\n\x06Member\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0f\n\x07ip_addr\x18\x02 \x01(\t\x12\x13\n\x0b\x63lient_port\x18\x03 \x01(\t\x12\x11\n\traft_port\x18\x04 \x01(\t\x12\x0f\n\x07learner\x18\x05 \x01(\x08\"+\n\nMembership\x12\x1d\n\x07members\x18\x01 \x03(\x0b\x32\x0c.raft.Member\"G\n\x08LogEntry\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\r\n\x05index\x18\x02 \x01(\x03\x12\x1e\n\x07\x63ommand\x18\x03 \x01(\x0b\x32\r.raft.Command\"S\n\nPersistent\x12\x14\n\x0c\x63urrent_term\x18\x01 \x01(\x03\x12\x11\n\tvoted_for\x18\x02 \x01(\x05\x12\x1c\n\x04logs\x18\x03 \x03(\x0b\x32\x0e.raft.LogEntry\"w\n\x08Snapshot\x12\x1b\n\x13last_included_index\x18\x01 \x01(\x03\x12\x1a\n\x12last_included_term\x18\x02 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\x12$\n\nmembership\x18\x04 \x01(\x0b\x32\x10.raft.Membership\"\xae\x01\n\nAE_Request\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x11\n\tleader_id\x18\x02 \x01(\x05\x12\x16\n\x0eprev_log_index\x18\x03 \x01(\x03\x12\x15\n\rprev_log_term\x18\x04 \x01(\x03\x12\x1f\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x0e.raft.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x03\x12\x18\n\x10\x65lection_timeout\x18\x07 \x01(\x05\"r\n\x0b\x41\x45_Response\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x15\n\rconflict_term\x18\x03 \x01(\x03\x12\x16\n\x0e\x63onflict_index\x18\x04 \x01(\x03\x12\x15\n\rapply_latency\x18\x05 \x01(\x01\"|\n\nRV_Request\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\x05\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x03\x12\x15\n\rlast_log_term\x18\x04 \x01(\x03\x12\x1b\n\x13leadership_transfer\x18\x05 \x01(\x08\"1\n\x0bRV_Response\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\"\x9a\x01\n\nIS_Request\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x11\n\tleader_id\x18\x02 \x01(\x05\x12\x1b\n\x13last_included_index\x18\x03 \x01(\x03\x12\x1a\n\x12last_included_term\x18\x04 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12$\n\nmembership\x18\x06 \x01(\x0b\x32\x10.raft.Membership\"\x1b\n\x0bIS_Response\x12\x0c\n\x04term\x18\x01 \x01(\x03\"-\n\nTN_Request\x12\x0c\n\x04term\x18\x01 \x01(\x03\x12\x11\n\tleader_id\x18\x02 \x01(\x05\"\x1b\n\x0bTN_Response\x12\x0c\n\x04term\x18\x01 \x01(\x03\"\x1f\n\nTL_Request\x12\x11\n\ttarget_id\x18\x01 \x01(\x05\"H\n\x0bTL_Response\x12\x11\n\tis_leader\x18\x01 \x01(\x08\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x15\n\rnew_leader_id\x18\x03 \x01(\x05\":\n\nCM_Request\x12\x1c\n\x06member\x18\x01 \x01(\x0b\x32\x0c.raft.Member\x12\x0e\n\x06remove\x18\x02 \x01(\x08\"1\n\x0b\x43M_Response\x12\x11\n\tis_leader\x18\x01 \x01(\x08\x12\x0f\n\x07success\x18\x02 \x01(\x08\"\x0c\n\nGM_Request\"\x1b\n\x0bGM_Response\x12\x0c\n\x04json\x18\x01 \x01(\t2\xf1\x03\n\x0bRaftService\x12;\n\x12rpc_append_entries\x12\x10.raft.AE_Request\x1a\x11.raft.AE_Response\"\x00\x12\x39\n\x10rpc_request_vote\x12\x10.raft.RV_Request\x1a\x11.raft.RV_Response\"\x00\x12=\n\x14rpc_install_snapshot\x12\x10.raft.IS_Request\x1a\x11.raft.IS_Response\"\x00\x12\x35\n\x0crpc_pre_vote\x12\x10.raft.RV_Request\x1a\x11.raft.RV_Response\"\x00\x12\x38\n\x0frpc_timeout_now\x12\x10.raft.TN_Request\x1a\x11.raft.TN_Response\"\x00\x12@\n\x17rpc_transfer_leadership\x12\x10.raft.TL_Request\x1a\x11.raft.TL_Response\"\x00\x12>\n\x15rpc_change_membership\x12\x10.raft.CM_Request\x1a\x11.raft.CM_Response\"\x00\x12\x38\n\x0frpc_get_metrics\x12\x10.raft.GM_Request\x1a\x11.raft.GM_Response\"\x00\x62\x06proto3')
 
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'raft_pb2', globals())
@@ -21,19 +21,45 @@ if _descriptor._USE_C_DESCRIPTORS == False:
 
   DESCRIPTOR._options = None
   _COMMAND._serialized_start=20
-  _COMMAND._serialized_end=43
-  _LOGENTRY._serialized_start=45
-  _LOGENTRY._serialized_end=116
-  _PERSISTENT._serialized_start=118
-  _PERSISTENT._serialized_end=201
-  _AE_REQUEST._serialized_start=204
-  _AE_REQUEST._serialized_end=352
-  _AE_RESPONSE._serialized_start=354
-  _AE_RESPONSE._serialized_end=398
-  _RV_REQUEST._serialized_start=400
-  _RV_REQUEST._serialized_end=495
-  _RV_RESPONSE._serialized_start=497
-  _RV_RESPONSE._serialized_end=546
-  _RAFTSERVICE._serialized_start=549
-  _RAFTSERVICE._serialized_end=682
+  _COMMAND._serialized_end=81
+  _MEMBER._serialized_start=83
+  _MEMBER._serialized_end=177
+  _MEMBERSHIP._serialized_start=179
+  _MEMBERSHIP._serialized_end=222
+  _LOGENTRY._serialized_start=224
+  _LOGENTRY._serialized_end=295
+  _PERSISTENT._serialized_start=297
+  _PERSISTENT._serialized_end=380
+  _SNAPSHOT._serialized_start=382
+  _SNAPSHOT._serialized_end=501
+  _AE_REQUEST._serialized_start=504
+  _AE_REQUEST._serialized_end=678
+  _AE_RESPONSE._serialized_start=680
+  _AE_RESPONSE._serialized_end=794
+  _RV_REQUEST._serialized_start=796
+  _RV_REQUEST._serialized_end=920
+  _RV_RESPONSE._serialized_start=922
+  _RV_RESPONSE._serialized_end=971
+  _IS_REQUEST._serialized_start=974
+  _IS_REQUEST._serialized_end=1128
+  _IS_RESPONSE._serialized_start=1130
+  _IS_RESPONSE._serialized_end=1157
+  _TN_REQUEST._serialized_start=1159
+  _TN_REQUEST._serialized_end=1204
+  _TN_RESPONSE._serialized_start=1206
+  _TN_RESPONSE._serialized_end=1233
+  _TL_REQUEST._serialized_start=1235
+  _TL_REQUEST._serialized_end=1266
+  _TL_RESPONSE._serialized_start=1268
+  _TL_RESPONSE._serialized_end=1340
+  _CM_REQUEST._serialized_start=1342
+  _CM_REQUEST._serialized_end=1400
+  _CM_RESPONSE._serialized_start=1402
+  _CM_RESPONSE._serialized_end=1451
+  _GM_REQUEST._serialized_start=1453
+  _GM_REQUEST._serialized_end=1465
+  _GM_RESPONSE._serialized_start=1467
+  _GM_RESPONSE._serialized_end=1494
+  _RAFTSERVICE._serialized_start=1497
+  _RAFTSERVICE._serialized_end=1994
 # @@protoc_insertion_point(module_scope)
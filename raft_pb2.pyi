@@ -6,35 +6,93 @@ from typing import ClassVar as _ClassVar, Iterable as _Iterable, Mapping as _Map
 DESCRIPTOR: _descriptor.FileDescriptor
 
 class AE_Request(_message.Message):
-    __slots__ = ["entries", "leader_commit", "leader_id", "prev_log_index", "prev_log_term", "term"]
+    __slots__ = ["election_timeout", "entries", "leader_commit", "leader_id", "prev_log_index", "prev_log_term", "term"]
+    ELECTION_TIMEOUT_FIELD_NUMBER: _ClassVar[int]
     ENTRIES_FIELD_NUMBER: _ClassVar[int]
     LEADER_COMMIT_FIELD_NUMBER: _ClassVar[int]
     LEADER_ID_FIELD_NUMBER: _ClassVar[int]
     PREV_LOG_INDEX_FIELD_NUMBER: _ClassVar[int]
     PREV_LOG_TERM_FIELD_NUMBER: _ClassVar[int]
     TERM_FIELD_NUMBER: _ClassVar[int]
+    election_timeout: int
     entries: _containers.RepeatedCompositeFieldContainer[LogEntry]
     leader_commit: int
     leader_id: int
     prev_log_index: int
     prev_log_term: int
     term: int
-    def __init__(self, term: _Optional[int] = ..., leader_id: _Optional[int] = ..., prev_log_index: _Optional[int] = ..., prev_log_term: _Optional[int] = ..., entries: _Optional[_Iterable[_Union[LogEntry, _Mapping]]] = ..., leader_commit: _Optional[int] = ...) -> None: ...
+    def __init__(self, term: _Optional[int] = ..., leader_id: _Optional[int] = ..., prev_log_index: _Optional[int] = ..., prev_log_term: _Optional[int] = ..., entries: _Optional[_Iterable[_Union[LogEntry, _Mapping]]] = ..., leader_commit: _Optional[int] = ..., election_timeout: _Optional[int] = ...) -> None: ...
 
 class AE_Response(_message.Message):
-    __slots__ = ["success", "term"]
+    __slots__ = ["apply_latency", "conflict_index", "conflict_term", "success", "term"]
+    APPLY_LATENCY_FIELD_NUMBER: _ClassVar[int]
+    CONFLICT_INDEX_FIELD_NUMBER: _ClassVar[int]
+    CONFLICT_TERM_FIELD_NUMBER: _ClassVar[int]
     SUCCESS_FIELD_NUMBER: _ClassVar[int]
     TERM_FIELD_NUMBER: _ClassVar[int]
+    apply_latency: float
+    conflict_index: int
+    conflict_term: int
     success: bool
     term: int
-    def __init__(self, term: _Optional[int] = ..., success: bool = ...) -> None: ...
+    def __init__(self, term: _Optional[int] = ..., success: bool = ..., conflict_term: _Optional[int] = ..., conflict_index: _Optional[int] = ..., apply_latency: _Optional[float] = ...) -> None: ...
+
+class CM_Request(_message.Message):
+    __slots__ = ["member", "remove"]
+    MEMBER_FIELD_NUMBER: _ClassVar[int]
+    REMOVE_FIELD_NUMBER: _ClassVar[int]
+    member: Member
+    remove: bool
+    def __init__(self, member: _Optional[_Union[Member, _Mapping]] = ..., remove: bool = ...) -> None: ...
+
+class CM_Response(_message.Message):
+    __slots__ = ["is_leader", "success"]
+    IS_LEADER_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    is_leader: bool
+    success: bool
+    def __init__(self, is_leader: bool = ..., success: bool = ...) -> None: ...
 
 class Command(_message.Message):
+    __slots__ = ["json", "membership"]
+    JSON_FIELD_NUMBER: _ClassVar[int]
+    MEMBERSHIP_FIELD_NUMBER: _ClassVar[int]
+    json: str
+    membership: Membership
+    def __init__(self, json: _Optional[str] = ..., membership: _Optional[_Union[Membership, _Mapping]] = ...) -> None: ...
+
+class GM_Request(_message.Message):
+    __slots__ = []
+    def __init__(self) -> None: ...
+
+class GM_Response(_message.Message):
     __slots__ = ["json"]
     JSON_FIELD_NUMBER: _ClassVar[int]
     json: str
     def __init__(self, json: _Optional[str] = ...) -> None: ...
 
+class IS_Request(_message.Message):
+    __slots__ = ["data", "last_included_index", "last_included_term", "leader_id", "membership", "term"]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    LAST_INCLUDED_INDEX_FIELD_NUMBER: _ClassVar[int]
+    LAST_INCLUDED_TERM_FIELD_NUMBER: _ClassVar[int]
+    LEADER_ID_FIELD_NUMBER: _ClassVar[int]
+    MEMBERSHIP_FIELD_NUMBER: _ClassVar[int]
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    data: bytes
+    last_included_index: int
+    last_included_term: int
+    leader_id: int
+    membership: Membership
+    term: int
+    def __init__(self, term: _Optional[int] = ..., leader_id: _Optional[int] = ..., last_included_index: _Optional[int] = ..., last_included_term: _Optional[int] = ..., data: _Optional[bytes] = ..., membership: _Optional[_Union[Membership, _Mapping]] = ...) -> None: ...
+
+class IS_Response(_message.Message):
+    __slots__ = ["term"]
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    def __init__(self, term: _Optional[int] = ...) -> None: ...
+
 class LogEntry(_message.Message):
     __slots__ = ["command", "index", "term"]
     COMMAND_FIELD_NUMBER: _ClassVar[int]
@@ -45,6 +103,26 @@ class LogEntry(_message.Message):
     term: int
     def __init__(self, term: _Optional[int] = ..., index: _Optional[int] = ..., command: _Optional[_Union[Command, _Mapping]] = ...) -> None: ...
 
+class Member(_message.Message):
+    __slots__ = ["client_port", "id", "ip_addr", "learner", "raft_port"]
+    CLIENT_PORT_FIELD_NUMBER: _ClassVar[int]
+    ID_FIELD_NUMBER: _ClassVar[int]
+    IP_ADDR_FIELD_NUMBER: _ClassVar[int]
+    LEARNER_FIELD_NUMBER: _ClassVar[int]
+    RAFT_PORT_FIELD_NUMBER: _ClassVar[int]
+    client_port: str
+    id: int
+    ip_addr: str
+    learner: bool
+    raft_port: str
+    def __init__(self, id: _Optional[int] = ..., ip_addr: _Optional[str] = ..., client_port: _Optional[str] = ..., raft_port: _Optional[str] = ..., learner: bool = ...) -> None: ...
+
+class Membership(_message.Message):
+    __slots__ = ["members"]
+    MEMBERS_FIELD_NUMBER: _ClassVar[int]
+    members: _containers.RepeatedCompositeFieldContainer[Member]
+    def __init__(self, members: _Optional[_Iterable[_Union[Member, _Mapping]]] = ...) -> None: ...
+
 class Persistent(_message.Message):
     __slots__ = ["current_term", "logs", "voted_for"]
     CURRENT_TERM_FIELD_NUMBER: _ClassVar[int]
@@ -56,16 +134,18 @@ class Persistent(_message.Message):
     def __init__(self, current_term: _Optional[int] = ..., voted_for: _Optional[int] = ..., logs: _Optional[_Iterable[_Union[LogEntry, _Mapping]]] = ...) -> None: ...
 
 class RV_Request(_message.Message):
-    __slots__ = ["candidate_id", "last_log_index", "last_log_term", "term"]
+    __slots__ = ["candidate_id", "last_log_index", "last_log_term", "leadership_transfer", "term"]
     CANDIDATE_ID_FIELD_NUMBER: _ClassVar[int]
     LAST_LOG_INDEX_FIELD_NUMBER: _ClassVar[int]
     LAST_LOG_TERM_FIELD_NUMBER: _ClassVar[int]
+    LEADERSHIP_TRANSFER_FIELD_NUMBER: _ClassVar[int]
     TERM_FIELD_NUMBER: _ClassVar[int]
     candidate_id: int
     last_log_index: int
     last_log_term: int
+    leadership_transfer: bool
     term: int
-    def __init__(self, term: _Optional[int] = ..., candidate_id: _Optional[int] = ..., last_log_index: _Optional[int] = ..., last_log_term: _Optional[int] = ...) -> None: ...
+    def __init__(self, term: _Optional[int] = ..., candidate_id: _Optional[int] = ..., last_log_index: _Optional[int] = ..., last_log_term: _Optional[int] = ..., leadership_transfer: bool = ...) -> None: ...
 
 class RV_Response(_message.Message):
     __slots__ = ["term", "vote_granted"]
@@ -74,3 +154,45 @@ class RV_Response(_message.Message):
     term: int
     vote_granted: bool
     def __init__(self, term: _Optional[int] = ..., vote_granted: bool = ...) -> None: ...
+
+class Snapshot(_message.Message):
+    __slots__ = ["data", "last_included_index", "last_included_term", "membership"]
+    DATA_FIELD_NUMBER: _ClassVar[int]
+    LAST_INCLUDED_INDEX_FIELD_NUMBER: _ClassVar[int]
+    LAST_INCLUDED_TERM_FIELD_NUMBER: _ClassVar[int]
+    MEMBERSHIP_FIELD_NUMBER: _ClassVar[int]
+    data: bytes
+    last_included_index: int
+    last_included_term: int
+    membership: Membership
+    def __init__(self, last_included_index: _Optional[int] = ..., last_included_term: _Optional[int] = ..., data: _Optional[bytes] = ..., membership: _Optional[_Union[Membership, _Mapping]] = ...) -> None: ...
+
+class TL_Request(_message.Message):
+    __slots__ = ["target_id"]
+    TARGET_ID_FIELD_NUMBER: _ClassVar[int]
+    target_id: int
+    def __init__(self, target_id: _Optional[int] = ...) -> None: ...
+
+class TL_Response(_message.Message):
+    __slots__ = ["is_leader", "new_leader_id", "success"]
+    IS_LEADER_FIELD_NUMBER: _ClassVar[int]
+    NEW_LEADER_ID_FIELD_NUMBER: _ClassVar[int]
+    SUCCESS_FIELD_NUMBER: _ClassVar[int]
+    is_leader: bool
+    new_leader_id: int
+    success: bool
+    def __init__(self, is_leader: bool = ..., success: bool = ..., new_leader_id: _Optional[int] = ...) -> None: ...
+
+class TN_Request(_message.Message):
+    __slots__ = ["leader_id", "term"]
+    LEADER_ID_FIELD_NUMBER: _ClassVar[int]
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    leader_id: int
+    term: int
+    def __init__(self, term: _Optional[int] = ..., leader_id: _Optional[int] = ...) -> None: ...
+
+class TN_Response(_message.Message):
+    __slots__ = ["term"]
+    TERM_FIELD_NUMBER: _ClassVar[int]
+    term: int
+    def __init__(self, term: _Optional[int] = ...) -> None: ...
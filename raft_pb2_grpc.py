@@ -24,6 +24,36 @@ class RaftServiceStub(object):
                 request_serializer=raft__pb2.RV_Request.SerializeToString,
                 response_deserializer=raft__pb2.RV_Response.FromString,
                 )
+        self.rpc_install_snapshot = channel.unary_unary(
+                '/raft.RaftService/rpc_install_snapshot',
+                request_serializer=raft__pb2.IS_Request.SerializeToString,
+                response_deserializer=raft__pb2.IS_Response.FromString,
+                )
+        self.rpc_pre_vote = channel.unary_unary(
+                '/raft.RaftService/rpc_pre_vote',
+                request_serializer=raft__pb2.RV_Request.SerializeToString,
+                response_deserializer=raft__pb2.RV_Response.FromString,
+                )
+        self.rpc_timeout_now = channel.unary_unary(
+                '/raft.RaftService/rpc_timeout_now',
+                request_serializer=raft__pb2.TN_Request.SerializeToString,
+                response_deserializer=raft__pb2.TN_Response.FromString,
+                )
+        self.rpc_transfer_leadership = channel.unary_unary(
+                '/raft.RaftService/rpc_transfer_leadership',
+                request_serializer=raft__pb2.TL_Request.SerializeToString,
+                response_deserializer=raft__pb2.TL_Response.FromString,
+                )
+        self.rpc_change_membership = channel.unary_unary(
+                '/raft.RaftService/rpc_change_membership',
+                request_serializer=raft__pb2.CM_Request.SerializeToString,
+                response_deserializer=raft__pb2.CM_Response.FromString,
+                )
+        self.rpc_get_metrics = channel.unary_unary(
+                '/raft.RaftService/rpc_get_metrics',
+                request_serializer=raft__pb2.GM_Request.SerializeToString,
+                response_deserializer=raft__pb2.GM_Response.FromString,
+                )
 
 
 class RaftServiceServicer(object):
@@ -41,6 +71,46 @@ class RaftServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def rpc_install_snapshot(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def rpc_pre_vote(self, request, context):
+        """PreVote: would the receiver vote for the sender in term request.term? (nothing changes on the receiver)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def rpc_timeout_now(self, request, context):
+        """Leadership transfer: the Leader tells the receiver to start an election at once
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def rpc_transfer_leadership(self, request, context):
+        """Admin command: ask the Leader to transfer its leadership (e.g., before restarting it)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def rpc_change_membership(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def rpc_get_metrics(self, request, context):
+        """Admin command: the metrics of the receiver (see get_metrics())
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_RaftServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -54,6 +124,36 @@ def add_RaftServiceServicer_to_server(servicer, server):
                     request_deserializer=raft__pb2.RV_Request.FromString,
                     response_serializer=raft__pb2.RV_Response.SerializeToString,
             ),
+            'rpc_install_snapshot': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_install_snapshot,
+                    request_deserializer=raft__pb2.IS_Request.FromString,
+                    response_serializer=raft__pb2.IS_Response.SerializeToString,
+            ),
+            'rpc_pre_vote': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_pre_vote,
+                    request_deserializer=raft__pb2.RV_Request.FromString,
+                    response_serializer=raft__pb2.RV_Response.SerializeToString,
+            ),
+            'rpc_timeout_now': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_timeout_now,
+                    request_deserializer=raft__pb2.TN_Request.FromString,
+                    response_serializer=raft__pb2.TN_Response.SerializeToString,
+            ),
+            'rpc_transfer_leadership': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_transfer_leadership,
+                    request_deserializer=raft__pb2.TL_Request.FromString,
+                    response_serializer=raft__pb2.TL_Response.SerializeToString,
+            ),
+            'rpc_change_membership': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_change_membership,
+                    request_deserializer=raft__pb2.CM_Request.FromString,
+                    response_serializer=raft__pb2.CM_Response.SerializeToString,
+            ),
+            'rpc_get_metrics': grpc.unary_unary_rpc_method_handler(
+                    servicer.rpc_get_metrics,
+                    request_deserializer=raft__pb2.GM_Request.FromString,
+                    response_serializer=raft__pb2.GM_Response.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'raft.RaftService', rpc_method_handlers)
@@ -97,3 +197,105 @@ class RaftService(object):
             raft__pb2.RV_Response.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_install_snapshot(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/raft.RaftService/rpc_install_snapshot',
+            raft__pb2.IS_Request.SerializeToString,
+            raft__pb2.IS_Response.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_pre_vote(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/raft.RaftService/rpc_pre_vote',
+            raft__pb2.RV_Request.SerializeToString,
+            raft__pb2.RV_Response.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_timeout_now(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/raft.RaftService/rpc_timeout_now',
+            raft__pb2.TN_Request.SerializeToString,
+            raft__pb2.TN_Response.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_transfer_leadership(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/raft.RaftService/rpc_transfer_leadership',
+            raft__pb2.TL_Request.SerializeToString,
+            raft__pb2.TL_Response.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_change_membership(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/raft.RaftService/rpc_change_membership',
+            raft__pb2.CM_Request.SerializeToString,
+            raft__pb2.CM_Response.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def rpc_get_metrics(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/raft.RaftService/rpc_get_metrics',
+            raft__pb2.GM_Request.SerializeToString,
+            raft__pb2.GM_Response.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -0,0 +1,335 @@
+""" Persistent storage of a RAFT server:
+      - a small metadata file that records current_term and voted_for,
+      - a segmented, append-only write-ahead log (WAL) that records the log entries,
+      - a snapshot file that records the latest raft_pb2.Snapshot of the state machine.
+        Segments whose entries are all covered by the snapshot are deleted (see compact()). 
+
+    Each WAL segment is a file named by the index of its first entry, e.g. "00000000000000000001.wal".
+    A segment is a sequence of records, one record per log entry:
+        [ length (4 bytes) | crc32 (4 bytes) | serialized raft_pb2.LogEntry (length bytes) ]
+    Appending an entry only writes the new record at the end of the last segment,
+    and deleting the tail of the log only truncates (or removes) the last segment(s).
+
+    Durability of the WAL is controlled by config.raft_durability:
+      - "none"  : entries are handed to the OS but never fsync-ed,
+      - "batch" : group commit. A background thread fsyncs all the entries written within
+                  a short window (or up to a byte budget) at once, and releases their waiters together,
+      - "entry" : every append is fsync-ed before it returns.
+"""
+import os
+import struct
+import zlib
+import threading
+
+import raft_pb2
+import config
+
+HEADER = struct.Struct(">II")     # (length, crc32) of a record
+
+
+class RaftStorage:
+
+    """ - Input:
+            dirname      : the directory where the metadata file and the WAL segments are saved
+            segment_size : a new segment is started when the last one exceeds this many bytes
+            durability   : "none", "batch" or "entry", see above
+            on_durable   : (optional) function called with the new durable index
+                           each time the group commit makes more entries durable
+    """
+    def __init__(self, dirname, segment_size=config.raft_wal_segment_size,
+                 durability=config.raft_durability, on_durable=None):
+        assert durability in ("none", "batch", "entry")
+        self.dirname = dirname
+        self.segment_size = segment_size
+        self.durability = durability
+        self.on_durable = on_durable
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self.meta_filename = os.path.join(dirname, "meta")
+        self.snapshot_filename = os.path.join(dirname, "snapshot")
+
+        self.segments = []    # first indexes of the segments, in increasing order
+        self.offsets = []     # offsets[k] = byte offset of entry (first_index + k) in its segment
+        self.first_index = 1  # index of the first entry in the WAL
+        self.file = None      # file object of the last segment, opened for appending
+
+        ## Group commit:
+        self.cond = threading.Condition()   # protects the fields below and notifies the waiters
+        self.durable_index = 0    # all entries with index <= durable_index are on disk
+        self.pending_bytes = 0    # number of bytes written but not fsync-ed yet
+        self.truncations = 0      # number of truncations so far, to detect a truncation during fsync
+        if self.durability == "batch":
+            threading.Thread(target=self.group_commit_loop, daemon=True).start()
+
+
+    """ Index of the entry that will be appended next """
+    def next_index(self):
+        return self.first_index + len(self.offsets)
+
+
+    """ Index of the last entry that is on disk (according to the durability mode) """
+    def get_durable_index(self):
+        with self.cond:
+            return self.durable_index
+
+
+    def segment_filename(self, first_index):
+        return os.path.join(self.dirname, f"{first_index:020d}.wal")
+
+
+    """ Save current_term and voted_for to the metadata file. """
+    def save_meta(self, current_term, voted_for):
+        persistent = raft_pb2.Persistent(current_term=current_term, voted_for=voted_for)
+        self.write_file(self.meta_filename, persistent.SerializeToString())
+
+
+    """ Save a raft_pb2.Snapshot to the snapshot file. """
+    def save_snapshot(self, snapshot):
+        self.write_file(self.snapshot_filename, snapshot.SerializeToString())
+
+
+    """ Read the raft_pb2.Snapshot from the snapshot file. Return None if there is no snapshot. """
+    def load_snapshot(self):
+        if not os.path.exists(self.snapshot_filename):
+            return None
+        snapshot = raft_pb2.Snapshot()
+        with open(self.snapshot_filename, "rb") as f:
+            snapshot.ParseFromString(f.read())
+        return snapshot
+
+
+    """ Write [data] to a temporary file and then rename it to [filename],
+        so the file is never half-written.
+    """
+    def write_file(self, filename, data):
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(data)
+            if self.durability != "none":
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_filename, filename)
+
+
+    """ Append log entries to the end of the WAL.
+        The entries are durable when this function returns only in the "entry" mode;
+        in the "batch" mode, use wait_durable() to wait for the group commit. 
+        - Input: entries : a list of raft_pb2.LogEntry, whose indexes continue the WAL
+    """
+    def append(self, entries):
+        if len(entries) == 0:
+            return
+        n_bytes = 0
+        with self.cond:
+            for entry in entries:
+                assert entry.index == self.next_index()
+                if self.file is None or self.file.tell() >= self.segment_size:
+                    self.start_segment(entry.index)
+                data = entry.SerializeToString()
+                self.offsets.append(self.file.tell())
+                self.file.write(HEADER.pack(len(data), zlib.crc32(data)))
+                self.file.write(data)
+                n_bytes += HEADER.size + len(data)
+                if self.durability == "entry":
+                    self.file.flush()
+                    os.fsync(self.file.fileno())
+            self.file.flush()
+
+            if self.durability == "batch":
+                self.pending_bytes += n_bytes
+                self.cond.notify_all()     # wake up the group commit thread
+            else:
+                self.durable_index = self.next_index() - 1
+
+
+    """ Block until all the entries with index <= [index] are durable,
+        or until they are truncated from the WAL.
+    """
+    def wait_durable(self, index):
+        with self.cond:
+            while self.durable_index < min(index, self.next_index() - 1):
+                self.cond.wait()
+
+
+    """ The group commit thread (used in the "batch" mode):
+        waits for written entries, lets more writes join them for config.raft_group_commit_window
+        milliseconds (or until config.raft_group_commit_bytes are pending), then fsyncs them all at once
+        and releases all their waiters. 
+    """
+    def group_commit_loop(self):
+        window = config.raft_group_commit_window / 1000
+        while True:
+            with self.cond:
+                while self.durable_index >= self.next_index() - 1 or self.file is None:
+                    self.cond.wait()
+                if self.pending_bytes < config.raft_group_commit_bytes:
+                    self.cond.wait_for(lambda: self.pending_bytes >= config.raft_group_commit_bytes, window)
+                if self.file is None:
+                    continue
+                target = self.next_index() - 1
+                truncations = self.truncations
+                self.pending_bytes = 0
+                fd = os.dup(self.file.fileno())
+            
+            # fsync without holding the lock, so new entries can be written in the meantime
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            
+            with self.cond:
+                if self.truncations != truncations:
+                    # entries may have been replaced during the fsync: retry
+                    continue
+                self.durable_index = max(self.durable_index, target)
+                durable_index = self.durable_index
+                self.cond.notify_all()
+            if self.on_durable is not None:
+                self.on_durable(durable_index)
+
+
+    """ Start a new segment whose first entry has index [first_index] """
+    def start_segment(self, first_index):
+        if self.file is not None:
+            self.file.flush()
+            if self.durability != "none":
+                os.fsync(self.file.fileno())   # the group commit only fsyncs the last segment
+            self.file.close()
+        self.segments.append(first_index)
+        self.file = open(self.segment_filename(first_index), "ab")
+
+
+    """ Delete all the entries with index >= [index] from the WAL """
+    def truncate(self, index):
+        with self.cond:
+            self.truncate_locked(index)
+            self.cond.notify_all()     # waiters of the deleted entries can return
+
+
+    def truncate_locked(self, index):
+        if index >= self.next_index():
+            return
+        self.truncations += 1
+        self.durable_index = min(self.durable_index, index - 1)
+        index = max(index, self.first_index)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        # Remove the segments that start after [index]
+        while self.segments and self.segments[-1] > index:
+            os.remove(self.segment_filename(self.segments.pop()))
+
+        # Cut the tail of the segment that contains [index] (or remove it if it starts at [index])
+        offset = self.offsets[index - self.first_index]
+        del self.offsets[index - self.first_index:]
+        if self.segments and self.segments[-1] == index:
+            os.remove(self.segment_filename(self.segments.pop()))
+        elif self.segments:
+            os.truncate(self.segment_filename(self.segments[-1]), offset)
+        if self.segments:
+            self.file = open(self.segment_filename(self.segments[-1]), "ab")
+
+
+    """ Delete the segments that only contain entries with index <= [index]
+        (because these entries are covered by a snapshot).
+        The last segment is always kept, as new entries are appended to it.
+    """
+    def compact(self, index):
+        with self.cond:
+            while len(self.segments) > 1 and self.segments[1] <= index + 1:
+                os.remove(self.segment_filename(self.segments.pop(0)))
+                del self.offsets[: self.segments[0] - self.first_index]
+                self.first_index = self.segments[0]
+
+
+    """ Delete the whole WAL, so the next appended entry will have index [next_index].
+        (Used when a snapshot replaces the whole log)
+    """
+    def reset(self, next_index):
+        with self.cond:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for first_index in self.segments:
+                os.remove(self.segment_filename(first_index))
+            self.segments = []
+            self.offsets = []
+            self.first_index = next_index
+            self.truncations += 1
+            self.durable_index = next_index - 1
+            self.cond.notify_all()
+
+
+    """ Read the persistent states from disk.
+        - Return: (current_term, voted_for, entries),
+                  where entries is the list of raft_pb2.LogEntry recorded in the WAL.
+                  Return None if there is no saved state.
+    """
+    def load(self):
+        self.segments = sorted(int(name[:-len(".wal")]) for name in os.listdir(self.dirname)
+                                                        if name.endswith(".wal"))
+        persistent = raft_pb2.Persistent(current_term=0, voted_for=-1)
+        if os.path.exists(self.meta_filename):
+            with open(self.meta_filename, "rb") as f:
+                persistent.ParseFromString(f.read())
+        elif not self.segments and not os.path.exists(self.snapshot_filename):
+            return None
+
+        self.offsets = []
+        if self.segments:
+            self.first_index = self.segments[0]
+        entries = []
+        for k, first_index in enumerate(self.segments):
+            filename = self.segment_filename(first_index)
+            offset = 0
+            if first_index == self.next_index():
+                with open(filename, "rb") as f:
+                    data = f.read()
+                while offset < len(data):
+                    entry = self.parse_record(data, offset)
+                    if entry is None or entry.index != self.next_index():
+                        break
+                    self.offsets.append(offset)
+                    entries.append(entry)
+                    offset += HEADER.size + HEADER.unpack_from(data, offset)[0]
+                if offset == len(data):
+                    continue
+            # A torn or corrupted record (e.g. the server crashed while writing) or a missing segment:
+            # drop it together with everything after it
+            for later in self.segments[k+1:]:
+                os.remove(self.segment_filename(later))
+            del self.segments[k+1:]
+            if offset > 0:
+                os.truncate(filename, offset)
+            else:
+                os.remove(filename)
+                del self.segments[k]
+            break
+
+        if self.segments:
+            self.file = open(self.segment_filename(self.segments[-1]), "ab")
+        with self.cond:
+            self.durable_index = self.next_index() - 1
+        return (persistent.current_term, persistent.voted_for, entries)
+
+
+    """ Parse the record at [offset] of [data]. Return None if the record is incomplete or corrupted """
+    def parse_record(self, data, offset):
+        if offset + HEADER.size > len(data):
+            return None
+        length, crc = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        payload = data[start : start+length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            return None
+        entry = raft_pb2.LogEntry()
+        entry.ParseFromString(payload)
+        return entry
+
+
+    def close(self):
+        with self.cond:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
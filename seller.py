@@ -12,6 +12,7 @@ import time
 import threading
 import copy
 
+import config
 import utils
 from utils import UserData, AuctionData, ItemData, price_to_string
 
@@ -32,6 +33,8 @@ class Data():
         self.lock = threading.Lock()
         # A dictionary that maps each seller's username to their RPC service stub
         self.rpc_stubs = {}
+        # A mapping from the id of a started auction to its buyers (and their status) as last written to the platform's log
+        self.pushed_buyers = {}
 
 
 class Seller(QObject):
@@ -76,6 +79,11 @@ class Seller(QObject):
 
         # Start a loop to periodically sync information with the platform, see the definition of sync_information_loop() for details """
         threading.Thread(target=self.sync_information_loop, args=(1,), daemon=True).start()
+        # Get the auctions from the platform as they change (see utils.watch_auctions()), instead of fetching them every second
+        if config.watch_auctions:
+            request = { "op": "SELLER_FETCH_AUCTIONS",
+                        "username": self.data.username }
+            utils.watch_auctions(request, self.server_stubs, self.handle_watched_auctions)
 
         # Finally, update UI (by emitting signal to notify the UI component)
         self.ui_update_all_signal.emit()
@@ -292,10 +300,13 @@ class Seller(QObject):
             request["op"] = "SELLER_FINISH_AUCTION"
             request["username"] = self.data.username
         # repeatedly send the request to the server until the server acknowledges
+        # (with the same sequence number every time, so the platform applies it only once)
+        sequence = utils.new_sequence()
         while True:
-            server_ok, respone = self.rpc_to_server(request)
+            server_ok, respone = self.rpc_to_server(request, sequence)
             if server_ok:
                 break
+        utils.finish_sequence(sequence)
     
     
     def price_increment_loop(self, auction_id):
@@ -363,6 +374,7 @@ class Seller(QObject):
             else: 
                 # If the auction is resumed, no need to reset round_id and current_price 
                 auction.resume = False
+            self.data.pushed_buyers[auction_id] = copy.deepcopy(auction.buyers)
         
         # Finally, start a loop to continuously increase the price
         threading.Thread(target=self.price_increment_loop, args=(auction_id,), daemon=True).start()
@@ -394,8 +406,9 @@ class Seller(QObject):
     def sync_information_loop(self, interval = 1):
         """ Periodically sync information with the platform """
         while True:
-            # (1) Fetch all the auction data (and update the local data)
-            self.fetch_auctions_from_server_and_update()
+            # (1) Fetch all the auction data (and update the local data), unless they are watched
+            if not config.watch_auctions:
+                self.fetch_auctions_from_server_and_update()
 
             # (2) Update the addresses (RPC stubs) of all buyers in all auctions
             #   (2.1) copy the auction ids for thread-safety reasons
@@ -417,6 +430,10 @@ class Seller(QObject):
     def push_started_auction_data_to_server(self):
         """ Push the data of all started auctions to the platform
             (because the latest information of started auctions is maintained by the seller).
+            The progress of an auction (price and round) goes through the progress channel of the platform
+            (soft state, see utils.send_auction_progress()); only the auctions whose buyers have changed (withdrawals)
+            are written to the platform's log, with a SELLER_UPDATE_AUCTION request. 
+            (Without config.auction_progress_channel, every auction is written to the log.)
         """
         # First, for thread-safety reason, copy the list of started (and not finished) auctions
         started_auction_list = []
@@ -426,22 +443,46 @@ class Seller(QObject):
                     started_auction_list.append( auction_id )
         # Then, for each auction in the list, update information to the server
         logging.info(f"Pushing auction data to server {started_auction_list}")
+        progress = []
         for id in started_auction_list:
             # Make a RPC request which copies the auction's data
             with self.data.lock:
                 request = self.data.my_auctions[id].to_dict()
+                if config.auction_progress_channel and self.data.pushed_buyers.get(id) == request["buyers"]:
+                    progress.append(request)
+                    continue
                 request["username"] = self.data.username
                 request["op"] = "SELLER_UPDATE_AUCTION"
-            # Then send this request to the server. Discard the response
-            self.rpc_to_server(request)
+            # Then send this request to the server
+            server_ok, response = self.rpc_to_server(request)
+            if server_ok and response["success"]:
+                with self.data.lock:
+                    self.data.pushed_buyers[id] = request["buyers"]
+        # Send the progress of the other auctions at once. Discard the response
+        if len(progress) > 0:
+            utils.send_auction_progress(progress, self.server_stubs)
 
     
+    def handle_watched_auctions(self, auctions):
+        """ The platform sends the auctions that changed (dictionaries): update the local data. """
+        list_of_auctions = []
+        for d in auctions:
+            a = AuctionData()
+            a.update_from_dict(d)
+            list_of_auctions.append(a)
+        self.update_auctions_from_platform(list_of_auctions)
+    
+
     def fetch_auctions_from_server_and_update(self):
         """ Fetch all the auctions of this seller from the platform to update the local data. """
-        auction_list_needs_update = False   # records whether the auciton list in the UI needs to be updated
         ok, platform_auctions = self.get_all_auctions_from_server()
         if not ok: return 
-        
+        self.update_auctions_from_platform(platform_auctions)
+    
+
+    def update_auctions_from_platform(self, platform_auctions):
+        """ Update the local data with the auctions from the platform (a list of AuctionData). """
+        auction_list_needs_update = False   # records whether the auciton list in the UI needs to be updated
         for pa in platform_auctions:
             if pa.seller.username != self.data.username:
                 # ignore auctions that are not this seller's
@@ -544,9 +585,9 @@ class Seller(QObject):
         
     
 
-    def rpc_to_server(self, request):
+    def rpc_to_server(self, request, sequence=None):
         # return test_toolkit.test_1.rpc_to_server(request)
-        return utils.rpc_to_server_stubs(request, self.server_stubs)
+        return utils.rpc_to_server_stubs(request, self.server_stubs, sequence)
 
 
 
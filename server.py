@@ -6,146 +6,426 @@ import auction_pb2
 import auction_pb2_grpc
 
 import sys
+import signal
 import threading
 import queue
 import json
+import time
+from concurrent.futures import TimeoutError
 
 from server_state_machine import StateMachine
+from pending_results import PendingResults
 
 import raft
+import raft_aio
 import raft_pb2
 
 import config
+import sharding
 
-""" The server class:
-    A server instance contains a state_machine and a RAFT instance, 
-    and provide RPC service to the client. 
+""" A shard of the platform (see sharding.py):
+    a RAFT instance replicating the requests of the shard, and the state machine they are applied to. 
 
     Workflow: 
-     - The server takes client's request from RPC. 
-     - The server then puts this request to a log maintained by the RAFT instance.
+     - The server takes client's request from RPC, and gives it to the shard the request is for. 
+     - The shard then puts this request to a log maintained by the RAFT instance.
        RAFT will replicate this request to other serves. 
      - When a request is committed (replicated on a majority of servers),
-       the RAFT instance will notify the server. 
-     - Then, the server applies this request to the state_machine,
-       and responds to the client. 
+       the RAFT instance will notify the shard. 
+     - Then, the shard applies this request to the state_machine,
+       and the server responds to the client. 
 """
-class PlatformServiceServicer(auction_pb2_grpc.PlatformServiceServicer):
+class RaftShard:
 
-    """ Customized initialization """
-    def my_init(self, replicas, my_id, need_persistent):
-        self.replicas = replicas
-        self.my_id = my_id
+    def __init__(self, replicas, my_id, need_persistent, shard):
+        self.shard = shard
 
-        self.state_machine = StateMachine()   # state_machine
-        self.results = dict()   # a dictionary that stores the response for each client request
+        self.state_machine = StateMachine(shard, config.n_shards)   # state_machine
+        self.results = PendingResults()   # the responses that the client requests added to the log wait for
 
         self.lock = threading.Lock()
 
+        # index of the last log entry applied to the state machine, and a condition to wait for it to grow
+        self.applied_index = 0
+        self.applied_cond = threading.Condition(self.lock)
+        self.stopped = False
+
         # a queue of requests that have been commited by RAFT but not applied to the state machine yet. 
         self.apply_queue = queue.Queue()
 
-        # create a RAFT instance
-        self.rf = raft.RaftServiceServicer(replicas, my_id, self.apply_queue, need_persistent)
+        # create a RAFT instance, in its own RAFT group (with its own ports and its own records)
+        replicas = sharding.shard_replicas(replicas, shard)
+        if config.raft_implementation == "asyncio":
+            self.rf = raft_aio.AsyncRaftServiceServicer(replicas, my_id, self.apply_queue, need_persistent, shard)
+        else:
+            self.rf = raft.RaftServiceServicer(replicas, my_id, self.apply_queue, need_persistent, shard)
     
 
-    """ This function has been re-written compared with assignment 3"""
-    """ The RPC service provided to the client.
+    """ Serve a platform request of this shard.
         Input:
             request  : a pb2.PlatformServiceRequest object
+            re       : the request, as a dictionary
+            timeout  : how long (seconds) the request may wait to be applied (or, for a read, its read index)
         Return:
             response : a pb2.PlatformServiceResponse ojbect
     """
-    def rpc_platform_serve(self, request, context):
-        
-        # convert json to commands
-        re  = json.loads(request.json)
+    def serve(self, request, re, timeout):
         op = re["op"]
         if "username" in re: username = re["username"]
         else: username = re["seller_username"]
 
-        # both read only and write only goes through raft
-        # # if the request is a read only request, directly read and respond
-        # if re["op"] in config.PLATFORM_READ_ONLY_OP:
-        #    logging.info(f" Platform: receives read only op={op}, username = {username}.")
-        #    return self.state_machine.apply(re)
+        # if the request is a read only request, serve it without adding it to the log (ReadIndex):
+        #   RAFT confirms that this server is still the leader and returns the commit index at the time of the request,
+        #   then we wait until the state machine has applied that index, and read from it directly. 
+        #   (with config.raft_read_mode = "lease", a leader holding its lease answers without any round trip)
+        if op in config.PLATFORM_READ_ONLY_OP:
+            logging.info(f" Platform: receives read only op={op}, username = {username}, shard = {self.shard}.")
+            if config.follower_reads and op in config.FOLLOWER_READ_OP and self.rf.state != raft.Leader:
+                return self.follower_read(re, request.min_index)
+            (index, is_leader) = self.rf.read_index()
+            if not is_leader:
+                return self.not_leader_response()
+            with self.lock:
+                # (if the state machine falls behind, the client tries again rather than waiting forever)
+                if not self.applied_cond.wait_for(lambda: self.applied_index >= index, timeout):
+                    logging.info(f" Platform Server: index {index} not applied in time for a read, shard = {self.shard}")
+                    return self.not_leader_response()
+                response = self.state_machine.apply(re)
+                response.applied_index = self.applied_index
+            response.is_leader = True
+            return response
 
         # if the request is write related request, use raft
-        logging.info(f" Platform: receives op={op}, username = {username}.")
+        logging.info(f" Platform: receives op={op}, username = {username}, shard = {self.shard}.")
 
         # Try to add the request to the log, using RAFT:
         #   RAFT returns the index of the request in the log, 
         #   and whether the current server is the leader 
         # auction_pb2.PlatformServiceRequest object is identical to raft.Command oject, converting one to another for type casting 
         raft_command = raft_pb2.Command(json=request.json)
-        (index, _, is_leader) = self.rf.new_entry(raft_command)
-
-        # If this request cannot be added because this server is not the leader, 
-        # then return error message to the client
-        if not is_leader:
-            response = auction_pb2.PlatformServiceResponse(is_leader=False)
-            return response
-        
-        # Now, we know that the server was the leader. 
-        # Wait until the request is applied to the state machine. 
-        #   Create an event to indicate whether this request has been applied or not
+        # A write of a client session (see StateMachine.apply()): if it was already applied, answer as then.
+        # Otherwise, its session goes to the log with it, with the time of this leader (to expire the sessions)
+        if request.client_id:
+            response = self.state_machine.cached_response(request.client_id, request.sequence)
+            if response is not None and self.rf.state == raft.Leader:
+                response.is_leader = True
+                response.applied_index = self.applied_index
+                return response
+            re["session"] = [request.client_id, request.sequence, request.acked_sequence, time.time()]
+            raft_command = raft_pb2.Command(json=json.dumps(re))
+        # (self.lock is held until the result is registered, so the request cannot be applied before that)
         with self.lock:
-            assert index not in self.results
-            self.results[index] = [ threading.Event(), None ]
+            (index, term, is_leader) = self.rf.new_entry(raft_command)
 
-        logging.info(f" Platform Server: waiting for event, index = {index}")
-        self.results[index][0].wait()         # wait for the event
-        response = self.results[index][1]     # get the response, should be a PlatformServiceResponse object now
+            # If this request cannot be added because this server is not the leader, 
+            # then return error message to the client
+            if not is_leader:
+                return self.not_leader_response()
+            
+            # Now, we know that the server was the leader. 
+            # Wait until the request is applied to the state machine: 
+            #   register a future, which gets the response when the entry at [index] is applied
+            future = self.results.register(index, term)
+
+        logging.info(f" Platform Server: waiting for result, index = {index}, shard = {self.shard}")
+        try:
+            response = future.result(timeout)   # a PlatformServiceResponse object
+        except TimeoutError:
+            self.results.cancel(index, future)
+            response = None
+        if response is None:
+            # the request was replaced by another entry (or it is not known whether it was applied):
+            # the client tries again (its session makes sure that the request is not applied twice)
+            logging.info(f" Platform Server: no result, index = {index}, shard = {self.shard}")
+            return self.not_leader_response()
         response.is_leader = True
-        logging.info(f" Platform Server: got event, index = {index}")
+        response.applied_index = index
+        logging.info(f" Platform Server: got event, index = {index}, shard = {self.shard}")
+        return response
+    
+
+    """ The response of a server that cannot serve a request because it is not the leader of the shard,
+        with the leader it knows of (a hint for the client, see utils.rpc_to_shard())
+    """
+    def not_leader_response(self):
+        response = auction_pb2.PlatformServiceResponse(is_leader=False)
+        (leader_id, leader) = self.rf.get_leader()
+        if leader is not None and leader_id != self.rf.my_id:
+            response.leader_id = leader_id
+            response.leader_address = leader.ip_addr + ":" + leader.client_port
+        return response
+    
+
+    """ Serve a read-only request on a follower (or learner), from its own state machine:
+        the response reflects the log at least up to [min_index] (the latest index the client has seen),
+        so a client never reads older data than what it has already seen. 
+        If this server has not applied min_index within config.follower_read_timeout, the read is refused
+        (and the client tries another server). 
+    """
+    def follower_read(self, request, min_index):
+        with self.lock:
+            if not self.applied_cond.wait_for(lambda: self.applied_index >= min_index,
+                                              config.follower_read_timeout / 1000):
+                return self.not_leader_response()
+            response = self.state_machine.apply(request)
+            response.applied_index = self.applied_index
+        response.is_leader = False
+        response.follower_read = True
         return response
     
 
+    """ Stream the auctions of the shard to a client watching them, instead of the client fetching them every second:
+        first the auctions changed after log index [version] (all of them if it is 0), then the auctions changed
+        by the entries as they are applied. Every response has the log index it is up to (the version),
+        so that a client that reconnects (to any replica) resumes from there.
+        Without changes, an empty response is sent every config.watch_keepalive_interval, so the client knows
+        that the stream is alive. Without config.follower_reads, only the leader serves watches. 
+        Input:
+            re       : a BUYER_FETCH_AUCTIONS or SELLER_FETCH_AUCTIONS request, as a dictionary
+            version  : the log index up to which the client has the auctions
+            context  : the context of the RPC, to stop when the client goes away
+        Return:
+            a generator of pb2.WatchAuctionsResponse objects
+    """
+    def watch(self, re, version, context):
+        # a client that resumes waits for this server to catch up with what it has seen
+        with self.lock:
+            if not self.applied_cond.wait_for(lambda: self.applied_index >= version, config.follower_read_timeout / 1000):
+                return
+        first = True
+        while context.is_active():
+            if not config.follower_reads:
+                (leader_id, leader) = self.rf.get_leader()
+                if leader_id != self.rf.my_id:
+                    response = auction_pb2.WatchAuctionsResponse(refused=True)
+                    if leader is not None:
+                        response.leader_address = leader.ip_addr + ":" + leader.client_port
+                    yield response
+                    return
+            with self.lock:
+                if not first:
+                    self.applied_cond.wait_for(lambda: self.state_machine.last_change > version or self.stopped,
+                                               config.watch_keepalive_interval / 1000)
+                if self.stopped:
+                    return
+                js = ""
+                if first or self.state_machine.last_change > version:
+                    js = self.state_machine.watched_auctions(re, version)
+                version = self.applied_index
+            first = False
+            yield auction_pb2.WatchAuctionsResponse(json=js, version=version)
+
 
-    """ A loop that continuously applies requests that have been commited by RAFT
+    """ A loop that continuously applies requests that have been commited by RAFT.
+        RAFT gives the committed entries in batches (lists of consecutive entries):
+        the requests are decoded first, then the whole batch is applied under a single acquisition of self.lock. 
     """
     def apply_request_loop(self):
+        last_snapshot_index = 0
         while True:
-            log_entry = self.apply_queue.get()
-            index = log_entry.index
-            command = log_entry.command      # the Command object in auction.proto
-            request  = json.loads(command.json) # convert it back to json
-            op = request["op"]
-            if "username" in request:
-                username = request["username"]
-            else:
-                username = request["seller_username"]
+            batch = self.apply_queue.get()
+
+            # RAFT gives a snapshot (at restart, or when this server is far behind the leader):
+            # replace the state machine by it
+            if isinstance(batch, raft_pb2.Snapshot):
+                logging.info(f"     Restore snapshot, last_included_index = {batch.last_included_index}, shard = {self.shard}")
+                with self.lock:
+                    self.state_machine.restore_snapshot(batch.data, batch.last_included_index)
+                    self.applied_index = batch.last_included_index
+                    self.applied_cond.notify_all()
+                    self.results.fail_through(batch.last_included_index)
+                last_snapshot_index = batch.last_included_index
+                continue
 
+            # convert the commands back to json, outside the lock.
+            # (the no-op entry added by a new RAFT leader has an empty command: nothing to apply)
+            requests = []
+            for log_entry in batch:
+                command = log_entry.command      # the Command object in auction.proto
+                request = json.loads(command.json) if command.json else None
+                requests.append((log_entry.index, log_entry.term, request))
+            index = batch[-1].index
 
             """ The following has been re-written compared to assignment 3"""
             with self.lock:
-                logging.info(f"     Apply request index = {index},  op = {op}, username = {username}")
-                # apply the request, and (if needed) record the result and notify the waiting thread. 
-                if index not in self.results:
-                    # This case means that the request is not initiated by the current server; 
-                    # it is replicated from other servers' logs instead.
-                    # So, we don't need to record the result and respond to client. 
-                    # We just need to apply the request to the state machine
-                    logging.info("       replicated")
-                    self.state_machine.apply(request) # given a dict
-                else:
-                    # Otherwise, we need to record the results and notify the current server
-                    logging.info("       need to respond to client")
-                    self.results[index][1] = self.state_machine.apply(request)
-                    # set the event to notify the waiting thread
-                    self.results[index][0].set()
-        
+                logging.info(f"     Apply requests index = [{batch[0].index}, {index}], shard = {self.shard}")
+                for (i, term, request) in requests:
+                    # apply the request, and give the response to the request waiting at index i, if any 
+                    # (the request was added to the log by this server, and fails if another entry replaced it)
+                    response = self.state_machine.apply(request, i) if request is not None else None
+                    self.results.deliver(i, term, response)
+                self.applied_index = index
+                self.applied_cond.notify_all()
+            self.rf.applied(index)      # (for the apply latency, see RaftServiceServicer.applied())
 
-    """ Customized start of the RPC server """
+            # Compact the RAFT log once enough entries have been applied since the last snapshot
+            if index - last_snapshot_index >= config.raft_snapshot_threshold:
+                self.rf.snapshot(index, self.state_machine.take_snapshot())
+                last_snapshot_index = index
+
+
+    """ Start the RAFT instance and the request applying loop of the shard """
     def my_start(self):
-        # First, start the RAFT instance
         self.rf.my_start()
-
-        # Then, start the request applying loop
         threading.Thread(target=self.apply_request_loop, daemon=True).start()
+    
+
+    """ Stop the RAFT instance of the shard, fail the requests that wait for their results, and end the watches """
+    def stop(self):
+        self.rf.stop()
+        self.results.fail_all()
+        with self.lock:
+            self.stopped = True
+            self.applied_cond.notify_all()
+
+
+
+""" The server class:
+    A server instance contains config.n_shards shards (RaftShard objects), each with a state_machine and a RAFT instance, 
+    and provide RPC service to the client. 
+    With several shards, the server also moves the leadership of the shards it leads to their preferred replicas
+    (sharding.preferred_leader()), so that the leaders, and the writes, are spread over the servers. 
+    The progress of the started auctions is not in the RAFT logs: the server keeps the progress the sellers send
+    in the state machines of the shards, and forwards it to the other servers (see rpc_auction_progress()). 
+"""
+class PlatformServiceServicer(auction_pb2_grpc.PlatformServiceServicer):
+
+    """ Customized initialization """
+    def my_init(self, replicas, my_id, need_persistent):
+        self.replicas = replicas
+        self.my_id = my_id
+        self.shards = [RaftShard(replicas, my_id, need_persistent, g) for g in range(config.n_shards)]
+
+        # the progress received from sellers, to forward to the other servers: (shard, auction id) -> pb2.AuctionProgress
+        self.progress_outbox = dict()
+        self.progress_cond = threading.Condition()
+
+        # the number of clients watching the auctions (each one holds a thread of the RPC server)
+        self.n_watches = 0
+        self.watch_lock = threading.Lock()
+    
+
+    """ This function has been re-written compared with assignment 3"""
+    """ The RPC service provided to the client: served by shard request.shard
+        Input:
+            request  : a pb2.PlatformServiceRequest object
+        Return:
+            response : a pb2.PlatformServiceResponse ojbect
+    """
+    def rpc_platform_serve(self, request, context):
+        
+        # convert json to commands
+        re  = json.loads(request.json)
+
+        # a request sent to a shard it is not for (e.g., by a client with another config.n_shards) is refused:
+        # applying it there would put its data in the wrong shard
+        if request.shard not in sharding.route(re):
+            js = {"success": False, "message": f"Request {re['op']} is not for shard {request.shard}."}
+            return auction_pb2.PlatformServiceResponse(is_leader=True, json=json.dumps(js))
+        # a request waits for its result until the deadline of the client, if any (at most config.platform_write_timeout)
+        timeout = config.platform_write_timeout / 1000
+        if context is not None and context.time_remaining() is not None:
+            timeout = min(timeout, context.time_remaining())
+        return self.shards[request.shard].serve(request, re, timeout)
+    
+
+    """ The progress channel: a seller (or another server) sends the progress of started auctions.
+        It is kept by the state machines of their shards (the latest of each auction, see StateMachine.update_progress()),
+        and, if it comes from a seller, forwarded to the other servers by forward_progress_loop(). 
+        Input:
+            request  : a pb2.AuctionProgressRequest object
+        Return:
+            response : a pb2.SuccessMessage object
+    """
+    def rpc_auction_progress(self, request, context):
+        auctions = []
+        for progress in request.progress:
+            if 0 <= progress.shard < len(self.shards):
+                auction = json.loads(progress.json)
+                self.shards[progress.shard].state_machine.update_progress(auction)
+                auctions.append((progress, auction))
+        if not request.forwarded:
+            with self.progress_cond:
+                for (progress, auction) in auctions:
+                    self.progress_outbox[(progress.shard, auction["auction_id"])] = progress
+                self.progress_cond.notify()
+        return auction_pb2.SuccessMessage(success=True)
+    
+
+    """ A client watches the auctions of shard request.shard (see RaftShard.watch()).
+        At most config.watch_max_streams clients watch at the same time; the others are refused,
+        and fetch the auctions instead (see utils.watch_shard()). 
+        Input:
+            request  : a pb2.WatchAuctionsRequest object
+        Return:
+            a generator of pb2.WatchAuctionsResponse objects
+    """
+    def rpc_watch_auctions(self, request, context):
+        re = json.loads(request.json)
+        if re["op"] not in [config.BUYER_FETCH_AUCTIONS, config.SELLER_FETCH_AUCTIONS] or not 0 <= request.shard < len(self.shards):
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, f"Cannot watch {re['op']} on shard {request.shard}.")
+        with self.watch_lock:
+            if self.n_watches >= config.watch_max_streams:
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Too many clients watch the auctions.")
+            self.n_watches += 1
+        try:
+            yield from self.shards[request.shard].watch(re, request.version, context)
+        finally:
+            with self.watch_lock:
+                self.n_watches -= 1
+    
+
+    """ A loop that forwards the progress received from sellers to the other servers, in parallel:
+        every config.auction_progress_forward_interval, the latest progress of each auction received meanwhile
+    """
+    def forward_progress_loop(self):
+        stubs = [auction_pb2_grpc.PlatformServiceStub(grpc.insecure_channel(r.ip_addr + ":" + r.client_port))
+                 for (i, r) in enumerate(self.replicas) if r is not None and i != self.my_id]
+        while True:
+            with self.progress_cond:
+                self.progress_cond.wait_for(lambda: len(self.progress_outbox) > 0)
+                request = auction_pb2.AuctionProgressRequest(progress=list(self.progress_outbox.values()), forwarded=True)
+                self.progress_outbox = dict()
+            calls = [stub.rpc_auction_progress.future(request, timeout=config.auction_progress_timeout / 1000) for stub in stubs]
+            for call in calls:
+                call.exception()    # (waits for the call; a server that misses the progress gets the next one)
+            time.sleep(config.auction_progress_forward_interval / 1000)
+    
+
+    """ A loop that logs the metrics of the RAFT instances of the shards, every config.raft_metrics_log_interval """
+    def log_metrics_loop(self):
+        while True:
+            time.sleep(config.raft_metrics_log_interval / 1000)
+            for shard in self.shards:
+                logging.info(f" Platform: RAFT metrics of shard {shard.shard}: {json.dumps(shard.rf.get_metrics())}")
+    
+
+    """ A loop that moves the leadership of every shard this server leads to the preferred replica of the shard,
+        once that replica is up to date (every config.shard_balance_interval)
+    """
+    def balance_leaders_loop(self):
+        while True:
+            time.sleep(config.shard_balance_interval / 1000)
+            for shard in self.shards:
+                target = sharding.preferred_leader(self.replicas, shard.shard)
+                if target != self.my_id and shard.rf.can_transfer_to(target):
+                    logging.info(f" Platform: move the leadership of shard {shard.shard} to [{target}]")
+                    shard.rf.transfer_leadership(target)
+        
+
+    """ Customized start of the RPC server """
+    def my_start(self):
+        # First, start the shards: their RAFT instances and their request applying loops
+        for shard in self.shards:
+            shard.my_start()
+        if len(self.shards) > 1 and config.shard_balance_leaders:
+            threading.Thread(target=self.balance_leaders_loop, daemon=True).start()
+        threading.Thread(target=self.forward_progress_loop, daemon=True).start()
+        if config.raft_metrics_log_interval > 0:
+            threading.Thread(target=self.log_metrics_loop, daemon=True).start()
         
         # Finally, start the RPC server for the clients
-        server = grpc.server(futures.ThreadPoolExecutor(max_workers=128))
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=128 + config.watch_max_streams))
         auction_pb2_grpc.add_PlatformServiceServicer_to_server( self, server )
         id = self.my_id
         my_ip_addr = self.replicas[id].ip_addr
@@ -153,19 +433,39 @@ class PlatformServiceServicer(auction_pb2_grpc.PlatformServiceServicer):
         server.add_insecure_port(my_ip_addr + ":" + my_client_port)
         server.start()
         print(f" ====== Server [{id}] starts at {my_ip_addr}:{my_client_port} =======")
-        server.wait_for_termination()
+        try:
+            server.wait_for_termination()
+        except KeyboardInterrupt:
+            # Stopped with Ctrl-C (or SIGTERM): hand over the leadership first, so writes go on without an election
+            for shard in self.shards:
+                (is_leader, success, new_leader_id) = shard.rf.transfer_leadership()
+                if is_leader:
+                    print(f" ====== Server [{id}]: leadership of shard {shard.shard} transferred to [{new_leader_id}]: {success} =======")
+                shard.stop()
+            server.stop(0)
 
 
 if __name__ == "__main__":
 
-    if len(sys.argv) != 2:
+    if len(sys.argv) not in [2, 5]:
         print("ERROR: Please use 'python3 server.py id' where id (starting from 0) is the id of the server replica")
+        print("       or 'python3 server.py id ip_addr client_port raft_port' to start a new server, which joins the cluster")
+        print("       with 'python3 admin.py add_server id ip_addr client_port raft_port'")
         sys.exit()
     
     id = int(sys.argv[1])
-    assert 0 <= id < config.n_replicas
+    replicas = list(config.replicas)
+    if len(sys.argv) == 5:
+        # A new server (or a server moved to another address): it starts as a learner, which waits to be added
+        # to the cluster, and then learns the members of the cluster from the log of the leader
+        replicas += [None] * (id + 1 - len(replicas))
+        replicas[id] = config.ServerInfo(id, sys.argv[2], sys.argv[3], sys.argv[4], learner=True)
+    assert 0 <= id < len(replicas)
+
+    # Stop gracefully on SIGTERM, as on Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
 
     servicer = PlatformServiceServicer()
-    servicer.my_init(config.replicas, id, need_persistent=config.need_persistent)
+    servicer.my_init(replicas, id, need_persistent=config.need_persistent)
     servicer.my_start()
 
@@ -5,12 +5,13 @@ import config
 from config import *
 import copy
 import json
+from collections import OrderedDict
 
 ## //TODO: auction["created"], auction["started"] auction["finished"]
 
 class StateMachine:
 
-    def __init__(self):
+    def __init__(self, shard=0, n_shards=1):
         #  States/data of the state machine
         #    - a list of all existing accounts/users (identified by their usernames) 
         #    - a dictionary mapping users to the set of messages they received.
@@ -20,8 +21,59 @@ class StateMachine:
         #    - a lock to ensure only one command can be excecued at a time . 
         self.accounts = {} # a dictionary that maps users to their RPC service addresses.
         self.auctions = [] # auction id starts from 1, each being a dictionary
+        # With several shards (see sharding.py), this state machine holds the auctions of shard [shard] only:
+        # auctions[k] is the auction with id k * n_shards + shard + 1
+        self.shard = shard
+        self.n_shards = n_shards
+        # The progress of the started auctions (see update_progress()): auction id -> the latest auction data
+        # sent by its seller. It is soft state, not in the RAFT log nor in the snapshots. 
+        self.progress = {}
+        # Client sessions (see apply()): client id -> {"time": the time (by the leader's clock) of its last write,
+        #   "acked": the client has the responses of all its writes before this sequence number,
+        #   "responses": sequence number (a string) -> the response (json) to the write}, the least recently used first
+        self.sessions = OrderedDict()
+        # Versions of the auctions, for the clients watching them (see changed() and watched_auctions()):
+        # auction id -> the log index of the entry that last changed it. Log indexes are the same on every replica,
+        # so a client can resume watching from the version it got from another replica. 
+        # index is the log index of the entry being applied, last_change the latest version of an auction
+        self.versions = {}
+        self.index = 0
+        self.last_change = 0
         self.lock = threading.Lock() #  a lock to ensure that only one command is excecued at a time, only used for debugging.  
     
+    def auction_position(self, auction_id):
+        """ The position of auction [auction_id] in self.auctions, None if it does not exist (in this shard)
+            - Input:
+                auction_id : int
+        """
+        (k, shard) = divmod(auction_id - 1, self.n_shards)
+        if auction_id < 1 or shard != self.shard or k >= len(self.auctions):
+            return None
+        return k
+
+    def latest_auction(self, pos):
+        """ The auction at position [pos] in self.auctions, as the seller last sent it through the progress channel
+            if it is started, not finished, and the progress is not older (see update_progress())
+        """
+        auction = self.auctions[pos]
+        progress = self.progress.get(int(auction["auction_id"]))
+        if progress is None or not auction["started"] or auction["finished"] or progress["round_id"] < auction["round_id"]:
+            return auction
+        return progress
+
+    def changed(self, pos):
+        """ The auction at position [pos] in self.auctions is changed by the entry being applied """
+        assert self.lock.locked()
+        self.versions[int(self.auctions[pos]["auction_id"])] = self.index
+        self.last_change = max(self.last_change, self.index)
+
+    def positions_since(self, version):
+        """ The positions in self.auctions of the auctions changed after log index [version] (all if it is 0), in order """
+        assert self.lock.locked()
+        if version == 0:
+            return range(len(self.auctions))
+        return sorted(self.auction_position(auction_id) for (auction_id, v) in self.versions.items() if v > version)
+
     def check_buyer_in_auction(self, username, auction_id):
         """ Check if buyer has ever been a participant of the auction
             Both the buyer and the auction id must exist
@@ -29,9 +81,9 @@ class StateMachine:
                 username   : string, the username to be queried, string
                 auction_id : string,    the auction index from 1 to ...
         """
-        auction_id = int(auction_id)
-        assert username in self.accounts and auction_id <= len(self.auctions)
-        if username not in self.auctions[auction_id-1]["buyers"]: 
+        pos = self.auction_position(int(auction_id))
+        assert username in self.accounts and pos is not None
+        if username not in self.auctions[pos]["buyers"]: 
             return False
         return True
 
@@ -80,12 +132,13 @@ class StateMachine:
         response.json = json.dumps(js)
         return response
     
-    def buyer_fetch_auctions(self, request):
+    def buyer_fetch_auctions(self, request, version=0):
         """ Retrieve all auctions. Detailed info provided for auctions that [request.username]
             have joined. Only meta info provided for auctions that [request.username] has not 
             joined
             - Input:
                 request  : json string converted dictionary
+                version  : only the auctions changed after this log index (see watched_auctions())
                 response : pb2.PlatformServiceResponse
         """
         assert self.lock.locked()
@@ -100,7 +153,8 @@ class StateMachine:
             return response
 
         msg = []
-        for auction in self.auctions: # a list of dictionaries, each holding an auction
+        for pos in self.positions_since(version): # a list of dictionaries, each holding an auction
+            auction = self.latest_auction(pos)
             if username in auction["buyers"]:
                 msg.append(auction)
             else:
@@ -111,10 +165,11 @@ class StateMachine:
         response.json = json.dumps(js)
         return response
     
-    def seller_fetch_auctions(self, request):
+    def seller_fetch_auctions(self, request, version=0):
         """ Seller retrieves all auctions that this seller runs
             - Input:
                 request  : json string converted dictionary, username
+                version  : only the auctions changed after this log index (see watched_auctions())
                 response : pb2.PlatformServiceResponse
         """
         assert self.lock.locked()
@@ -129,7 +184,8 @@ class StateMachine:
             return response
 
         msg = []
-        for auction in self.auctions: # a list of dictionaries, each holding an auction
+        for pos in self.positions_since(version): # a list of dictionaries, each holding an auction
+            auction = self.latest_auction(pos)
             if auction["seller_username"] == username:
                 msg.append(auction)
             else:
@@ -152,6 +208,7 @@ class StateMachine:
         assert self.lock.locked()
         username = request["username"]
         auction_id = int(request["auction_id"])
+        pos = self.auction_position(auction_id)
         response = pb2.PlatformServiceResponse()
         
 
@@ -159,11 +216,11 @@ class StateMachine:
             msg = f"User {username} does not exist."
             js = {"success": False,
                     "message":msg}
-        elif auction_id > len(self.auctions):
+        elif pos is None:
             msg = f"Auction {auction_id} does not exist."
             js = {"success": False,
                     "message":msg}
-        elif self.auctions[auction_id-1]["started"] or self.auctions[auction_id-1]["finished"]:
+        elif self.auctions[pos]["started"] or self.auctions[pos]["finished"]:
             msg = f"Auction {auction_id} has started or finished."
             js = {"success": False, "message":msg}
         elif self.check_buyer_in_auction(username, auction_id):
@@ -171,7 +228,8 @@ class StateMachine:
             js = {"success":True, "message":msg}
         else:
             # user not in auction buyer list. Add
-            self.auctions[auction_id-1]["buyers"][username] = True
+            self.auctions[pos]["buyers"][username] = True
+            self.changed(pos)
             msg = f"Added user {username} to auction {auction_id}."
             js = {"success":True, "message":msg}
 
@@ -187,15 +245,16 @@ class StateMachine:
         assert self.lock.locked()
         username = request["username"]
         auction_id = int(request["auction_id"])
+        pos = self.auction_position(auction_id)
         response = pb2.PlatformServiceResponse()
 
         if username not in self.accounts:
             msg = f"User {username} does not exist."
             js = {"success": False, "message":msg}
-        elif auction_id > len(self.auctions):
+        elif pos is None:
             msg = f"Auction {auction_id} does not exist."
             js = {"success": False, "message":msg}
-        elif self.auctions[auction_id-1]["started"] or self.auctions[auction_id-1]["finished"]:
+        elif self.auctions[pos]["started"] or self.auctions[pos]["finished"]:
             msg = f"Auction {auction_id} has started or finished."
             js = {"success": False, "message":msg}
         elif not self.check_buyer_in_auction(username, auction_id):
@@ -203,7 +262,8 @@ class StateMachine:
             js = {"success":False, "message":msg}
         else:
             # buyer in the auction, withdrawl
-            self.auctions[auction_id-1]["buyers"].pop(username)
+            self.auctions[pos]["buyers"].pop(username)
+            self.changed(pos)
             msg = f"User {username} quitted from auction {auction_id}."
             js = {"success":True, "message":msg}
 
@@ -244,7 +304,7 @@ class StateMachine:
             msg = f"Auction requested fully match with a previous auction. Auction already exists."
             js = {"success":False, "message":msg}
         else: # creating auction
-            auction_id = len(self.auctions)+1
+            auction_id = len(self.auctions) * self.n_shards + self.shard + 1
             auction_to_create["auction_id"] = str(auction_id) # starts from 1
             auction_to_create["created"] = True
             auction_to_create["started"] = False
@@ -255,6 +315,7 @@ class StateMachine:
             auction_to_create["transaction_price"] = -1
             auction_to_create["winner_username"] = ""
             self.auctions.append(auction_to_create)
+            self.changed(len(self.auctions) - 1)
             msg = f"Auction {auction_id} successfully created."
             js = {"success":True, "message":msg}
         
@@ -270,26 +331,28 @@ class StateMachine:
         assert self.lock.locked()
         username = request["username"]
         auction_id = int(request["auction_id"])
+        pos = self.auction_position(auction_id)
         response = pb2.PlatformServiceResponse()
 
         if username not in self.accounts:
             msg = f"User {username} does not exist."
             js = {"success": False, "message": msg}
-        elif auction_id > len(self.auctions):
+        elif pos is None:
             msg = f"Auction {auction_id} does not exist."
             js = {"success": False, "message": msg}
-        elif self.auctions[auction_id-1]["finished"]:
+        elif self.auctions[pos]["finished"]:
             msg = f"Auction {auction_id} has already finished."
             js = {"success": False, "message": msg}
-        elif self.auctions[auction_id-1]["started"]:
+        elif self.auctions[pos]["started"]:
             msg = f"Auction {auction_id} has already started."
             js = {"success": True, "message": msg}
-        elif len( self.auctions[auction_id-1]["buyers"] ) == 0:
+        elif len( self.auctions[pos]["buyers"] ) == 0:
             msg = f"Auction does not have any buyer."
             js = {"success": False, "message": msg}
         else: # created status, write request
-            self.auctions[auction_id-1]["started"] = True
-            js = {"success":True, "message":self.auctions[auction_id-1]}
+            self.auctions[pos]["started"] = True
+            self.changed(pos)
+            js = {"success":True, "message":self.auctions[pos]}
         response.json = json.dumps(js)
         return response
     
@@ -302,21 +365,24 @@ class StateMachine:
         assert self.lock.locked()
         username = request["username"]
         auction_id = int(request["auction_id"])
+        pos = self.auction_position(auction_id)
         response = pb2.PlatformServiceResponse()
 
         if username not in self.accounts:
             msg = f"User {username} does not exist."
             js = {"success": False, "message":msg}
-        elif auction_id > len(self.auctions):
+        elif pos is None:
             msg = f"Auction {auction_id} does not exist."
             js = {"success": False, "message":msg}
-        elif self.auctions[auction_id-1]["finished"]:
+        elif self.auctions[pos]["finished"]:
             msg = f"Auction {auction_id} has already finished."
             js = {"success": True, "message":msg}
         else:
             # start write request
-            self.auctions[auction_id-1] = request
-            self.auctions[auction_id-1]["finished"] = True
+            self.auctions[pos] = request
+            self.auctions[pos]["finished"] = True
+            self.progress.pop(auction_id, None)
+            self.changed(pos)
             msg = f"Auction {auction_id} successfully finished"
             js = {"success":True, "message":msg}
         response.json = json.dumps(js)
@@ -331,25 +397,71 @@ class StateMachine:
         assert self.lock.locked()
         username = request["seller_username"]
         auction_id = int(request["auction_id"])
+        pos = self.auction_position(auction_id)
         response = pb2.PlatformServiceResponse()
 
         if username not in self.accounts:
             msg = f"User {username} does not exist."
             js = {"success": False, "message":msg}
-        elif auction_id > len(self.auctions):
+        elif pos is None:
             msg = f"Auction {auction_id} does not exist."
             js = {"success": False, "message":msg}
-        elif self.auctions[auction_id-1]["finished"] or not self.auctions[auction_id-1]["started"]:
+        elif self.auctions[pos]["finished"] or not self.auctions[pos]["started"]:
             msg = f"Auction {auction_id} has already finished or not started yet."
             js = {"success":False, "message":msg}
         else: # change the status as seller demands
-            self.auctions[auction_id-1] = request
+            self.auctions[pos] = request
+            # (a progress of the same round may have the buyers before a withdrawal)
+            if auction_id in self.progress and self.progress[auction_id]["round_id"] <= request["round_id"]:
+                del self.progress[auction_id]
+            self.changed(pos)
             msg = f"Auction {auction_id} successfully updated."
             js = {"success":True, "message":msg}
         response.json = json.dumps(js)
         return response
         
 
+    def update_progress(self, auction):
+        """ Seller sends the progress of a started auction (current price, round) through the progress channel,
+            instead of the RAFT log. The latest progress of each auction is kept (last-writer-wins by round_id)
+            and fetching auctions returns it. It is not applied through the log, so every replica keeps its own copy,
+            and a replica that misses it (e.g. it restarts) gets it again from the next one.
+            - Input:
+                auction  : dictionary, the auction data of the seller (utils.AuctionData.to_dict())
+            - Return: 
+                whether the progress is kept
+        """
+        with self.lock:
+            auction_id = int(auction["auction_id"])
+            pos = self.auction_position(auction_id)
+            # (a replica may get the progress before it applies the start of the auction: it is kept,
+            #  and fetching auctions returns it once the auction is started)
+            if (pos is None or self.auctions[pos]["finished"]
+                            or self.auctions[pos]["seller_username"] != auction["seller_username"]):
+                return False
+            kept = self.progress.get(auction_id)
+            if kept is not None and kept["round_id"] > auction["round_id"]:
+                return False
+            self.progress[auction_id] = auction
+            return True
+        
+
+    def watched_auctions(self, request, version):
+        """ The auctions changed after log index [version] (all if it is 0), as fetch request [request] returns them
+            (for a client watching the auctions, see server.RaftShard.watch()).
+            The progress of a started auction is the latest one, but it is not a change by itself. 
+            - Input:
+                request  : dictionary, a BUYER_FETCH_AUCTIONS or SELLER_FETCH_AUCTIONS request
+                version  : int, a log index
+            - Return:
+                the response of the request, a json string
+        """
+        fetch = { BUYER_FETCH_AUCTIONS  : self.buyer_fetch_auctions,
+                  SELLER_FETCH_AUCTIONS : self.seller_fetch_auctions }
+        with self.lock:
+            return fetch[request["op"]](request, version).json
+
+
     def auction_exists(self, auction):
         """ Check if an auction is identical to one of the existing auctions
             - Input:
@@ -361,13 +473,91 @@ class StateMachine:
         return False
 
 
+    def take_snapshot(self):
+        """ Serialize the state machine (used by RAFT log compaction)
+            - Return: bytes
+        """
+        with self.lock:
+            js = {"accounts": self.accounts, "auctions": self.auctions, "sessions": self.sessions}
+            return json.dumps(js).encode()
+    
+    def restore_snapshot(self, data, index=0):
+        """ Replace the state machine by a snapshot created by take_snapshot()
+            (the versions of the auctions are not in the snapshot: they all become the last index it includes)
+            - Input:
+                data  : bytes
+                index : the last log index the snapshot includes
+        """
+        with self.lock:
+            js = json.loads(data.decode()) if data else {"accounts": {}, "auctions": []}
+            self.accounts = js["accounts"]
+            self.auctions = js["auctions"]
+            self.sessions = OrderedDict(js.get("sessions", {}))
+            self.index = index
+            self.versions = {int(auction["auction_id"]): index for auction in self.auctions}
+            self.last_change = index
+
+
+    def session_response(self, session):
+        """ The response to a write that was already applied, None if it was not (see apply())
+            Evicts the sessions that have expired at the time of the write. 
+            - Input:
+                session  : [client id, sequence number, acked sequence number, time (seconds, by the leader's clock)]
+        """
+        assert self.lock.locked()
+        (client_id, sequence, acked, now) = session
+        while len(self.sessions) > 0:
+            (oldest_id, oldest) = next(iter(self.sessions.items()))
+            if now - oldest["time"] < config.client_session_ttl / 1000:
+                break
+            del self.sessions[oldest_id]
+        if client_id not in self.sessions:
+            return None
+        s = self.sessions[client_id]
+        if acked > s["acked"]:
+            s["acked"] = acked
+            s["responses"] = {seq: js for (seq, js) in s["responses"].items() if int(seq) >= acked}
+        if str(sequence) in s["responses"]:
+            return pb2.PlatformServiceResponse(json=s["responses"][str(sequence)])
+        if sequence < s["acked"]:
+            js = {"success": False, "message": f"Request {sequence} of client {client_id} was already answered."}
+            return pb2.PlatformServiceResponse(json=json.dumps(js))
+        return None
+
+    def record_response(self, session, response):
+        """ Keep [response] (pb2.PlatformServiceResponse) to the write of [session] (see session_response()) """
+        assert self.lock.locked()
+        (client_id, sequence, acked, now) = session
+        if client_id not in self.sessions:
+            self.sessions[client_id] = {"time": now, "acked": acked, "responses": {}}
+        s = self.sessions[client_id]
+        s["time"] = max(s["time"], now)
+        self.sessions.move_to_end(client_id)
+        s["responses"][str(sequence)] = response.json
+        if len(s["responses"]) > config.client_session_max_responses:
+            del s["responses"][min(s["responses"], key=int)]
+        while len(self.sessions) > config.client_session_max:
+            self.sessions.popitem(last=False)
+
+    def cached_response(self, client_id, sequence):
+        """ The response to write [sequence] of client [client_id] if it was already applied, None otherwise """
+        with self.lock:
+            s = self.sessions.get(client_id)
+            if s is None or str(sequence) not in s["responses"]:
+                return None
+            return pb2.PlatformServiceResponse(json=s["responses"][str(sequence)])
+
+
     """ apply a command to the state machine, return the response
         - Input:
-               request   : a json string converted to dictionary
+               request   : a json string converted to dictionary. 
+                           A write of a client session has request["session"] (see session_response()):
+                           if it was already applied, the response it got then is returned, and nothing changes. 
+               index     : the log index of the command (None for a read), the version of the auctions it changes
         - Return:
                response  : pb2.PlatformServiceResponse
     """
-    def apply(self, request):
+    def apply(self, request, index=None):
         dispatch = {
             LOGIN                 : self.login,
             GET_USER_ADDRESS      : self.get_user_address,
@@ -382,7 +572,10 @@ class StateMachine:
         }
         
         op = request["op"]
+        session = request.pop("session", None)
         with self.lock:
+            if index is not None:
+                self.index = index
             if op not in dispatch:
                 response = pb2.PlatformServiceResponse()
                 msg= f"Operation {request[op]} is not supported by the server."
@@ -391,8 +584,15 @@ class StateMachine:
                 response.json = json.dumps(js)
                 return response
             else:
+                if session is not None:
+                    response = self.session_response(session)
+                    if response is not None:
+                        return response
                 del request["op"]
-                return dispatch[op](request)
+                response = dispatch[op](request)
+                if session is not None:
+                    self.record_response(session, response)
+                return response
     
 
 
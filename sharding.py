@@ -0,0 +1,73 @@
+""" Multi-RAFT sharding of the platform: the auctions are partitioned into config.n_shards shards,
+    each replicated by its own RAFT group. Every server hosts one RAFT instance and one state machine per shard
+    (see server.py), so the shards have independent logs and leaders, and their writes go on in parallel.
+
+      - An auction lives in one shard: the shard of auction a is (a - 1) % n_shards
+        (the state machine of shard g numbers its auctions g + 1, g + 1 + n_shards, g + 1 + 2 * n_shards, ...).
+      - A new auction is created in the shard of its seller (a hash of seller_username).
+      - Accounts are replicated to every shard (a login is applied by all of them),
+        since every auction operation checks the account of its user.
+        Reading an account goes to the shard of the username.
+      - Fetching auctions is a scatter-gather: every shard returns its auctions, and the client merges them.
+    The client sends one request per shard involved (PlatformServiceRequest.shard, see utils.py),
+    and a server serves it with the RAFT group and the state machine of that shard.
+    With n_shards = 1, everything is in shard 0, as without sharding.
+"""
+import copy
+import zlib
+import config
+
+
+""" The shard of auction [auction_id] (int or string) """
+def shard_of_auction(auction_id):
+    return (int(auction_id) - 1) % config.n_shards
+
+
+""" The shard of user [username] (a hash that is the same in every process) """
+def shard_of_username(username):
+    return zlib.crc32(username.encode()) % config.n_shards
+
+
+""" The list of the shards to send platform request [request] (a dictionary) to """
+def route(request):
+    op = request["op"]
+    if op == config.LOGIN or op in config.SCATTER_GATHER_OP:
+        return list(range(config.n_shards))
+    if op == config.SELLER_CREATE_AUCTION:
+        return [shard_of_username(request["seller_username"])]
+    if "auction_id" in request:
+        return [shard_of_auction(request["auction_id"])]
+    return [shard_of_username(request["username"])]
+
+
+""" Merge the responses (dictionaries) of the shards to platform request [request] into one:
+    the auctions fetched from all the shards (in the order of their ids), or the first failure
+"""
+def merge_responses(request, responses):
+    for js in responses:
+        if not js["success"]:
+            return js
+    if request["op"] in config.SCATTER_GATHER_OP:
+        auctions = [auction for js in responses for auction in js["message"]]
+        auctions.sort(key=lambda auction: int(auction["auction_id"]))
+        return {"success": True, "message": auctions}
+    return responses[0]
+
+
+""" The addresses of the RAFT group of shard [shard]: [replicas] (None for an id without a replica),
+    with raft_port + shard * config.shard_port_offset
+"""
+def shard_replicas(replicas, shard):
+    result = []
+    for replica in replicas:
+        replica = copy.copy(replica)
+        if replica is not None:
+            replica.raft_port = str(int(replica.raft_port) + shard * config.shard_port_offset)
+        result.append(replica)
+    return tuple(result)
+
+
+""" The replica that should lead shard [shard], so that the leaders of the shards are spread over the voters """
+def preferred_leader(replicas, shard):
+    voters = [i for i in range(len(replicas)) if replicas[i] is not None and not replicas[i].learner]
+    return voters[shard % len(voters)]
@@ -172,22 +172,237 @@ def string_to_number_and_check_range(s, lb, ub):
 
 import grpc
 import json
+import random
+import threading
+import queue
+import time
+import uuid
+import auction_pb2_grpc as pb2_grpc
+import config
+import sharding
 
-def rpc_to_server_stubs(request, stubs):
+# The largest log index reflected by a response received so far, for each shard (RAFT group).
+# Reads served by followers must be at least this fresh, so the client never goes back in time. 
+last_seen_index = dict()
+
+# The session of this client (see StateMachine.apply()): every write gets a new sequence number,
+# and is sent with the same one however many times it is sent, so the platform applies it only once.
+client_id = uuid.uuid4().hex
+session_lock = threading.Lock()
+next_sequence = 1
+pending_sequences = set()     # the sequence numbers of the writes whose responses have not been received yet
+
+def new_sequence():
+    """ A new sequence number, for a write (call finish_sequence() once its response is received, or given up) """
+    global next_sequence
+    with session_lock:
+        sequence = next_sequence
+        next_sequence += 1
+        pending_sequences.add(sequence)
+        return sequence
+
+def finish_sequence(sequence):
+    """ The write with [sequence] will not be sent any more """
+    with session_lock:
+        pending_sequences.discard(sequence)
+
+def acked_sequence():
+    """ The sequence number before which the client will not send any write again """
+    with session_lock:
+        return min(pending_sequences, default=next_sequence)
+
+
+def rpc_to_server_stubs(request, stubs, sequence=None):
     """ Make a RPC request to all the platform server replicas.
-        Return (True, response) if one of them responds (is leader).
-        Otherwise, return (False, None)
+        The request is sent to each shard it is for (sharding.route()), 
+        and the responses of the shards are merged into one (sharding.merge_responses()).
+        A write is sent with the sequence number [sequence] of the client session (a new one if None:
+        a caller that sends the same write again, until it succeeds, gives the same sequence number every time). 
+        Return (True, response) if every shard responds. Otherwise, return (False, None)
+    """
+    new = sequence is None and request["op"] not in config.PLATFORM_READ_ONLY_OP
+    if new:
+        sequence = new_sequence()
+    try:
+        responses = []
+        for shard in sharding.route(request):
+            response = rpc_to_shard(request, shard, stubs, sequence or 0)
+            if response is None:
+                return False, None
+            responses.append(response)
+        return (True, sharding.merge_responses(request, responses))
+    finally:
+        if new:
+            finish_sequence(sequence)
+
+
+def send_auction_progress(auctions, stubs):
+    """ Send the progress of started auctions (dictionaries, AuctionData.to_dict()) through the progress channel
+        of the platform (soft state, not in the RAFT log): one replica keeps it and forwards it to the others.
+        Return whether a replica took it
+    """
+    request = pb2.AuctionProgressRequest(progress=[pb2.AuctionProgress(shard=sharding.shard_of_auction(a["auction_id"]),
+                                                                       json=json.dumps(a)) for a in auctions])
+    start = random.randrange(len(stubs))
+    for s in list(stubs[start:]) + list(stubs[:start]):
+        try:
+            s.rpc_auction_progress(request, timeout=config.auction_progress_timeout / 1000)
+            return True
+        except grpc.RpcError as e:
+            pass
+    return False
+
+
+# Routing (see rpc_to_shard()): the stub of the latest known leader of each shard,
+# and the stubs of the servers given by leader hints, by address (ip_addr:client_port)
+leader_stubs = dict()
+hint_stubs = dict()
+routing_lock = threading.Lock()
+
+def stub_of_address(address):
+    """ The stub of the platform server at [address], given by a leader hint """
+    with routing_lock:
+        if address not in hint_stubs:
+            hint_stubs[address] = pb2_grpc.PlatformServiceStub(grpc.insecure_channel(address))
+        return hint_stubs[address]
+
+
+def call_stub(stub, pb2_request, timeout):
+    """ Send [pb2_request] to [stub], with a deadline of [timeout] milliseconds.
+        Return the response, or None if the call fails
+    """
+    try:
+        return stub.rpc_platform_serve(pb2_request, timeout = timeout / 1000)
+    except grpc.RpcError as e:
+        return None
+
+
+def probe_stubs(stubs, pb2_request):
+    """ Send [pb2_request] to all the [stubs] at once (with a deadline of config.client_probe_timeout).
+        Return (stub, response) of the first one that serves it (the leader), or (None, None) if none does
+    """
+    finished = queue.Queue()
+    calls = [(s, s.rpc_platform_serve.future(pb2_request, timeout = config.client_probe_timeout / 1000)) for s in stubs]
+    for (s, call) in calls:
+        call.add_done_callback(lambda f, s=s: finished.put((s, f)))
+    for k in range(len(calls)):
+        (s, f) = finished.get()
+        if f.exception() is None and (f.result().is_leader or f.result().follower_read):
+            return (s, f.result())
+    return (None, None)
+
+
+def rpc_to_shard(request, shard, stubs, sequence=0):
+    """ Make a RPC request to shard [shard] of the platform server replicas
+        (a write with sequence number [sequence] of the client session, see rpc_to_server_stubs()).
+        The request goes to the leader of the shard that the client knows of (from its last response);
+        a server that is not the leader answers with the leader it knows of (a hint), which the client follows
+        (at most config.client_max_hops times). Otherwise (a server does not answer, or gives no hint),
+        the request is sent to all the replicas at once, and the leader that answers is kept for the next requests. 
+        Reads that followers may serve start from a random replica instead, to spread the load,
+        with the short deadline config.client_probe_timeout (a follower answers within config.follower_read_timeout),
+        so that a replica that is down only delays them that long. 
+        Return the response (a dictionary) if a server serves the request. Otherwise, return None
+    """
+    pb2_request = pb2.PlatformServiceRequest(json = json.dumps(request), min_index = last_seen_index.get(shard, 0),
+                                             shard = shard)
+    if sequence > 0:
+        pb2_request.client_id = client_id
+        pb2_request.sequence = sequence
+        pb2_request.acked_sequence = acked_sequence()
+    
+    def served(pb2_response):
+        last_seen_index[shard] = max(last_seen_index.get(shard, 0), pb2_response.applied_index)
+        return json.loads(pb2_response.json)
+
+    if config.follower_reads and request["op"] in config.FOLLOWER_READ_OP:
+        start = random.randrange(len(stubs))
+        for s in list(stubs[start:]) + list(stubs[:start]):
+            pb2_response = call_stub(s, pb2_request, config.client_probe_timeout)
+            if pb2_response is not None and (pb2_response.is_leader or pb2_response.follower_read):
+                return served(pb2_response)
+        return None
+    
+    # the leader known of, then the leaders given by the hints
+    stub = leader_stubs.get(shard)
+    for hop in range(config.client_max_hops):
+        if stub is None:
+            break
+        pb2_response = call_stub(stub, pb2_request, config.client_rpc_timeout)
+        if pb2_response is None:
+            break
+        if pb2_response.is_leader:
+            leader_stubs[shard] = stub
+            return served(pb2_response)
+        stub = stub_of_address(pb2_response.leader_address) if pb2_response.leader_address else None
+    
+    # otherwise, ask all the replicas
+    (stub, pb2_response) = probe_stubs(stubs, pb2_request)
+    if pb2_response is None:
+        leader_stubs.pop(shard, None)
+        return None
+    leader_stubs[shard] = stub
+    return served(pb2_response)
+
+
+def watch_auctions(request, stubs, callback):
+    """ Watch the auctions, as fetch request [request] (BUYER_FETCH_AUCTIONS or SELLER_FETCH_AUCTIONS) returns them,
+        instead of fetching them again and again: one stream per shard, each in its own thread (see watch_shard()).
+        callback(auctions) is called from these threads with the auctions (dictionaries) as they change
+        (all the auctions of a shard first)
+    """
+    for shard in sharding.route(request):
+        threading.Thread(target=watch_shard, args=(request, shard, stubs, callback), daemon=True).start()
+
+
+def watch_shard(request, shard, stubs, callback):
+    """ Watch the auctions of shard [shard] (see server.RaftShard.watch()), forever.
+        The stream goes to a random replica with config.follower_reads, to the leader otherwise
+        (following the hint of a replica that refuses it). If the stream breaks, or nothing comes for config.watch_timeout,
+        the client fetches the auctions, and after config.watch_retry_interval, watches them again on another replica,
+        from the version (log index) it has. 
     """
-    pb2_request = pb2.PlatformServiceRequest(json = json.dumps(request))
-    for s in stubs:
+    version = 0
+    stub = None
+    hops = 0
+    while True:
+        if stub is None:
+            stub = leader_stubs.get(shard) if not config.follower_reads else None
+            stub = stub or random.choice(stubs)
+        call = stub.rpc_watch_auctions(pb2.WatchAuctionsRequest(json = json.dumps(request), shard = shard, version = version))
+        hint = ""
+        watchdog = threading.Timer(config.watch_timeout / 1000, call.cancel)
         try:
-            pb2_response = s.rpc_platform_serve(pb2_request)
-            if pb2_response.is_leader == True:
-                return (True, json.loads(pb2_response.json))
+            watchdog.start()
+            for pb2_response in call:
+                watchdog.cancel()
+                if pb2_response.refused:
+                    hint = pb2_response.leader_address
+                    break
+                if pb2_response.json:
+                    js = json.loads(pb2_response.json)
+                    if js["success"]:
+                        callback(js["message"])
+                version = max(version, pb2_response.version)
+                last_seen_index[shard] = max(last_seen_index.get(shard, 0), version)
+                hops = 0
+                watchdog = threading.Timer(config.watch_timeout / 1000, call.cancel)
+                watchdog.start()
         except grpc.RpcError as e:
-            # print(e)
-            pass 
-    return False, None
+            pass
+        finally:
+            watchdog.cancel()
+        if hint != "" and hops < config.client_max_hops:
+            stub = stub_of_address(hint)
+            hops += 1
+            continue
+        # no stream: fetch the auctions meanwhile
+        hops = 0
+        stub = None
+        response = rpc_to_shard(request, shard, stubs)
+        if response is not None and response["success"]:
+            callback(response["message"])
+        time.sleep(config.watch_retry_interval / 1000)
 
 
 from PyQt6.QtWidgets import QListWidget, QListWidgetItem